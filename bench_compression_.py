@@ -0,0 +1,121 @@
+from bench_parsers_ import CTIS_SCALES, CTGOV_SCALES
+from compression_ import compress, decompress, load_zstd, train_dictionary
+from parsers_ import extract_cro_data
+from synthetic_ import (
+    ctgov_study,
+    ctis_search_record,
+    ctis_trial,
+    large_ctgov_study,
+    large_ctis_trial,
+)
+from typing import Dict, Any, List, Callable, Tuple
+import argparse
+import gzip
+import json
+import statistics
+import time
+
+##############################################################################
+# bytes and decode time of registry payloads per codec: gzip is what the
+# registries send on the wire, zlib what the mirror stored before, and the
+# dictionary codecs what it stores now. Dictionaries are trained on one set
+# of synthetic records and measured on another
+
+PAYLOADS = {
+    "ctis_search_record": lambda i: ctis_search_record(i),
+    "ctis_retrieve": lambda i: ctis_trial(i),
+    "ctis_retrieve/typical": lambda i: large_ctis_trial(i, **CTIS_SCALES["typical"]),
+    "ctis_extracted": lambda i: extract_cro_data(ctis_trial(i)),
+    "ctgov_study": lambda i: ctgov_study(i),
+    "ctgov_study/results": lambda i: large_ctgov_study(i, **CTGOV_SCALES["typical"]),
+}
+
+
+def codecs(training: List[bytes]) -> List[Tuple[str, Callable, Callable]]:
+    cases = [
+        ("identity", lambda b: b, lambda b: b),
+        ("gzip (transport)", lambda b: gzip.compress(b, 6), gzip.decompress),
+        ("zlib", compress, decompress),
+    ]
+    for codec in ["zlib", "zstd"] if load_zstd() else ["zlib"]:
+        dictionary = train_dictionary(training, codec)
+        if codec == "zstd":
+            zstandard = load_zstd()
+            plain = zstandard.ZstdCompressor(level=6)
+            cases.append(
+                ("zstd", plain.compress, zstandard.ZstdDecompressor().decompress)
+            )
+        cases.append(
+            (
+                f"{codec}+dictionary ({len(dictionary.data) // 1024} KB)",
+                lambda b, d=dictionary: compress(b, d),
+                decompress,
+            )
+        )
+    return cases
+
+
+def median_seconds(func: Callable, values: List[bytes], repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for value in values:
+            func(value)
+        timings.append((time.perf_counter() - start) / len(values))
+    return statistics.median(timings)
+
+
+def run_benchmarks(
+    samples: int, repeats: int, only: str = None
+) -> List[Dict[str, Any]]:
+    results = []
+    for name, make in PAYLOADS.items():
+        if only and only not in name:
+            continue
+        training = [json.dumps(make(i)).encode("utf-8") for i in range(samples)]
+        payloads = [
+            json.dumps(make(i)).encode("utf-8")
+            for i in range(100000, 100000 + samples // 4)
+        ]
+        raw_bytes = statistics.mean(len(p) for p in payloads)
+        for codec, encode, decode in codecs(training):
+            blobs = [encode(p) for p in payloads]
+            results.append(
+                {
+                    "payload": name,
+                    "codec": codec,
+                    "bytes": statistics.mean(len(b) for b in blobs),
+                    "ratio": raw_bytes / statistics.mean(len(b) for b in blobs),
+                    "encode_us": median_seconds(encode, payloads, repeats) * 1e6,
+                    "decode_us": median_seconds(decode, blobs, repeats) * 1e6,
+                }
+            )
+    return results
+
+
+def format_results(results: List[Dict[str, Any]]) -> str:
+    table = "| Payload | Codec | Mean bytes | Ratio | Encode (µs) | Decode (µs) |\n"
+    table += "|---|---|---|---|---|---|\n"
+    for result in results:
+        table += (
+            f"| {result['payload']} | {result['codec']} | {result['bytes']:,.0f} "
+            f"| {result['ratio']:.1f}x | {result['encode_us']:.0f} | {result['decode_us']:.0f} |\n"
+        )
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compressed size and decode time of registry payloads per codec."
+    )
+    parser.add_argument(
+        "--samples", type=int, default=200, help="Training records per payload"
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument(
+        "--only", help="Run only payloads whose name contains this text"
+    )
+    parser.add_argument("--json", action="store_true", help="Print raw JSON results")
+    args = parser.parse_args()
+    results = run_benchmarks(args.samples, args.repeats, args.only)
+    print(json.dumps(results, indent=2) if args.json else format_results(results))
@@ -0,0 +1,314 @@
+from mocks_ import FakeRegistryServer, FakeBatchServer, TRIAL_ID_PATTERN
+from bench_search_ import percentile
+from synthetic_ import CONDITIONS, DRUGS
+from mcp import ClientSession
+from mcp.client.stdio import StdioServerParameters, stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Dict, Any, List, Optional
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+##############################################################################
+# load test: N concurrent MCP sessions drive the real server over stdio (one
+# server process per session) or streamable HTTP (one shared process) with a
+# scripted mix of searches and follow-up fetches, against the fake registries
+# and a fake streaming model. Event-loop lag is the round trip of MCP pings
+# sent while the server is busy; memory is the servers' resident set size
+
+SERVER = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "clinical_trials_mcp_.py"
+)
+PING_INTERVAL = 0.2
+
+
+def server_env(registries: FakeRegistryServer, model: FakeBatchServer, workdir: str):
+    env = dict(os.environ)
+    env.update(
+        {
+            "CTIS_API_URL": f"{registries.url}/ctis-public-api",
+            "CTGOV_API_URL": f"{registries.url}/api/v2",
+            "ANTHROPIC_BASE_URL": model.url,
+            "ANTHROPIC_API_KEY": "fake",
+            # keep local stores of the run out of the working tree
+            "CTIS_MIRROR_FILE": os.path.join(workdir, "ctis_mirror.db"),
+            "SEMANTIC_INDEX_DIR": os.path.join(workdir, "semantic_index"),
+            "ELIGIBILITY_INDEX_FILE": os.path.join(workdir, "eligibility.db"),
+            "WATCHLIST_FILE": os.path.join(workdir, "watchlist.db"),
+            "BULK_JOBS_FILE": os.path.join(workdir, "bulk_jobs.json"),
+        }
+    )
+    for name in ("USAGE_LOG_FILE", "TRACE_LOG_FILE", "OTEL_EXPORTER_OTLP_ENDPOINT"):
+        env.pop(name, None)
+    return env
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_http_server(env: Dict[str, str], port: int) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, SERVER, "--transport", "streamable-http", "--port", str(port)],
+        env=env,
+        cwd=os.path.dirname(SERVER),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("HTTP server did not start")
+
+
+def server_pids(http_pid: Optional[int]) -> List[int]:
+    """The HTTP server, or the stdio servers spawned by this process (Linux only)."""
+    if http_pid is not None:
+        return [http_pid]
+    pids = []
+    for name in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{name}/cmdline", "rb") as f:
+                command = f.read()
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == os.getpid() and os.path.basename(SERVER).encode() in command:
+            pids.append(int(name))
+    return pids
+
+
+def rss_mb(pids: List[int]) -> Optional[float]:
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except OSError:
+            return None
+    return total / 1024 if pids else None
+
+
+@asynccontextmanager
+async def open_session(transport: str, env: Dict[str, str], url: str):
+    async with AsyncExitStack() as stack:
+        if transport == "stdio":
+            params = StdioServerParameters(
+                command=sys.executable,
+                args=[SERVER],
+                env=env,
+                cwd=os.path.dirname(SERVER),
+            )
+            errlog = stack.enter_context(open(os.devnull, "w"))
+            read, write = await stack.enter_async_context(stdio_client(params, errlog))
+        else:
+            read, write, _ = await stack.enter_async_context(streamablehttp_client(url))
+        session = await stack.enter_async_context(ClientSession(read, write))
+        await session.initialize()
+        yield session
+
+
+async def call_tool(
+    session: ClientSession, name: str, arguments: Dict[str, Any], stats: Dict
+) -> str:
+    start = time.perf_counter()
+    try:
+        result = await session.call_tool(name, arguments)
+        text = "".join(getattr(c, "text", "") for c in result.content)
+        failed = result.isError or text.startswith("error:")
+    except Exception as e:
+        text, failed = "", True
+        stats["errors"].append(f"{name}: {e}")
+    stats["latency"].setdefault(name, []).append(time.perf_counter() - start)
+    stats["failed"] += failed
+    return text
+
+
+async def client_script(
+    session: ClientSession, client: int, end: float, args, stats: Dict
+) -> None:
+    """One user: a search, then fetch_trial on the top trials it mentions."""
+    rng = random.Random(client)
+    while time.monotonic() < end:
+        condition, drug = rng.choice(CONDITIONS), rng.choice(DRUGS)
+        result = await call_tool(
+            session,
+            "search_batch_trials",
+            {
+                "user_request": f"Trials of {drug} in {condition} (client {client})",
+                "search_terms": drug,
+                "condition": condition,
+                "no_of_trials": args.no_of_trials,
+            },
+            stats,
+        )
+        ranking = result.split("## Most Relevant", 1)[-1]
+        for trial_id in list(dict.fromkeys(TRIAL_ID_PATTERN.findall(ranking)))[
+            : args.fetches
+        ]:
+            if time.monotonic() >= end:
+                break
+            key = "trial_ct_id" if trial_id.startswith("NCT") else "eu_ct_id"
+            await call_tool(session, "fetch_trial", {key: trial_id}, stats)
+
+
+async def pinger(session: ClientSession, lags: List[float], stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await session.send_ping()
+        lags.append(time.perf_counter() - start)
+        try:
+            await asyncio.wait_for(stop.wait(), PING_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_level(
+    transport: str, clients: int, env: Dict, url: str, http_pid, args
+) -> Dict[str, Any]:
+    stats = {"latency": {}, "failed": 0, "errors": []}
+    lags: List[float] = []
+    async with AsyncExitStack() as stack:
+        # anyio cancel scopes must be left by the task that entered them, so
+        # sessions are opened one after another rather than gathered
+        sessions = [
+            await stack.enter_async_context(open_session(transport, env, url))
+            for _ in range(clients)
+        ]
+        pids = server_pids(http_pid)
+        rss_start = rss_mb(pids)
+        stop = asyncio.Event()
+        # the HTTP client sends one request at a time per session, so pings
+        # there go through an idle session of their own to the same process
+        probe = sessions[0]
+        if transport == "http":
+            probe = await stack.enter_async_context(open_session(transport, env, url))
+        ping = asyncio.create_task(pinger(probe, lags, stop))
+        started = time.monotonic()
+        end = started + args.duration
+        await asyncio.gather(
+            *[
+                client_script(session, i, end, args, stats)
+                for i, session in enumerate(sessions)
+            ]
+        )
+        elapsed = time.monotonic() - started
+        stop.set()
+        await ping
+        rss_end = rss_mb(pids)
+    calls = sum(len(v) for v in stats["latency"].values())
+    row = {
+        "transport": transport,
+        "clients": clients,
+        "calls": calls,
+        "failed": stats["failed"],
+        "throughput": calls / elapsed,
+        "latency": {
+            name: {p: percentile(values, p) for p in (50, 95, 99)}
+            for name, values in sorted(stats["latency"].items())
+        },
+        "loop_lag_ms": {p: percentile(lags, p) * 1000 for p in (50, 99)},
+        "server_rss_mb": [rss_start, rss_end],
+        "server_processes": len(pids),
+    }
+    if stats["errors"]:
+        row["first_error"] = stats["errors"][0]
+    return row
+
+
+async def run_load_test(args) -> List[Dict[str, Any]]:
+    report = []
+    with tempfile.TemporaryDirectory() as workdir, FakeRegistryServer(
+        n_trials=args.trials, latency=args.latency, jitter=args.latency * 0.3
+    ) as registries, FakeBatchServer(
+        first_token_seconds=args.first_token_seconds, line_seconds=args.line_seconds
+    ) as model:
+        env = server_env(registries, model, workdir)
+        for transport in args.transport:
+            http_server, url, http_pid = None, "", None
+            if transport == "http":
+                port = free_port()
+                http_server = start_http_server(env, port)
+                url, http_pid = f"http://127.0.0.1:{port}/mcp/", http_server.pid
+            try:
+                for clients in args.clients:
+                    row = await run_level(transport, clients, env, url, http_pid, args)
+                    report.append(row)
+                    print(format_row(row), file=sys.stderr)
+            finally:
+                if http_server:
+                    http_server.terminate()
+                    http_server.wait()
+    return report
+
+
+def format_row(row: Dict[str, Any]) -> str:
+    def latency(name):
+        values = row["latency"].get(name)
+        if not values:
+            return "-"
+        return f"{values[50]:.2f} / {values[95]:.2f} / {values[99]:.2f}"
+
+    rss_start, rss_end = row["server_rss_mb"]
+    rss = f"{rss_start:.0f} → {rss_end:.0f}" if rss_start is not None else "-"
+    return (
+        f"| {row['transport']} | {row['clients']} | {row['calls']} | {row['failed']} "
+        f"| {row['throughput']:.2f} | {latency('search_batch_trials')} | {latency('fetch_trial')} "
+        f"| {row['loop_lag_ms'][50]:.1f} / {row['loop_lag_ms'][99]:.1f} | {rss} |"
+    )
+
+
+def format_report(report: List[Dict[str, Any]]) -> str:
+    result = (
+        "| Transport | Clients | Calls | Failed | Calls/s | search p50/p95/p99 (s) "
+        "| fetch p50/p95/p99 (s) | Loop lag p50/p99 (ms) | Server RSS (MB) |\n"
+    )
+    result += "|---|---|---|---|---|---|---|---|---|\n"
+    for row in report:
+        result += format_row(row) + "\n"
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load-test the MCP server with concurrent clients over stdio and HTTP."
+    )
+    parser.add_argument(
+        "--transport", nargs="+", choices=["stdio", "http"], default=["stdio", "http"]
+    )
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument(
+        "--duration", type=float, default=30, help="Seconds per client level"
+    )
+    parser.add_argument("--no-of-trials", type=int, default=10)
+    parser.add_argument(
+        "--fetches", type=int, default=3, help="fetch_trial calls after each search"
+    )
+    parser.add_argument("--trials", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--first-token-seconds", type=float, default=0.6)
+    parser.add_argument("--line-seconds", type=float, default=0.02)
+    parser.add_argument("--json", action="store_true", help="Print the raw report")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    report = asyncio.run(run_load_test(args))
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
@@ -0,0 +1,182 @@
+from parsers_ import (
+    extract_cro_data,
+    format_detailed_trial_summary,
+    format_ctgov_trial_details,
+    render_ctgov_trial_details_page,
+)
+from synthetic_ import large_ctis_trial, large_ctgov_study
+from typing import Dict, Any, List, Callable
+import argparse
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+
+##############################################################################
+# parser / formatter micro-benchmarks on synthetic worst-case payloads
+
+THRESHOLDS_FILE = "fixtures/parser_bench_thresholds.json"
+# floors keep sub-millisecond cases from failing on timer and allocator noise
+MIN_THRESHOLD_SECONDS = 0.005
+MIN_THRESHOLD_MB = 1.0
+
+CTIS_SCALES = {
+    "typical": dict(products=2, sites=10, documents=10, events=5, criteria=20),
+    "huge": dict(products=20, sites=500, documents=2000, events=100, criteria=300),
+}
+CTGOV_SCALES = {
+    "typical": dict(arms=3, outcomes=10, adverse_events=50, criteria=30),
+    "huge": dict(arms=20, outcomes=300, adverse_events=3000, criteria=800),
+}
+
+
+def benchmark_cases() -> List[Dict[str, Any]]:
+    cases = []
+    for scale, knobs in CTIS_SCALES.items():
+        trial = large_ctis_trial(1, **knobs)
+        extracted = extract_cro_data(trial)
+        cases.append(
+            {
+                "name": f"extract_cro_data/{scale}",
+                "func": lambda trial=trial: extract_cro_data(trial),
+                "payload": trial,
+            }
+        )
+        cases.append(
+            {
+                "name": f"format_detailed_trial_summary/{scale}",
+                "func": lambda extracted=extracted: format_detailed_trial_summary(
+                    extracted
+                ),
+                "payload": trial,
+            }
+        )
+    for scale, knobs in CTGOV_SCALES.items():
+        study = large_ctgov_study(1, **knobs)
+        cases.append(
+            {
+                "name": f"format_ctgov_trial_details/{scale}",
+                "func": lambda study=study: format_ctgov_trial_details(study),
+                "payload": study,
+            }
+        )
+        cases.append(
+            {
+                "name": f"render_ctgov_trial_details_page/{scale}",
+                "func": lambda study=study: render_ctgov_trial_details_page(
+                    study, 32000
+                ),
+                "payload": study,
+            }
+        )
+    return cases
+
+
+def measure(func: Callable, repeats: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": statistics.median(timings), "peak_mb": peak / 2**20}
+
+
+def run_benchmarks(repeats: int, only: str = None) -> List[Dict[str, Any]]:
+    results = []
+    for case in benchmark_cases():
+        if only and only not in case["name"]:
+            continue
+        result = measure(case["func"], repeats)
+        result["name"] = case["name"]
+        result["payload_kb"] = len(json.dumps(case["payload"])) / 1024
+        results.append(result)
+    return results
+
+
+def check_thresholds(
+    results: List[Dict[str, Any]], thresholds: Dict[str, Dict[str, float]]
+) -> List[str]:
+    regressions = []
+    for result in results:
+        limits = thresholds.get(result["name"], {})
+        for metric in ("seconds", "peak_mb"):
+            if metric in limits and result[metric] > limits[metric]:
+                regressions.append(
+                    f"{result['name']}: {metric} {result[metric]:.4f} exceeds threshold {limits[metric]:.4f}"
+                )
+    return regressions
+
+
+def format_results(
+    results: List[Dict[str, Any]], thresholds: Dict[str, Dict[str, float]]
+) -> str:
+    table = "| Case | Payload (KB) | Median (ms) | Peak memory (MB) | Threshold (ms / MB) |\n"
+    table += "|---|---|---|---|---|\n"
+    for result in results:
+        limits = thresholds.get(result["name"])
+        limit_text = (
+            f"{limits['seconds'] * 1000:.1f} / {limits['peak_mb']:.1f}"
+            if limits
+            else "N/A"
+        )
+        table += (
+            f"| {result['name']} | {result['payload_kb']:.0f} | {result['seconds'] * 1000:.2f} "
+            f"| {result['peak_mb']:.2f} | {limit_text} |\n"
+        )
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time and peak memory of the registry parsers on synthetic payloads."
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--only", help="Run only cases whose name contains this text")
+    parser.add_argument("--thresholds", default=THRESHOLDS_FILE)
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Exit with status 1 when a case exceeds its threshold",
+    )
+    parser.add_argument(
+        "--write-thresholds",
+        type=float,
+        metavar="HEADROOM",
+        help="Write current measurements times HEADROOM as the new thresholds",
+    )
+    args = parser.parse_args()
+    try:
+        with open(args.thresholds, "r", encoding="utf-8") as f:
+            thresholds = json.load(f)
+    except FileNotFoundError:
+        thresholds = {}
+    results = run_benchmarks(args.repeats, args.only)
+    if args.write_thresholds:
+        for result in results:
+            thresholds[result["name"]] = {
+                "seconds": round(
+                    max(
+                        result["seconds"] * args.write_thresholds,
+                        MIN_THRESHOLD_SECONDS,
+                    ),
+                    4,
+                ),
+                "peak_mb": round(
+                    max(result["peak_mb"] * args.write_thresholds, MIN_THRESHOLD_MB),
+                    2,
+                ),
+            }
+        with open(args.thresholds, "w", encoding="utf-8") as f:
+            json.dump(thresholds, f, indent=2, sort_keys=True)
+            f.write("\n")
+    print(format_results(results, thresholds))
+    regressions = check_thresholds(results, thresholds)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if args.check and regressions:
+        sys.exit(1)
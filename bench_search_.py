@@ -0,0 +1,169 @@
+from mocks_ import FakeRegistryServer, fake_relevance_reply
+from shared_ import response_cache, verdict_cache
+from usage_ import record_usage, summarize_calls, history as usage_history
+from typing import Dict, Any, List
+import clinical_trials_mcp_
+import prefetch_
+import registries_
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+
+##############################################################################
+# end-to-end search benchmark against local stand-in registries and a fake model
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+class FakeModel:
+    def __init__(
+        self,
+        first_token_seconds: float = 0.6,
+        line_seconds: float = 0.08,
+        jitter: float = 0.2,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.first_token_seconds = first_token_seconds
+        self.line_seconds = line_seconds
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    def delay(self, seconds: float) -> float:
+        return max(self.rng.gauss(seconds, seconds * self.jitter), 0.0)
+
+    async def stream(
+        self, messages, model="claude-3-5-haiku-20241022", max_tokens=None, source=None
+    ):
+        self.calls += 1
+        await asyncio.sleep(self.delay(self.first_token_seconds))
+        if self.rng.random() < self.error_rate:
+            raise RuntimeError("overloaded_error (fake model)")
+        streamed_text = ""
+        try:
+            for line in fake_relevance_reply(messages).splitlines():
+                streamed_text += line + "\n"
+                yield line + "\n"
+                await asyncio.sleep(self.delay(self.line_seconds))
+        finally:
+            record_usage(
+                model, len(messages) // 4, len(streamed_text) // 4, source=source
+            )
+
+
+async def run_search(no_of_trials: int) -> tuple:
+    start = time.perf_counter()
+    result = await clinical_trials_mcp_.search_batch_trials(
+        user_request="Completed phase 3 trials of biologics in immune diseases",
+        search_terms="biologic",
+        no_of_trials=no_of_trials,
+    )
+    return time.perf_counter() - start, not result.startswith("error:")
+
+
+async def benchmark(
+    server: FakeRegistryServer, model: FakeModel, sizes: List[int], runs: int
+) -> List[Dict[str, Any]]:
+    report = []
+    for size in sizes:
+        latencies, failures, requests, llm_calls, calls = [], 0, {}, 0, []
+        for _ in range(runs):
+            server.reset_counts()
+            response_cache.clear()
+            verdict_cache.clear()
+            model.calls = 0
+            recorded = len(usage_history)
+            elapsed, ok = await run_search(size)
+            if len(usage_history) > recorded:
+                calls.extend(usage_history[-1]["calls"])
+            latencies.append(elapsed)
+            failures += not ok
+            llm_calls += model.calls
+            for endpoint, count in server.counts.items():
+                requests[endpoint] = requests.get(endpoint, 0) + count
+        usage = summarize_calls(calls)
+        report.append(
+            {
+                "no_of_trials": size,
+                "runs": runs,
+                "failed": failures,
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "requests": {k: v / runs for k, v in sorted(requests.items())},
+                "llm_calls": llm_calls / runs,
+                "input_tokens": usage["input_tokens"] / runs,
+                "output_tokens": usage["output_tokens"] / runs,
+                "cost": usage["cost"] / runs,
+            }
+        )
+    return report
+
+
+def format_report(report: List[Dict[str, Any]]) -> str:
+    result = "| no_of_trials | runs | failed | p50 (s) | p95 (s) | p99 (s) | requests/run | LLM calls/run | tokens in/out per run | est. cost/run |\n"
+    result += "|---|---|---|---|---|---|---|---|---|---|\n"
+    for row in report:
+        requests = ", ".join(f"{k} {v:g}" for k, v in row["requests"].items())
+        result += (
+            f"| {row['no_of_trials']} | {row['runs']} | {row['failed']} | {row['p50']:.2f} "
+            f"| {row['p95']:.2f} | {row['p99']:.2f} | {requests} | {row['llm_calls']:g} "
+            f"| {row['input_tokens']:,.0f} / {row['output_tokens']:,.0f} | ${row['cost']:.4f} |\n"
+        )
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark search_batch_trials against local fake registries and a fake model."
+    )
+    parser.add_argument(
+        "--trials", type=int, nargs="+", default=[10, 25, 50, 100, 250, 500]
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--jitter", type=float, default=0.03)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--first-token-seconds", type=float, default=0.6)
+    parser.add_argument("--line-seconds", type=float, default=0.08)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--prefetch",
+        action="store_true",
+        help="Keep background prefetching on; its requests then count towards requests/run",
+    )
+    parser.add_argument("--json", action="store_true", help="Print the raw report")
+    args = parser.parse_args()
+    model = FakeModel(
+        first_token_seconds=args.first_token_seconds,
+        line_seconds=args.line_seconds,
+        error_rate=args.llm_error_rate,
+        seed=args.seed,
+    )
+    clinical_trials_mcp_.model_stream = model.stream
+    # prefetches finish in the background during the next run and would be
+    # counted as that run's registry requests
+    if not args.prefetch:
+        prefetch_.PREFETCH_TRIALS = 0
+    with FakeRegistryServer(
+        n_trials=max(args.trials) * 2,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    ) as server:
+        registries_.CTIS_API_URL = f"{server.url}/ctis-public-api"
+        registries_.CTGOV_API_URL = f"{server.url}/api/v2"
+        report = asyncio.run(benchmark(server, model, args.trials, args.runs))
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
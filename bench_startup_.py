@@ -0,0 +1,90 @@
+from typing import Dict, Any, List
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+##############################################################################
+# cold start: time from spawning the stdio server to its initialize response
+
+INITIALIZE_REQUEST = {
+    "jsonrpc": "2.0",
+    "id": 1,
+    "method": "initialize",
+    "params": {
+        "protocolVersion": "2025-03-26",
+        "capabilities": {},
+        "clientInfo": {"name": "bench-startup", "version": "0"},
+    },
+}
+
+
+def time_to_initialize(server: str) -> float:
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, server],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        cwd=os.path.dirname(os.path.abspath(server)),
+    )
+    try:
+        process.stdin.write((json.dumps(INITIALIZE_REQUEST) + "\n").encode("utf-8"))
+        process.stdin.flush()
+        response = json.loads(process.stdout.readline())
+        elapsed = time.perf_counter() - start
+        if "result" not in response:
+            raise RuntimeError(f"initialize failed: {response}")
+        return elapsed
+    finally:
+        process.kill()
+        process.wait()
+
+
+def time_to_import(module: str) -> float:
+    output = subprocess.check_output(
+        [
+            sys.executable,
+            "-c",
+            f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)",
+        ],
+        stderr=subprocess.DEVNULL,
+    )
+    return float(output.decode().strip())
+
+
+def summarize(values: List[float]) -> Dict[str, Any]:
+    return {
+        "min": min(values),
+        "median": statistics.median(values),
+        "max": max(values),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure stdio server cold start (spawn to initialize response)."
+    )
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--server", default="clinical_trials_mcp_.py")
+    parser.add_argument("--json", action="store_true", help="Print the raw report")
+    args = parser.parse_args()
+    module = os.path.splitext(os.path.basename(args.server))[0]
+    report = {
+        "time_to_initialize": summarize(
+            [time_to_initialize(args.server) for _ in range(args.runs)]
+        ),
+        "import_time": summarize([time_to_import(module) for _ in range(args.runs)]),
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print("| Measure | min (ms) | median (ms) | max (ms) |")
+        print("|---|---|---|---|")
+        for name, values in report.items():
+            print(
+                f"| {name} | {values['min'] * 1000:.0f} | {values['median'] * 1000:.0f} | {values['max'] * 1000:.0f} |"
+            )
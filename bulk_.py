@@ -0,0 +1,137 @@
+from models_ import batch_create, batch_retrieve, batch_results
+from verdicts_ import (
+    SOURCE_NAMES,
+    RELEVANCE_THRESHOLD,
+    parse_verdicts,
+    merge_verdicts,
+    format_ranking_table,
+)
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timezone
+import asyncio
+import json
+import os
+
+BULK_JOBS_FILE = os.getenv("BULK_JOBS_FILE", "bulk_jobs.json")
+
+
+def load_jobs() -> Dict[str, Any]:
+    if not os.path.exists(BULK_JOBS_FILE):
+        return {}
+    try:
+        with open(BULK_JOBS_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def save_job(job: Dict[str, Any]) -> None:
+    jobs = load_jobs()
+    jobs[job["job_id"]] = job
+    tmp_path = f"{BULK_JOBS_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(jobs, f, indent=2)
+    os.replace(tmp_path, BULK_JOBS_FILE)
+
+
+async def submit_bulk_job(
+    user_request: str,
+    query: str,
+    batches: List[Dict[str, Any]],
+    max_tokens: int = 8000,
+) -> Dict[str, Any]:
+    batch = await batch_create(
+        [(entry["custom_id"], entry["prompt"]) for entry in batches],
+        max_tokens=max_tokens,
+    )
+    job = {
+        "job_id": batch.id,
+        "user_request": user_request,
+        "query": query,
+        "status": batch.processing_status,
+        "submitted_at": datetime.now(timezone.utc).isoformat(),
+        "batches": {
+            entry["custom_id"]: {
+                "source": entry["source"],
+                "trial_ids": entry["trial_ids"],
+                "aliases": entry.get("aliases", {}),
+            }
+            for entry in batches
+        },
+        "results": {},
+    }
+    save_job(job)
+    return job
+
+
+async def refresh_bulk_job(
+    job_id: str, wait_seconds: int = 0, poll_interval: int = 10
+) -> Optional[Dict[str, Any]]:
+    job = load_jobs().get(job_id)
+    if job is None or job["status"] == "ended":
+        return job
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait_seconds
+    while True:
+        batch = await batch_retrieve(job_id)
+        job["status"] = batch.processing_status
+        if batch.processing_status == "ended":
+            job["results"] = await batch_results(
+                job_id,
+                {
+                    custom_id: SOURCE_NAMES[batch["source"]]
+                    for custom_id, batch in job["batches"].items()
+                },
+            )
+            break
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        await asyncio.sleep(min(poll_interval, remaining))
+    save_job(job)
+    return job
+
+
+def format_bulk_job(job: Dict[str, Any], top_n: int = 25) -> str:
+    result = f"# Bulk Analysis Job {job['job_id']}\n\n"
+    result += f"**Request**: {job['user_request']}\n"
+    result += f"**Search Terms**: {job['query']}\n"
+    result += f"**Submitted**: {job['submitted_at']}\n"
+    result += f"**Status**: {job['status']}\n\n"
+    if job["status"] != "ended":
+        result += f"{len(job['batches'])} batches are still being processed. Check again later.\n"
+        return result
+    verdicts = []
+    failed_batches = 0
+    for custom_id, batch in job["batches"].items():
+        response = job["results"].get(custom_id)
+        if response is None:
+            failed_batches += 1
+            continue
+        verdicts.extend(
+            parse_verdicts(
+                response,
+                batch["trial_ids"],
+                SOURCE_NAMES[batch["source"]],
+                batch.get("aliases"),
+            )
+        )
+    ranked = merge_verdicts(verdicts)
+    relevant_count = sum(1 for v in ranked if v["relevant"])
+    trial_count = sum(len(b["trial_ids"]) for b in job["batches"].values())
+    result += f"Analyzed {trial_count} trials; {relevant_count} scored {RELEVANCE_THRESHOLD}/10 or higher for relevance.\n\n"
+    result += f"## Most Relevant Trials (top {min(top_n, relevant_count)})\n\n"
+    result += format_ranking_table(ranked, top_n)
+    if failed_batches:
+        result += f"\n*{failed_batches} analysis batches failed; their trials may be missing from the ranking.*\n"
+    return result
+
+
+def format_bulk_job_list(jobs: List[Dict[str, Any]]) -> str:
+    if not jobs:
+        return "No bulk analysis jobs found."
+    result = "# Bulk Analysis Jobs\n\n"
+    for job in jobs:
+        trial_count = sum(len(b["trial_ids"]) for b in job["batches"].values())
+        result += f"- **{job['job_id']}** ({job['status']}): {job['query']} - {trial_count} trials, submitted {job['submitted_at']}\n"
+    return result
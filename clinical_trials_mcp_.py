@@ -1,64 +1,260 @@
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import FastMCP, Context
 from parsers_ import (
     format_search_trials_summary,
     format_ct_gov_study_batch,
-    format_ctgov_trial_details,
-    extract_cro_data,
+    TOKEN_BYTES,
 )
-from models_ import model_call
+from models_ import model_stream, output_budget
+from verdicts_ import (
+    SOURCE_NAMES,
+    VerdictStreamParser,
+    VERDICT_FORMAT_INSTRUCTIONS,
+    RELEVANCE_THRESHOLD,
+    merge_verdicts,
+    linked_aliases,
+    format_ranking_table,
+)
+from bulk_ import (
+    submit_bulk_job,
+    refresh_bulk_job,
+    load_jobs,
+    format_bulk_job,
+    format_bulk_job_list,
+)
+from linking_ import collapse_duplicates
+from export_ import export_trials, format_export_summary, iter_ctgov_studies
+from facets_ import aggregate_facets, format_facets
+from synthesis_ import synthesize_verdicts, format_synthesis
+from outcomes_ import compare_outcomes, format_comparison
+from eligibility_ import (
+    index_trials,
+    match_trials,
+    format_index_summary,
+    format_matches,
+)
+from mirror_ import mirror_fresh, eu_search, local_trial_summary, STATUS_NAMES
+from semantic_ import semantic_candidates
+from prefetch_ import prefetch_trials
+from watchlist_ import (
+    add_trials,
+    remove_trials,
+    list_trials,
+    check_watchlist,
+    format_check,
+    format_watchlist,
+)
+from offload_ import (
+    render,
+    ctis_trial_summary,
+    ctgov_trial_details,
+    ctgov_trial_details_page,
+)
+from registries_ import (
+    ctis_retrieve,
+    ctgov_studies,
+    ctgov_study,
+    eu_search_criteria,
+    ctgov_search_params,
+)
+from tracing_ import (
+    span,
+    traced,
+    set_attributes,
+    ring_buffer,
+    format_trace_breakdown,
+)
+from usage_ import (
+    metered,
+    current_ledger,
+    history as usage_history,
+    format_metrics_footer,
+    format_usage_report,
+)
+from shared_ import (
+    per_client,
+    llm_slot,
+    verdict_cache,
+    verdict_key,
+    with_deadline,
+    current_deadline,
+    remaining_seconds,
+    DeadlineExceeded,
+    DEADLINE_EXCEEDED,
+)
+from contextlib import aclosing
 from typing import Optional
-import requests
+import argparse
 import asyncio
+import os
+import time
 
 mcp = FastMCP("clinical-trials-mcp", working_dir=".")
 
+RELEVANCE_MODEL = "claude-3-5-haiku-20241022"
+SEARCH_DEADLINE_SECONDS = float(os.getenv("SEARCH_DEADLINE_SECONDS", "0"))
 
-@mcp.tool()
-def fetch_trial(
+
+def eu_relevance_prompt(user_request: str, summary: str) -> str:
+    return f"""
+            The user is looking for information about: "{user_request}"
+            
+            Below are some EU clinical trial summaries. Identify which (if any) of these trials 
+            are relevant to the user's request. Prefer complete or ongoing trials. Prefer trials from pharmaceutical companies or trials that have results.
+            Use the Trial ID (ctNumber) as the trial identifier.
+            {VERDICT_FORMAT_INSTRUCTIONS}
+            
+            {summary}
+            """
+
+
+def ct_gov_relevance_prompt(user_request: str, batch_formatted: str) -> str:
+    return f"""
+            The user is looking for information about: "{user_request}"
+
+            Below are some clinical trial summaries from ClinicalTrials.gov. Identify which (if any) of these trials
+            are relevant to the user's request. Prefer complete or ongoing trials. Prefer trials from pharmaceutical companies or trials that have results.
+            Use the NCT ID as the trial identifier.
+            {VERDICT_FORMAT_INSTRUCTIONS}
+
+            {batch_formatted}
+            """
+
+
+def study_nct_ids(studies):
+    nct_ids = [
+        study.get("protocolSection", {}).get("identificationModule", {}).get("nctId")
+        for study in studies
+    ]
+    return [nct_id for nct_id in nct_ids if nct_id]
+
+
+def split_cached_verdicts(user_request: str, eu_trials: list, ct_studies: list):
+    cached = []
+
+    def uncached(trial_id):
+        verdict = verdict_cache.get(
+            verdict_key(user_request, trial_id, RELEVANCE_MODEL)
+        )
+        if verdict is not None:
+            cached.append(dict(verdict))
+        return verdict is None
+
+    eu_trials = [trial for trial in eu_trials if uncached(trial["ctNumber"])]
+    ct_studies = [
+        study
+        for study in ct_studies
+        if not study_nct_ids([study]) or uncached(study_nct_ids([study])[0])
+    ]
+    return eu_trials, ct_studies, cached
+
+
+async def analyze_relevance(
+    prompt: str,
+    trial_ids: list,
+    source: str,
+    ctx: Context = None,
+    aliases: Optional[dict] = None,
+) -> tuple:
+    parser = VerdictStreamParser(trial_ids, source, aliases)
+    with span("llm.relevance", source=source, trials=len(trial_ids)) as record:
+        try:
+            async with asyncio.timeout_at(current_deadline()), llm_slot(), aclosing(
+                model_stream(
+                    messages=prompt,
+                    model=RELEVANCE_MODEL,
+                    max_tokens=output_budget("relevance", len(trial_ids)),
+                    source=source,
+                )
+            ) as stream:
+                async for text in stream:
+                    if "first_token_ms" not in record["attributes"]:
+                        set_attributes(
+                            first_token_ms=round(
+                                (time.time_ns() - record["start_ns"]) / 1e6, 1
+                            )
+                        )
+                    for verdict in parser.feed(text):
+                        if ctx and verdict["relevant"]:
+                            await ctx.info(
+                                f"{verdict['trial_id']} ({verdict['score']:g}/10): {verdict['reason']}"
+                            )
+                    if parser.complete:
+                        set_attributes(early_cutoff=True)
+                        break
+        except TimeoutError:
+            # verdicts streamed before the deadline are kept
+            set_attributes(error=DEADLINE_EXCEEDED, verdicts=len(parser.verdicts))
+            return list(parser.verdicts.values()), DEADLINE_EXCEEDED
+        except Exception as e:
+            set_attributes(error=str(e), verdicts=len(parser.verdicts))
+            return list(parser.verdicts.values()), str(e)
+        for verdict in parser.close():
+            if ctx and verdict["relevant"]:
+                await ctx.info(
+                    f"{verdict['trial_id']} ({verdict['score']:g}/10): {verdict['reason']}"
+                )
+        set_attributes(verdicts=len(parser.verdicts))
+    return list(parser.verdicts.values()), None
+
+
+def finished_or_skipped(task: asyncio.Task, what: str, skipped: list) -> list:
+    if not task.done():
+        task.cancel()
+    elif not isinstance(task.exception(), DeadlineExceeded):
+        return task.result()
+    skipped.append(what)
+    return []
+
+
+def fetch_trial_details(
     eu_ct_id: str = None,
     trial_ct_id: str = None,
+    max_tokens: int = 8000,
+    continuation: str = None,
 ):
-    """
-    Fetch full trial information from euclinicaltrials.eu or ClinicalTrials.gov based on trial ID. Send in either EU trial ID or NCT ID, not both.
+    import requests
 
-    Args:
-        eu_ct_id: Specific EU trial identifier number (ctNumber) to look up
-        trial_ct_id: Specific NCT ID to look up
-    """
+    if continuation:
+        try:
+            trial_ct_id, max_bytes, position = continuation.split(":")
+            section_pos, block_pos = position.split(".")
+            cursor = (int(section_pos), int(block_pos))
+            max_tokens = int(max_bytes) // TOKEN_BYTES
+        except ValueError:
+            return f"Invalid continuation handle: {continuation}"
+    else:
+        cursor = (0, 0)
     if eu_ct_id and trial_ct_id:
         return f"Both EU trial ID ({eu_ct_id}) and ClinicalTrials.gov ID ({trial_ct_id}) were provided. Only one ID can be processed at a time. Processing the ClinicalTrials.gov ID first. Please run this tool again with only the EU trial ID to fetch that data separately."
     if trial_ct_id:
         if not trial_ct_id.startswith("NCT"):
             return f"Invalid NCT ID format: {trial_ct_id}. IDs should start with 'NCT' followed by 8 digits."
         try:
-            url = f"https://clinicaltrials.gov/api/v2/studies/{trial_ct_id}"
-            params = {"format": "json", "markupFormat": "markdown"}
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            study_data = response.json()
-            formatted_result = format_ctgov_trial_details(study_data)
+            set_attributes(trial_id=trial_ct_id)
+            body = ctgov_study(trial_ct_id, raw=True)
+            if not max_tokens or max_tokens <= 0:
+                with span("format.ctgov_details"):
+                    return render(ctgov_trial_details, body)
+            max_bytes = max_tokens * TOKEN_BYTES
+            with span("format.ctgov_details_page", max_bytes=max_bytes):
+                formatted_result, next_cursor = render(
+                    ctgov_trial_details_page, body, max_bytes, cursor
+                )
+            if next_cursor:
+                handle = f"{trial_ct_id}:{max_bytes}:{next_cursor[0]}.{next_cursor[1]}"
+                formatted_result += f'\n---\n*This record continues. Call fetch_trial with continuation="{handle}" for the next part.*\n'
             return formatted_result
         except Exception as e:
             return f"Error fetching study with ID {trial_ct_id}: {str(e)}"
     if eu_ct_id:
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "origin": "https://euclinicaltrials.eu",
-        }
         try:
-            api_url = f"https://euclinicaltrials.eu/ctis-public-api/retrieve/{eu_ct_id}"
-            response = requests.get(
-                api_url,
-                cookies={"accepted_cookie": "true"},
-                headers=headers,
-                timeout=10,
-            )
-            response.raise_for_status()
-            raw_data = response.json()
-            extracted_data = extract_cro_data(raw_data)
-            full_summary = extracted_data["summary"]
-            return full_summary
+            set_attributes(trial_id=eu_ct_id)
+            summary = local_trial_summary(eu_ct_id) if mirror_fresh() else None
+            if summary is not None:
+                return summary
+            body = ctis_retrieve(eu_ct_id, raw=True)
+            with span("format.extract_cro_data"):
+                return render(ctis_trial_summary, body)
         except requests.RequestException as err:
             return f"Error querying EU Clinical Trials: {err}"
     return (
@@ -67,6 +263,35 @@ def fetch_trial(
 
 
 @mcp.tool()
+@traced("fetch_trial")
+@per_client
+async def fetch_trial(
+    eu_ct_id: str = None,
+    trial_ct_id: str = None,
+    max_tokens: int = 8000,
+    continuation: str = None,
+    ctx: Context = None,
+):
+    """
+    Fetch full trial information from euclinicaltrials.eu or ClinicalTrials.gov based on trial ID. Send in either EU trial ID or NCT ID, not both.
+    Long ClinicalTrials.gov records are split into parts that fit max_tokens, most important sections first; each part ends with a continuation handle for the next one.
+
+    Args:
+        eu_ct_id: Specific EU trial identifier number (ctNumber) to look up
+        trial_ct_id: Specific NCT ID to look up
+        max_tokens: Approximate size limit of the returned ClinicalTrials.gov record part (default is 8000, 0 returns the whole record at once)
+        continuation: Continuation handle from a previous fetch_trial response, to get the next part of a long record
+    """
+    return await asyncio.to_thread(
+        fetch_trial_details, eu_ct_id, trial_ct_id, max_tokens, continuation
+    )
+
+
+@mcp.tool()
+@traced("search_batch_trials")
+@metered("search_batch_trials")
+@with_deadline(SEARCH_DEADLINE_SECONDS)
+@per_client
 async def search_batch_trials(
     user_request: str,
     search_terms: str,
@@ -75,6 +300,13 @@ async def search_batch_trials(
     sponsor: Optional[str] = None,
     status: Optional[str] = None,
     no_of_trials: int = 10,
+    bulk: bool = False,
+    top_n: int = 10,
+    include_metrics: bool = False,
+    deadline_seconds: Optional[float] = None,
+    semantic: bool = False,
+    synthesize: bool = False,
+    ctx: Context = None,
 ):
     """
     Search for clinical trials based on user request and search terms. Fetch data from both EU Clinical Trials and ClinicalTrials.gov.
@@ -87,6 +319,12 @@ async def search_batch_trials(
         sponsor: Sponsor of the trial.
         status: Status of the trial - 8 for ended, 5 for ongoing recruitment ended, 1 for authorised, 4 for ongoing recruiting.
         no_of_trials: Number of trials to fetch from each source (default is 10).
+        bulk: Submit the relevance analysis as one asynchronous batch job instead of analyzing in real time. Use for large overnight reviews; results are collected with the check_bulk_analysis tool.
+        top_n: Number of top-ranked relevant trials to include in the response (default is 10).
+        include_metrics: Append a footer with the LLM tokens used and their estimated cost (default is False).
+        deadline_seconds: Return within about this many seconds with whatever finished by then, noting what was skipped (default is the server's SEARCH_DEADLINE_SECONDS, 0 means no deadline).
+        semantic: Take candidates from the local semantic index by meaning instead of the registries' keyword search, which also finds trials described with synonyms. Status, condition and sponsor filters apply; location is ignored. Falls back to the registry search when no index has been built (default is False).
+        synthesize: Add a short synthesis of all relevant trials above the ranking, of the same size however many trials were analyzed. Use with a large no_of_trials to get an overview instead of reading every trial (default is False).
     """
     query = search_terms or user_request
     cond = condition or ""
@@ -95,229 +333,613 @@ async def search_batch_trials(
     status = int(status) if status else 8
     if not query or not user_request:
         return f"error: Missing required parameters. Please provide a search term and user request."
-    all_eu_trials = []
-    all_eu_llm_responses = []
-    all_ct_gov_llm_responses = []
-    processed_eu_trial_count = 0
-    processed_ct_count = 0
+    set_attributes(no_of_trials=no_of_trials, bulk=bulk)
+    all_verdicts = []
+    cached_verdicts = []
+    failed_batches = 0
+    late_batches = []
+    skipped = []
     try:
-        search_criteria = {
-            "containAll": search_terms,
-            "status": [
-                status,
-            ],
-        }
-        if cond:
-            search_criteria["medicalCondition"] = cond
-        if spons:
-            search_criteria["sponsor"] = spons
-        headers = {
-            "accept": "application/json",
-            "content-type": "application/json",
-            "origin": "https://euclinicaltrials.eu",
-        }
-        current_page = 1
-        has_next = True
-        eu_trial_ids = []
-        eu_page_count = 0
-        while has_next and len(eu_trial_ids) < no_of_trials:
-            payload = {
-                "pagination": {"page": current_page, "size": 5},
-                "sort": {"property": "decisionDate", "direction": "DESC"},
-                "searchCriteria": search_criteria,
-            }
-            response = requests.post(
-                "https://euclinicaltrials.eu/ctis-public-api/search",
-                cookies={"accepted_cookie": "true"},
-                headers=headers,
-                json=payload,
-                timeout=10,
-            )
-            response.raise_for_status()
-            data = response.json()
-            trials_in_batch = data.get("data", [])
-            for trial in trials_in_batch:
-                if "ctNumber" in trial:
-                    eu_trial_ids.append(trial["ctNumber"])
-                    if len(eu_trial_ids) >= no_of_trials:
-                        break
-            eu_page_count += 1
-            has_next = data.get("pagination", {}).get("nextPage", False)
-            if not has_next or len(eu_trial_ids) >= no_of_trials:
-                break
-            current_page += 1
-        url = "https://clinicaltrials.gov/api/v2/studies"
-        params = {
-            "format": "json",
-            "markupFormat": "markdown",
-            "query.term": query.replace(" ", "+"),
-            "filter.overallStatus": "COMPLETED",
-            "pageSize": 5,
-        }
-        if cond:
-            params["query.cond"] = cond
-        if locn:
-            params["query.locn"] = locn
-        if spons:
-            params["query.spons"] = spons
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        total_count = min(data.get("totalCount", no_of_trials), no_of_trials)
-        ct_gov_page_count = (total_count + 4) // 5
-
-        async def process_eu_page(page_num):
+        search_criteria = eu_search_criteria(search_terms, status, cond, spons)
+
+        async def fetch_eu_page(page_num):
             payload = {
                 "pagination": {"page": page_num, "size": 5},
                 "sort": {"property": "decisionDate", "direction": "DESC"},
                 "searchCriteria": search_criteria,
             }
-            response = await asyncio.to_thread(
-                requests.post,
-                "https://euclinicaltrials.eu/ctis-public-api/search",
-                cookies={"accepted_cookie": "true"},
-                headers=headers,
-                json=payload,
-                timeout=10,
-            )
-            response.raise_for_status()
-            data = response.json()
-            summary = format_search_trials_summary(data)
-            return summary, data.get("data", [])
-
-        eu_tasks = []
-        for page in range(1, eu_page_count + 1):
-            eu_tasks.append(process_eu_page(page))
-        eu_results = await asyncio.gather(*eu_tasks)
-        eu_summaries = []
-        for summary, trials in eu_results:
-            all_eu_trials.append(summary)
-            processed_eu_trial_count += len(trials)
-            if summary:
-                eu_summaries.append(summary)
-
-        async def analyze_eu_trial(summary, idx):
-            prompt = f"""
-            The user is looking for information about: "{user_request}"
-            
-            Below are some EU clinical trial summaries. Identify which (if any) of these trials 
-            are relevant to the user's request. Prefer complete or ongoing trials. Prefer trials from pharmaceutical companies or trials that have results.
-            For each relevant trial, provide:
-            1. The Trial ID (ctNumber)
-            2. A brief explanation of why it's relevant
-            
-            If none are relevant, state that clearly.
-            Be succint.
-            
-            {summary}
-            """
-            llm_response = await model_call(
-                messages=prompt, model="claude-3-5-haiku-20241022"
+            return await asyncio.to_thread(eu_search, payload)
+
+        async def fetch_eu_trials():
+            first_page = await fetch_eu_page(1)
+            trials = first_page.get("data", [])
+            total_records = first_page.get("pagination", {}).get(
+                "totalRecords", len(trials)
             )
-            return idx, llm_response.content
-
-        eu_llm_tasks = []
-        for i, summary in enumerate(eu_summaries):
-            if user_request:
-                eu_llm_tasks.append(analyze_eu_trial(summary, i))
-        if eu_llm_tasks:
-            eu_llm_results = await asyncio.gather(*eu_llm_tasks)
-            eu_llm_results.sort(key=lambda x: x[0])
-            for _, response_text in eu_llm_results:
-                all_eu_llm_responses.append(response_text)
-
-        async def process_ct_gov_page(page_token=""):
-            params = {
-                "format": "json",
-                "markupFormat": "markdown",
-                "query.term": query.replace(" ", "+"),
-                "filter.overallStatus": "COMPLETED",
-                "pageSize": 5,
-            }
-            if page_token:
-                params["pageToken"] = page_token
-            response = await asyncio.to_thread(requests.get, url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            studies = data.get("studies", [])
-            next_token = data.get("nextPageToken", "")
-            batch_formatted = format_ct_gov_study_batch(studies)
-            return batch_formatted, studies, next_token
-
-        first_batch, studies, next_token = await process_ct_gov_page()
-        processed_ct_count += len(studies)
-        ct_gov_batches = []
-        if first_batch:
-            ct_gov_batches.append(first_batch)
-        batch_tasks = []
-        tokens = []
-        while next_token and processed_ct_count < no_of_trials:
-            tokens.append(next_token)
-            if len(tokens) >= ct_gov_page_count - 1:
-                break
-        for token in tokens:
-            batch_tasks.append(process_ct_gov_page(token))
-        if batch_tasks:
-            ct_results = await asyncio.gather(*batch_tasks)
-            for batch_formatted, studies, _ in ct_results:
-                if batch_formatted:
-                    ct_gov_batches.append(batch_formatted)
-                processed_ct_count += len(studies)
-
-        async def analyze_ct_gov_trial(batch_formatted, idx):
-            prompt = f"""
-            The user is looking for information about: "{user_request}"
+            eu_page_count = (min(total_records, no_of_trials) + 4) // 5
+            if eu_page_count > 1:
+                pages = await asyncio.gather(
+                    *[fetch_eu_page(page) for page in range(2, eu_page_count + 1)],
+                    return_exceptions=True,
+                )
+                late_pages = 0
+                for page in pages:
+                    if isinstance(page, DeadlineExceeded):
+                        late_pages += 1
+                    elif isinstance(page, BaseException):
+                        raise page
+                    else:
+                        trials.extend(page.get("data", []))
+                if late_pages:
+                    skipped.append(
+                        f"{late_pages} of {eu_page_count} EU CTIS result pages"
+                    )
+            return [trial for trial in trials if "ctNumber" in trial][:no_of_trials]
 
-            Below are some clinical trial summaries from ClinicalTrials.gov. Identify which (if any) of these trials
-            are relevant to the user's request. Prefer complete or ongoing trials. Prefer trials from pharmaceutical companies or trials that have results.
-            For each relevant trial, provide:
-            1. The NCT ID
-            2. A brief explanation of why it's relevant
+        params = ctgov_search_params(
+            query, min(max(no_of_trials, 5), 100), cond, locn, spons
+        )
 
-            If none are relevant, state that clearly.
-            Be succint.
+        async def fetch_ct_gov_studies():
+            studies = []
+            page_token = ""
+            while len(studies) < no_of_trials:
+                page_params = (
+                    dict(params, pageToken=page_token) if page_token else params
+                )
+                try:
+                    data = await asyncio.to_thread(ctgov_studies, page_params)
+                except DeadlineExceeded:
+                    if not studies:
+                        raise
+                    skipped.append(
+                        f"ClinicalTrials.gov results after the first {len(studies)}"
+                    )
+                    break
+                studies.extend(data.get("studies", []))
+                page_token = data.get("nextPageToken", "")
+                if not page_token:
+                    break
+            return studies[:no_of_trials]
 
-            {batch_formatted}
-            """
-            llm_response = await model_call(
-                messages=prompt, model="claude-3-5-haiku-20241022"
+        candidates = None
+        if semantic:
+            candidates = await asyncio.to_thread(
+                semantic_candidates,
+                f"{user_request} {search_terms or ''}",
+                no_of_trials,
+                status=STATUS_NAMES.get(status),
+                ctgov_status=params["filter.overallStatus"],
+                condition=cond,
+                sponsor=spons,
+            )
+            set_attributes(semantic=candidates is not None)
+        if candidates is not None:
+            eu_trials, ct_studies = candidates["eu"], candidates["ctgov"]
+        else:
+            fetches = [
+                asyncio.create_task(fetch_eu_trials()),
+                asyncio.create_task(fetch_ct_gov_studies()),
+            ]
+            # registry requests are bounded by the deadline themselves; the wait
+            # only catches work that never got to send its request
+            await asyncio.wait(fetches, timeout=remaining_seconds())
+            eu_trials = finished_or_skipped(fetches[0], "the EU CTIS search", skipped)
+            ct_studies = finished_or_skipped(
+                fetches[1], "the ClinicalTrials.gov search", skipped
+            )
+        processed_eu_trial_count = len(eu_trials)
+        processed_ct_count = len(ct_studies)
+        with span("link.collapse_duplicates"):
+            eu_trials, ct_studies, linked_ids = collapse_duplicates(
+                eu_trials, ct_studies
             )
-            return idx, llm_response.content
-
-        ct_gov_llm_tasks = []
-        for i, batch_formatted in enumerate(ct_gov_batches):
-            if user_request:
-                ct_gov_llm_tasks.append(analyze_ct_gov_trial(batch_formatted, i))
-        if ct_gov_llm_tasks:
-            ct_gov_llm_results = await asyncio.gather(*ct_gov_llm_tasks)
-            ct_gov_llm_results.sort(key=lambda x: x[0])
-            for _, response_text in ct_gov_llm_results:
-                all_ct_gov_llm_responses.append(response_text)
+        if not bulk:
+            eu_trials, ct_studies, cached_verdicts = split_cached_verdicts(
+                user_request, eu_trials, ct_studies
+            )
+            all_verdicts.extend(cached_verdicts)
+            set_attributes(cached_verdicts=len(cached_verdicts))
+
+        eu_batches = [eu_trials[i : i + 5] for i in range(0, len(eu_trials), 5)]
+        ct_gov_batches = [ct_studies[i : i + 5] for i in range(0, len(ct_studies), 5)]
+        with span("format.prompts"):
+            analysis_batches = [
+                {
+                    "custom_id": f"eu-{i}",
+                    "source": "eu",
+                    "trial_ids": [trial["ctNumber"] for trial in batch],
+                    "aliases": linked_aliases(
+                        linked_ids, [trial["ctNumber"] for trial in batch]
+                    ),
+                    "prompt": eu_relevance_prompt(
+                        user_request,
+                        format_search_trials_summary(
+                            {
+                                "data": batch,
+                                "pagination": {
+                                    "totalRecords": len(eu_trials),
+                                    "currentPage": i + 1,
+                                    "totalPages": len(eu_batches),
+                                    "nextPage": i + 1 < len(eu_batches),
+                                },
+                            }
+                        ),
+                    ),
+                }
+                for i, batch in enumerate(eu_batches)
+            ] + [
+                {
+                    "custom_id": f"ctgov-{i}",
+                    "source": "ctgov",
+                    "trial_ids": study_nct_ids(batch),
+                    "prompt": ct_gov_relevance_prompt(
+                        user_request, format_ct_gov_study_batch(batch)
+                    ),
+                }
+                for i, batch in enumerate(ct_gov_batches)
+            ]
+
+        if bulk:
+            if not analysis_batches:
+                return f"No trials found to analyze for: {query}"
+            with span("bulk.submit", batches=len(analysis_batches)):
+                job = await submit_bulk_job(
+                    user_request,
+                    query,
+                    analysis_batches,
+                    max_tokens=output_budget(
+                        "relevance", max(len(b["trial_ids"]) for b in analysis_batches)
+                    ),
+                )
+            trial_count = sum(len(b["trial_ids"]) for b in analysis_batches)
+            return (
+                f"Bulk analysis job {job['job_id']} submitted with {len(analysis_batches)} batches "
+                f"covering {trial_count} trials. Use the check_bulk_analysis tool with this job ID to collect the results."
+            )
+
+        llm_results = await asyncio.gather(
+            *[
+                analyze_relevance(
+                    batch["prompt"],
+                    batch["trial_ids"],
+                    SOURCE_NAMES[batch["source"]],
+                    ctx,
+                    batch.get("aliases"),
+                )
+                for batch in analysis_batches
+            ]
+        )
+        for batch, (verdicts, error) in zip(analysis_batches, llm_results):
+            all_verdicts.extend(verdicts)
+            for verdict in verdicts:
+                verdict_cache.set(
+                    verdict_key(user_request, verdict["trial_id"], RELEVANCE_MODEL),
+                    dict(verdict),
+                )
+            if error == DEADLINE_EXCEEDED:
+                late_batches.append(len(batch["trial_ids"]) - len(verdicts))
+            elif error:
+                failed_batches += 1
     except Exception as e:
         error_message = f"Error searching clinical trials: {str(e)}"
+        set_attributes(error=error_message)
         return f"error: {error_message}"
+    ranked = merge_verdicts(all_verdicts)
+    for verdict in ranked:
+        verdict["linked_ids"] = linked_ids.get(verdict["trial_id"], [])
+    relevant_count = sum(1 for v in ranked if v["relevant"])
+    # the client usually asks for details of the top trials next
+    prefetched = prefetch_trials(
+        [[v["trial_id"], *v["linked_ids"]] for v in ranked if v["relevant"]]
+    )
+    set_attributes(prefetched=len(prefetched))
+    synthesis = None
+    if synthesize and relevant_count:
+        synthesis = await synthesize_verdicts(user_request, ranked)
     result = f"# Clinical Trials Search Results for: {query}\n\n"
-    if all_eu_trials:
-        result += "## EU Clinical Trials Results\n\n"
-        if all_eu_llm_responses:
-            result += "### EU Trials Analysis\n\n"
-            for i, response in enumerate(all_eu_llm_responses, 1):
-                result += f"#### Batch {i} Analysis\n{response}\n\n"
+    if semantic and candidates is None:
+        result += "*No local semantic index was found, so the registries' keyword search was used. Build one with `python semantic_.py build`.*\n\n"
+    result += f"Analyzed {processed_eu_trial_count} EU trials and {processed_ct_count} ClinicalTrials.gov trials"
+    if linked_ids:
+        result += f" ({len(linked_ids)} registered in both were analyzed once)"
+    if cached_verdicts:
+        result += f"; {len(cached_verdicts)} verdicts were reused from earlier searches for the same request"
+    result += "; "
+    result += (
+        f"{relevant_count} scored {RELEVANCE_THRESHOLD}/10 or higher for relevance.\n\n"
+    )
+    if synthesis:
+        result += format_synthesis(synthesis)
+    result += f"## Most Relevant Trials (top {min(top_n, relevant_count)})\n\n"
+    result += format_ranking_table(ranked, top_n)
+    if failed_batches:
+        result += f"\n*{failed_batches} analysis batches failed; their trials may be missing from the ranking.*\n"
+    if late_batches:
+        skipped.append(
+            f"relevance analysis of {sum(late_batches)} trials in {len(late_batches)} unfinished batches"
+        )
+    if skipped:
+        result += f"\n*Partial results: the deadline was reached before these finished, so they are missing from the ranking: {'; '.join(skipped)}. Rerun with a larger deadline_seconds for complete results.*\n"
+        set_attributes(skipped=len(skipped))
+    result += "\nConsider using the fetch_trial tool to get complete details on specific trials of interest.\n"
+    if include_metrics:
+        result += format_metrics_footer(current_ledger())
+    return result
+
+
+@mcp.tool()
+@traced("export_search_results")
+@per_client
+async def export_search_results(
+    search_terms: str,
+    condition: Optional[str] = None,
+    location: Optional[str] = None,
+    sponsor: Optional[str] = None,
+    status: Optional[str] = None,
+    max_trials: int = 1000,
+    file_format: str = "jsonl",
+    sources: str = "both",
+    ctx: Context = None,
+):
+    """
+    Export search results from EU Clinical Trials and ClinicalTrials.gov as one normalized row per trial (ID, title, status, phase, sponsor, conditions, countries, dates, enrollment, results, primary endpoint, linked IDs) to a file for spreadsheets and analytics. No relevance analysis is done.
+
+    Args:
+        search_terms: Keywords or phrases to search for in clinical trials.
+        condition: Specific condition or disease to filter trials.
+        location: Trial's location (city, state, country), ClinicalTrials.gov only.
+        sponsor: Sponsor of the trial.
+        status: EU trial status - 8 for ended, 5 for ongoing recruitment ended, 1 for authorised, 4 for ongoing recruiting.
+        max_trials: Maximum number of trials to export from each source (default is 1000).
+        file_format: jsonl, csv or parquet (parquet needs pyarrow) (default is jsonl).
+        sources: both, eu or ctgov (default is both).
+    """
+    if not search_terms:
+        return "error: Missing required parameter search_terms."
+    set_attributes(max_trials=max_trials, file_format=file_format, sources=sources)
+    try:
+        export = await asyncio.to_thread(
+            export_trials,
+            search_terms,
+            file_format=file_format,
+            sources=sources,
+            max_trials=max_trials,
+            condition=condition or "",
+            location=location or "",
+            sponsor=sponsor or "",
+            status=int(status) if status else 8,
+        )
+    except Exception as e:
+        return f"error: Error exporting trials: {str(e)}"
+    return format_export_summary(export)
+
+
+@mcp.tool()
+@traced("aggregate_trial_facets")
+@per_client
+async def aggregate_trial_facets(
+    search_terms: str,
+    condition: Optional[str] = None,
+    location: Optional[str] = None,
+    sponsor: Optional[str] = None,
+    status: Optional[str] = None,
+    max_trials: int = 10000,
+    sources: str = "both",
+    facets: Optional[str] = None,
+    top_values: int = 15,
+    ctx: Context = None,
+):
+    """
+    Count all trials matching a search in EU Clinical Trials and ClinicalTrials.gov by status, phase, sponsor type, country and start year, e.g. to answer "how many phase 3 trials of X per country". Every matching trial is counted, not a sample, and no relevance analysis is done, so it is fast and cheap for thousands of trials.
+
+    Args:
+        search_terms: Keywords or phrases to search for in clinical trials.
+        condition: Specific condition or disease to filter trials.
+        location: Trial's location (city, state, country), ClinicalTrials.gov only.
+        sponsor: Sponsor of the trial.
+        status: EU trial status - 8 for ended, 5 for ongoing recruitment ended, 1 for authorised, 4 for ongoing recruiting.
+        max_trials: Maximum number of trials to count from each source (default is 10000).
+        sources: both, eu or ctgov (default is both).
+        facets: Comma-separated facets to count: status, phase, sponsor_type, country, start_year, sponsor (default is all but sponsor).
+        top_values: Maximum number of values listed per facet (default is 15).
+    """
+    if not search_terms:
+        return "error: Missing required parameter search_terms."
+    set_attributes(max_trials=max_trials, sources=sources)
+    try:
+        result = await asyncio.to_thread(
+            aggregate_facets,
+            search_terms,
+            sources=sources,
+            max_trials=max_trials,
+            condition=condition or "",
+            location=location or "",
+            sponsor=sponsor or "",
+            status=int(status) if status else 8,
+            facets=[f.strip() for f in (facets or "").split(",") if f.strip()],
+        )
+    except Exception as e:
+        return f"error: Error counting trial facets: {str(e)}"
+    return format_facets(result, top_values)
+
+
+@mcp.tool()
+@traced("index_trial_eligibility")
+@per_client
+async def index_trial_eligibility(
+    search_terms: str,
+    condition: Optional[str] = None,
+    location: Optional[str] = None,
+    sponsor: Optional[str] = None,
+    status: Optional[str] = None,
+    max_trials: int = 1000,
+    sources: str = "both",
+    ctx: Context = None,
+):
+    """
+    Add the eligibility of matching trials from EU Clinical Trials and ClinicalTrials.gov (age range, sex, healthy volunteers, key inclusion/exclusion terms) to the local eligibility index used by match_patient_to_trials. No relevance analysis is done.
+
+    Args:
+        search_terms: Keywords or phrases to search for in clinical trials.
+        condition: Specific condition or disease to filter trials.
+        location: Trial's location (city, state, country), ClinicalTrials.gov only.
+        sponsor: Sponsor of the trial.
+        status: EU trial status - 8 for ended, 5 for ongoing recruitment ended, 1 for authorised, 4 for ongoing recruiting.
+        max_trials: Maximum number of trials to index from each source (default is 1000).
+        sources: both, eu or ctgov (default is both).
+    """
+    if not search_terms:
+        return "error: Missing required parameter search_terms."
+    set_attributes(max_trials=max_trials, sources=sources)
+    try:
+        index = await asyncio.to_thread(
+            index_trials,
+            search_terms,
+            sources=sources,
+            max_trials=max_trials,
+            condition=condition or "",
+            location=location or "",
+            sponsor=sponsor or "",
+            status=int(status) if status else 4,
+        )
+    except Exception as e:
+        return f"error: Error indexing trial eligibility: {str(e)}"
+    return format_index_summary(index)
+
+
+@mcp.tool()
+@traced("match_patient_to_trials")
+async def match_patient_to_trials(
+    age: Optional[float] = None,
+    sex: Optional[str] = None,
+    condition: Optional[str] = None,
+    healthy_volunteer: bool = False,
+    patient_conditions: Optional[str] = None,
+    sources: str = "both",
+    max_results: int = 25,
+):
+    """
+    Find indexed trials a patient could join from their age, sex and conditions, using the local eligibility index (build it first with index_trial_eligibility). Fast and needs no LLM analysis; trials whose exclusion criteria mention one of the patient's conditions are left out.
+
+    Args:
+        age: Patient's age in years.
+        sex: Patient's sex, female or male.
+        condition: Condition the trial should study.
+        healthy_volunteer: The patient is a healthy volunteer (default is False).
+        patient_conditions: Comma-separated other conditions, treatments or features of the patient, checked against exclusion and inclusion criteria.
+        sources: both, eu or ctgov (default is both).
+        max_results: Maximum number of trials to list (default is 25).
+    """
+    try:
+        result = await asyncio.to_thread(
+            match_trials,
+            age=age,
+            sex=sex,
+            condition=condition or "",
+            healthy_volunteer=healthy_volunteer,
+            patient_terms=(patient_conditions or "").split(","),
+            source=sources,
+            max_results=max_results,
+        )
+    except Exception as e:
+        return f"error: Error matching patient to trials: {str(e)}"
+    return format_matches(result)
+
+
+@mcp.tool()
+@traced("watch_trials")
+async def watch_trials(add: Optional[str] = None, remove: Optional[str] = None):
+    """
+    Add trials to or remove them from the watchlist checked by check_trial_updates, and list the watched trials.
+
+    Args:
+        add: Comma-separated NCT IDs or EU CT numbers to start watching.
+        remove: Comma-separated trial IDs to stop watching.
+    """
+    to_add = [i.strip() for i in (add or "").split(",") if i.strip()]
+    to_remove = [i.strip() for i in (remove or "").split(",") if i.strip()]
+    try:
+        added = await asyncio.to_thread(add_trials, to_add)
+        removed = await asyncio.to_thread(remove_trials, to_remove)
+        trials = await asyncio.to_thread(list_trials)
+    except Exception as e:
+        return f"error: Error updating the watchlist: {str(e)}"
+    response = ""
+    if added["added"] or removed:
+        response += (
+            f"Added {len(added['added'])} and removed {len(removed)} trials.\n\n"
+        )
+    if added["invalid"]:
+        response += f"*Not a trial ID: {', '.join(added['invalid'])}.*\n\n"
+    return response + format_watchlist(trials)
+
+
+@mcp.tool()
+@traced("check_trial_updates")
+@per_client
+async def check_trial_updates(
+    trial_ids: Optional[str] = None,
+    max_diff_lines: int = 40,
+    ctx: Context = None,
+):
+    """
+    Check the watched trials for registry updates and show what changed in each updated trial, section by section, since the last check. Only trials whose last-update date moved are refetched, so checking a long watchlist is cheap.
+
+    Args:
+        trial_ids: Comma-separated watched trial IDs to check (default is the whole watchlist).
+        max_diff_lines: Maximum diff lines shown per changed section (default is 40).
+    """
+    ids = [i.strip() for i in (trial_ids or "").split(",") if i.strip()]
+    try:
+        result = await asyncio.to_thread(check_watchlist, ids or None, max_diff_lines)
+    except Exception as e:
+        return f"error: Error checking the watchlist: {str(e)}"
+    if not result["checked"]:
+        return "No watched trials to check; add some with watch_trials."
+    return format_check(result)
+
+
+@mcp.tool()
+@traced("compare_trial_outcomes")
+@per_client
+async def compare_trial_outcomes(
+    outcome: str,
+    trial_ids: Optional[str] = None,
+    search_terms: Optional[str] = None,
+    condition: Optional[str] = None,
+    max_trials: int = 50,
+    primary_only: bool = False,
+    top_n: int = 50,
+    ctx: Context = None,
+):
+    """
+    Compare one outcome across many ClinicalTrials.gov trials with posted results: effect size with confidence interval, p-value and enrollment per trial, plus a pooled estimate per effect measure, as one compact table. Use instead of fetching full details of each trial.
+
+    Args:
+        outcome: Outcome to compare, e.g. "overall survival" or "HbA1c change from baseline".
+        trial_ids: Comma-separated NCT IDs of the trials to compare.
+        search_terms: Keywords to find trials with results when no trial_ids are given.
+        condition: Specific condition or disease to filter trials found by search_terms.
+        max_trials: Maximum number of trials to find with search_terms (default is 50).
+        primary_only: Only consider primary outcome measures (default is False).
+        top_n: Number of trials to list in the table (default is 50).
+    """
+    ids = [i.strip() for i in (trial_ids or "").split(",") if i.strip()]
+    if not ids and not search_terms:
+        return "error: Provide trial_ids or search_terms."
+    set_attributes(trials=len(ids), max_trials=max_trials)
+    failed = []
+    try:
+        if ids:
+            fetched = await asyncio.gather(
+                *[asyncio.to_thread(ctgov_study, nct_id) for nct_id in ids],
+                return_exceptions=True,
+            )
+            studies = []
+            for nct_id, study in zip(ids, fetched):
+                if isinstance(study, BaseException):
+                    failed.append(nct_id)
+                else:
+                    studies.append(study)
         else:
-            result += "No EU trials were analyzed for relevance.\n\n"
-    if all_ct_gov_llm_responses:
-        result += "## ClinicalTrials.gov Results\n\n"
-        result += f"Found further clinical trials matching: {query}\n\n"
-        result += "### ClinicalTrials.gov Analysis\n\n"
-        for i, response in enumerate(all_ct_gov_llm_responses, 1):
-            result += f"#### Batch {i} Analysis\n{response}\n\n"
-    else:
-        result += "## ClinicalTrials.gov Results\n\n"
-        result += "No relevant trials were found on ClinicalTrials.gov or analysis failed.\n\n"
-    result += "## Summary of Most Relevant Trials\n\n"
-    result += "Based on the analysis above, these trials appear most relevant to your query. Consider using the fetch_trials tool to get complete details on specific trials of interest.\n\n"
+            params = ctgov_search_params(
+                search_terms, min(max_trials, 100), condition or ""
+            )
+            params["aggFilters"] = "results:with"
+            studies = await asyncio.to_thread(
+                lambda: list(iter_ctgov_studies(params, max_trials))
+            )
+        with span("outcomes.compare", studies=len(studies)):
+            result = await asyncio.to_thread(
+                compare_outcomes, studies, outcome, primary_only
+            )
+    except Exception as e:
+        return f"error: Error comparing trial outcomes: {str(e)}"
+    response = format_comparison(result, outcome, top_n)
+    if failed:
+        response += f"\n*Could not fetch {', '.join(failed)}.*\n"
+    return response
+
+
+@mcp.tool()
+@traced("check_bulk_analysis")
+@metered("check_bulk_analysis")
+async def check_bulk_analysis(
+    job_id: Optional[str] = None,
+    wait_seconds: int = 0,
+    top_n: int = 25,
+    include_metrics: bool = False,
+):
+    """
+    Check a bulk analysis job submitted by search_batch_trials with bulk=True and return its results once finished. Without a job ID, list all known jobs.
+
+    Args:
+        job_id: Bulk analysis job ID returned by search_batch_trials.
+        wait_seconds: How long to keep polling for completion before returning (default is 0, check once).
+        top_n: Number of top-ranked relevant trials to include in the results (default is 25).
+        include_metrics: Append a footer with the LLM tokens and estimated cost of the batch results collected by this call (default is False).
+    """
+    try:
+        if not job_id:
+            jobs = []
+            for known_id, job in load_jobs().items():
+                if job["status"] != "ended":
+                    job = await refresh_bulk_job(known_id)
+                jobs.append(job)
+            return format_bulk_job_list(jobs)
+        job = await refresh_bulk_job(job_id, wait_seconds=wait_seconds)
+        if job is None:
+            return f"No bulk analysis job found with ID {job_id}."
+        result = format_bulk_job(job, top_n)
+        if include_metrics:
+            result += format_metrics_footer(current_ledger())
+        return result
+    except Exception as e:
+        return f"error: Error checking bulk analysis job: {str(e)}"
+
+
+@mcp.tool()
+def search_diagnostics(last_n: int = 5, tool: str = "search_batch_trials"):
+    """
+    Show the per-stage latency breakdown (registry pages, JSON decode, linking, prompt formatting, LLM calls) of the most recent tool calls, newest last.
+
+    Args:
+        last_n: Number of recent calls to show (default is 5).
+        tool: Tool whose calls to show: search_batch_trials, fetch_trial or check_bulk_analysis (default is search_batch_trials).
+    """
+    traces = ring_buffer.recent(last_n, tool)
+    if not traces:
+        return f"No recorded {tool} calls yet."
+    result = f"# Latency breakdown of the last {len(traces)} {tool} calls\n\n"
+    result += "Wall is the time during which at least one call of a stage was running; Sum adds up concurrent calls.\n\n"
+    for trace in traces:
+        result += format_trace_breakdown(trace)
     return result
 
 
+@mcp.tool()
+def usage_report(last_n: int = 100):
+    """
+    Summarize LLM token usage and estimated cost of recent tool calls, broken down by tool, source registry and model.
+
+    Args:
+        last_n: Number of recent tool calls that used the LLM to include (default is 100).
+    """
+    return format_usage_report(list(usage_history)[-last_n:] if last_n > 0 else [])
+
+
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
+    parser = argparse.ArgumentParser(description="Clinical trials MCP server.")
+    parser.add_argument(
+        "--transport",
+        choices=["stdio", "sse", "streamable-http"],
+        default=os.getenv("MCP_TRANSPORT", "stdio"),
+        help="stdio serves one client; sse and streamable-http serve many clients from one process with shared caches and limits",
+    )
+    parser.add_argument("--host", default=os.getenv("MCP_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MCP_PORT", "8000")))
+    args = parser.parse_args()
+    mcp.settings.host = args.host
+    mcp.settings.port = args.port
+    mcp.run(transport=args.transport)
@@ -0,0 +1,147 @@
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+import os
+import re
+import threading
+import zlib
+
+##############################################################################
+# payload compression for the local stores: registry JSON repeats the same
+# keys, enums and boilerplate in every record, so a dictionary trained on
+# sample payloads lets even a 2 KB search record compress well. zstandard
+# (optional) is used when installed, otherwise zlib with the dictionary as a
+# preset (zdict). Blobs are tagged with the dictionary they need; untagged
+# blobs are plain zlib, as written before dictionaries existed
+
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", "6"))
+# zlib only looks back 32 KB, so a longer zdict would be wasted
+ZLIB_DICTIONARY_BYTES = 32 * 1024
+ZSTD_DICTIONARY_BYTES = 112 * 1024
+MIN_TRAINING_SAMPLES = 20
+
+TAG_ZLIB_DICT = b"\x01"
+TAG_ZSTD_DICT = b"\x02"
+# JSON split at object/array boundaries and separators: keys, enum values and
+# field sequences become the dictionary's building blocks
+SEGMENT_PATTERN = re.compile(rb"[^{}\[\],]*[{}\[\],]")
+
+
+def load_zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def default_codec() -> str:
+    return "zstd" if load_zstd() else "zlib"
+
+
+class Dictionary:
+    def __init__(self, codec: str, data: bytes):
+        self.codec = codec
+        self.data = data
+        self.id = zlib.crc32(codec.encode() + data)
+        self._local = threading.local()
+
+    def zstd(self, kind: str):
+        # zstd (de)compressors are not thread-safe; keep one per thread
+        codec = getattr(self._local, kind, None)
+        if codec is None:
+            zstandard = load_zstd()
+            if zstandard is None:
+                raise ImportError(
+                    "this blob needs zstandard to decompress (pip install zstandard)"
+                )
+            data = zstandard.ZstdCompressionDict(self.data)
+            if kind == "compressor":
+                codec = zstandard.ZstdCompressor(
+                    level=COMPRESSION_LEVEL, dict_data=data
+                )
+            else:
+                codec = zstandard.ZstdDecompressor(dict_data=data)
+            setattr(self._local, kind, codec)
+        return codec
+
+
+_dictionaries: Dict[int, Dictionary] = {}
+
+
+def register(dictionary: Dictionary) -> Dictionary:
+    return _dictionaries.setdefault(dictionary.id, dictionary)
+
+
+def known_dictionary(dictionary_id: int) -> bool:
+    return dictionary_id in _dictionaries
+
+
+def zlib_dictionary(samples: List[bytes]) -> bytes:
+    """Segments shared by many samples, most common last, where zlib finds them cheapest."""
+    counts = Counter()
+    for sample in samples:
+        counts.update(set(SEGMENT_PATTERN.findall(sample)))
+    # segments in at least two samples, scored by the bytes they would save
+    scored = sorted(
+        (
+            (count * len(segment), segment)
+            for segment, count in counts.items()
+            if count > 1 and len(segment) > 3
+        ),
+        reverse=True,
+    )
+    chosen, size = [], 0
+    for _, segment in scored:
+        if size + len(segment) > ZLIB_DICTIONARY_BYTES:
+            continue
+        chosen.append(segment)
+        size += len(segment)
+    return b"".join(reversed(chosen))
+
+
+def train_dictionary(
+    samples: Iterable[bytes], codec: Optional[str] = None
+) -> Optional[Dictionary]:
+    """A dictionary for payloads like samples, or None with too few samples."""
+    samples = [s for s in samples if s]
+    if len(samples) < MIN_TRAINING_SAMPLES:
+        return None
+    codec = codec or default_codec()
+    if codec == "zstd":
+        zstandard = load_zstd()
+        total = sum(len(s) for s in samples)
+        size = min(ZSTD_DICTIONARY_BYTES, max(total // 10, 1024))
+        data = zstandard.train_dictionary(size, samples).as_bytes()
+    else:
+        data = zlib_dictionary(samples)
+    return register(Dictionary(codec, data))
+
+
+def compress(data: bytes, dictionary: Optional[Dictionary] = None) -> bytes:
+    if dictionary is None:
+        return zlib.compress(data, COMPRESSION_LEVEL)
+    header = dictionary.id.to_bytes(4, "big")
+    if dictionary.codec == "zstd":
+        return TAG_ZSTD_DICT + header + dictionary.zstd("compressor").compress(data)
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zdict=dictionary.data)
+    return TAG_ZLIB_DICT + header + compressor.compress(data) + compressor.flush()
+
+
+def decompress(blob: bytes) -> bytes:
+    tag = blob[:1]
+    if tag not in (TAG_ZLIB_DICT, TAG_ZSTD_DICT):
+        return zlib.decompress(blob)
+    dictionary_id = int.from_bytes(blob[1:5], "big")
+    dictionary = _dictionaries.get(dictionary_id)
+    if dictionary is None:
+        raise KeyError(f"compression dictionary {dictionary_id:08x} is not loaded")
+    if tag == TAG_ZSTD_DICT:
+        return dictionary.zstd("decompressor").decompress(blob[5:])
+    decompressor = zlib.decompressobj(zdict=dictionary.data)
+    return decompressor.decompress(blob[5:]) + decompressor.flush()
+
+
+def blob_dictionary(blob: bytes) -> Optional[int]:
+    if blob[:1] in (TAG_ZLIB_DICT, TAG_ZSTD_DICT):
+        return int.from_bytes(blob[1:5], "big")
+    return None
@@ -0,0 +1,528 @@
+from parsers_ import extract_cro_data, safe_extract
+from registries_ import (
+    ctis_retrieve,
+    eu_search_criteria,
+    ctgov_search_params,
+    CTGOV_STATUSES,
+)
+from export_ import iter_eu_trials, iter_ctgov_studies, CTGOV_EXPORT_PAGE_SIZE
+from mirror_ import (
+    CTIS_MIRROR_FILE,
+    SQLITE_MMAP_BYTES,
+    unpack,
+    connect as connect_mirror,
+)
+from tracing_ import span, set_attributes
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterable, List, Optional
+import argparse
+import json
+import os
+import re
+import sqlite3
+
+##############################################################################
+# eligibility index: age ranges in years, sex, healthy-volunteer flag and key
+# inclusion/exclusion terms are normalized once at ingest into SQLite, so
+# patient-matching questions are answered by a local query instead of LLM passes
+
+ELIGIBILITY_INDEX_FILE = os.getenv("ELIGIBILITY_INDEX_FILE", "eligibility.db")
+ELIGIBILITY_INDEX_WORKERS = int(os.getenv("ELIGIBILITY_INDEX_WORKERS", "8"))
+MAX_TERMS = 80
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    trial_id TEXT PRIMARY KEY,
+    source TEXT,
+    title TEXT,
+    status TEXT,
+    conditions TEXT,
+    min_age REAL,
+    max_age REAL,
+    sex TEXT,
+    healthy_volunteers INTEGER,
+    last_updated TEXT,
+    indexed_at TEXT
+);
+CREATE INDEX IF NOT EXISTS trials_age ON trials (min_age, max_age);
+CREATE TABLE IF NOT EXISTS terms (trial_id TEXT, kind TEXT, term TEXT);
+CREATE INDEX IF NOT EXISTS terms_term ON terms (term, kind);
+CREATE INDEX IF NOT EXISTS terms_trial ON terms (trial_id);
+"""
+
+AGE_UNITS = {
+    "year": 1.0,
+    "month": 1 / 12,
+    "week": 7 / 365.25,
+    "day": 1 / 365.25,
+    "hour": 1 / 8766,
+    "minute": 1 / 525960,
+}
+AGE_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(year|month|week|day|hour|minute)s?", re.I)
+# CTIS age groups look like "18-64 years", "65+ years" or "Children (2-11 years)"
+AGE_GROUP_RANGE = re.compile(
+    r"(\d+)\s*(year|month|week|day)?s?\s*-\s*(\d+)\s*(year|month|week|day)s?", re.I
+)
+AGE_GROUP_OPEN = re.compile(
+    r"(?:(\d+)\s*\+|[≥>]=?\s*(\d+))\s*(year|month|week|day)?", re.I
+)
+
+TERM_PATTERN = re.compile(r"[a-z][a-z0-9\-]{2,}")
+STOPWORDS = set("""
+    and the for with who are not any has have had been being was were will can may
+    must should all other than from into within before after during least more
+    less prior per its their them they this that these those such use used using
+    patient patients participant participants subject subjects study trial
+    criteria criterion inclusion exclusion eligible eligibility include included
+    excluded known history evidence current currently presence defined according
+    year years old age aged month months week weeks day days time times visit
+    screening baseline investigator opinion judgment written informed consent
+    able willing provide following either both also only one two three
+    """.split())
+
+
+def connect(path: Optional[str] = None) -> sqlite3.Connection:
+    connection = sqlite3.connect(path or ELIGIBILITY_INDEX_FILE, timeout=30)
+    connection.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_BYTES}")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+##############################################################################
+# normalization
+
+
+def age_in_years(text: Any) -> Optional[float]:
+    match = AGE_PATTERN.search(str(text or ""))
+    if not match:
+        return None
+    return round(float(match.group(1)) * AGE_UNITS[match.group(2).lower()], 3)
+
+
+def eu_age_range(age_group: Any) -> tuple:
+    text = ", ".join(age_group) if isinstance(age_group, list) else str(age_group or "")
+    lows, highs, open_ended = [], [], False
+    for low, low_unit, high, high_unit in AGE_GROUP_RANGE.findall(text):
+        lows.append(float(low) * AGE_UNITS[(low_unit or high_unit).lower()])
+        # "64 years" covers everyone until their 65th birthday
+        highs.append((float(high) + 1) * AGE_UNITS[high_unit.lower()] - 1 / 365.25)
+    for plus, at_least, unit in AGE_GROUP_OPEN.findall(text):
+        lows.append(float(plus or at_least) * AGE_UNITS[(unit or "year").lower()])
+        open_ended = True
+    if re.search(r"utero|newborn", text, re.I):
+        lows.append(0.0)
+    if not lows:
+        return None, None
+    return (
+        round(min(lows), 3),
+        None if open_ended or not highs else round(max(highs), 3),
+    )
+
+
+def normalize_sex(value: Any) -> Optional[str]:
+    text = str(value or "").lower()
+    female, male = "female" in text, bool(re.search(r"\bmale\b", text))
+    if text in ("all", "both") or (female and male):
+        return "all"
+    if female:
+        return "female"
+    return "male" if male else None
+
+
+def criteria_terms(criteria: Iterable[Any]) -> List[str]:
+    terms = {}
+    for criterion in criteria:
+        for term in TERM_PATTERN.findall(str(criterion or "").lower()):
+            if term not in STOPWORDS and not term.isdigit():
+                terms.setdefault(term.strip("-"), None)
+    return [term for term in terms if term][:MAX_TERMS]
+
+
+def split_ctgov_criteria(criteria: str) -> tuple:
+    parts = re.split(r"exclusion criteria\W*", criteria or "", maxsplit=1, flags=re.I)
+    inclusion = re.sub(r"inclusion criteria\W*", "", parts[0], flags=re.I)
+    return inclusion, parts[1] if len(parts) > 1 else ""
+
+
+def eu_eligibility(trial: Dict[str, Any], extracted: Dict[str, Any]) -> Dict[str, Any]:
+    details = extracted.get("trial_details", {}) if extracted else {}
+    min_age, max_age = eu_age_range(safe_extract(trial, "ageGroup"))
+    conditions = safe_extract(trial, "conditions", default="")
+    return {
+        "trial_id": trial["ctNumber"],
+        "source": "eu",
+        "title": safe_extract(trial, "ctTitle"),
+        "status": safe_extract(trial, "ctStatus"),
+        "conditions": (
+            ", ".join(conditions) if isinstance(conditions, list) else conditions
+        ),
+        "min_age": min_age,
+        "max_age": max_age,
+        "sex": normalize_sex(safe_extract(trial, "gender")),
+        # CTIS does not publish a healthy-volunteer flag in a structured field
+        "healthy_volunteers": None,
+        "last_updated": safe_extract(trial, "lastUpdated"),
+        "inclusion": criteria_terms(details.get("inclusion_criteria", [])),
+        "exclusion": criteria_terms(details.get("exclusion_criteria", [])),
+    }
+
+
+def ctgov_eligibility(study: Dict[str, Any]) -> Dict[str, Any]:
+    protocol = study.get("protocolSection", {})
+    identification = protocol.get("identificationModule", {})
+    eligibility = protocol.get("eligibilityModule", {})
+    inclusion, exclusion = split_ctgov_criteria(eligibility.get("criteria", ""))
+    healthy = eligibility.get("healthyVolunteers")
+    return {
+        "trial_id": identification.get("nctId"),
+        "source": "ctgov",
+        "title": identification.get("officialTitle")
+        or identification.get("briefTitle"),
+        "status": protocol.get("statusModule", {}).get("overallStatus"),
+        "conditions": ", ".join(
+            protocol.get("conditionsModule", {}).get("conditions", [])
+        ),
+        "min_age": age_in_years(eligibility.get("minimumAge")),
+        "max_age": age_in_years(eligibility.get("maximumAge")),
+        "sex": normalize_sex(eligibility.get("sex")),
+        "healthy_volunteers": None if healthy is None else int(bool(healthy)),
+        "last_updated": protocol.get("statusModule", {})
+        .get("lastUpdatePostDateStruct", {})
+        .get("date"),
+        "inclusion": criteria_terms(inclusion.splitlines()),
+        "exclusion": criteria_terms(exclusion.splitlines()),
+    }
+
+
+##############################################################################
+# ingest
+
+TRIAL_COLUMNS = [
+    "trial_id",
+    "source",
+    "title",
+    "status",
+    "conditions",
+    "min_age",
+    "max_age",
+    "sex",
+    "healthy_volunteers",
+    "last_updated",
+]
+
+
+def store(connection: sqlite3.Connection, entries: List[Dict[str, Any]]) -> None:
+    indexed_at = datetime.now(timezone.utc).isoformat()
+    ids = [(entry["trial_id"],) for entry in entries]
+    with connection:
+        connection.executemany("DELETE FROM terms WHERE trial_id = ?", ids)
+        connection.executemany(
+            f"INSERT OR REPLACE INTO trials VALUES ({', '.join('?' * (len(TRIAL_COLUMNS) + 1))})",
+            [[entry[c] for c in TRIAL_COLUMNS] + [indexed_at] for entry in entries],
+        )
+        connection.executemany(
+            "INSERT INTO terms VALUES (?, ?, ?)",
+            [
+                (entry["trial_id"], kind, term)
+                for entry in entries
+                for kind in ("inclusion", "exclusion")
+                for term in entry[kind]
+            ],
+        )
+
+
+def eu_entry(trial: Dict[str, Any]) -> Dict[str, Any]:
+    return eu_eligibility(trial, extract_cro_data(ctis_retrieve(trial["ctNumber"])))
+
+
+def index_trials(
+    search_terms: str,
+    path: Optional[str] = None,
+    sources: str = "both",
+    max_trials: int = 1000,
+    condition: str = "",
+    location: str = "",
+    sponsor: str = "",
+    status: int = 4,
+) -> Dict[str, Any]:
+    """Pages through the registries like export_trials and indexes each trial's eligibility."""
+    connection = connect(path)
+    counts, errors = {}, {}
+    try:
+        if sources in ("both", "eu"):
+            counts["eu"] = 0
+            try:
+                with ThreadPoolExecutor(ELIGIBILITY_INDEX_WORKERS) as pool:
+                    for batch in batched(
+                        iter_eu_trials(
+                            eu_search_criteria(
+                                search_terms, status, condition, sponsor
+                            ),
+                            max_trials,
+                        )
+                    ):
+                        entries = list(pool.map(eu_entry, batch))
+                        store(connection, entries)
+                        counts["eu"] += len(entries)
+            except Exception as e:
+                errors["eu"] = str(e)
+        if sources in ("both", "ctgov"):
+            counts["ctgov"] = 0
+            try:
+                studies = iter_ctgov_studies(
+                    ctgov_search_params(
+                        search_terms,
+                        CTGOV_EXPORT_PAGE_SIZE,
+                        condition,
+                        location,
+                        sponsor,
+                        CTGOV_STATUSES.get(status, "COMPLETED"),
+                    ),
+                    max_trials,
+                )
+                for batch in batched(studies):
+                    entries = [ctgov_eligibility(study) for study in batch]
+                    store(connection, [e for e in entries if e["trial_id"]])
+                    counts["ctgov"] += len(entries)
+            except Exception as e:
+                errors["ctgov"] = str(e)
+    finally:
+        connection.close()
+    return {"counts": counts, "errors": errors}
+
+
+def index_mirror(
+    path: Optional[str] = None, mirror_path: Optional[str] = None
+) -> Dict[str, Any]:
+    """Indexes every trial of the offline CTIS mirror that changed since it was last indexed."""
+    mirror = connect_mirror(mirror_path)
+    connection = connect(path)
+    stats = {"seen": 0, "indexed": 0}
+    try:
+        indexed = dict(
+            connection.execute(
+                "SELECT trial_id, last_updated FROM trials WHERE source = 'eu'"
+            ).fetchall()
+        )
+        rows = mirror.execute(
+            "SELECT ct_number, last_updated, search_record, extracted FROM trials"
+        )
+        entries = []
+        for ct_number, last_updated, search_record, extracted in rows:
+            stats["seen"] += 1
+            if ct_number in indexed and indexed[ct_number] == last_updated:
+                continue
+            entries.append(eu_eligibility(unpack(search_record), unpack(extracted)))
+            if len(entries) >= 500:
+                store(connection, entries)
+                stats["indexed"] += len(entries)
+                entries = []
+        store(connection, entries)
+        stats["indexed"] += len(entries)
+    finally:
+        mirror.close()
+        connection.close()
+    return stats
+
+
+def batched(items: Iterable[Any], size: int = 100) -> Iterable[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+##############################################################################
+# matching
+
+
+def phrase_tokens(phrase: str) -> List[str]:
+    return [t for t in TERM_PATTERN.findall(phrase.lower()) if t not in STOPWORDS]
+
+
+def trials_with_terms(
+    connection: sqlite3.Connection, kind: str, phrases: List[str]
+) -> set:
+    """Trials whose kind criteria mention every word of at least one phrase."""
+    trial_ids = set()
+    for tokens in filter(None, map(phrase_tokens, phrases)):
+        tokens = sorted(set(tokens))
+        trial_ids.update(
+            row[0]
+            for row in connection.execute(
+                f"SELECT trial_id FROM terms WHERE kind = ? AND term IN ({','.join('?' * len(tokens))}) "
+                "GROUP BY trial_id HAVING COUNT(DISTINCT term) = ?",
+                [kind, *tokens, len(tokens)],
+            )
+        )
+    return trial_ids
+
+
+def match_trials(
+    age: Optional[float] = None,
+    sex: Optional[str] = None,
+    condition: str = "",
+    healthy_volunteer: bool = False,
+    patient_terms: Optional[List[str]] = None,
+    source: str = "both",
+    max_results: int = 25,
+    path: Optional[str] = None,
+) -> Dict[str, Any]:
+    clauses, args = [], []
+    if age is not None:
+        clauses.append(
+            "(min_age IS NULL OR min_age <= ?) AND (max_age IS NULL OR max_age >= ?)"
+        )
+        args.extend([age, age])
+    sex = normalize_sex(sex)
+    if sex in ("female", "male"):
+        clauses.append("(sex IS NULL OR sex IN ('all', ?))")
+        args.append(sex)
+    if healthy_volunteer:
+        clauses.append("(healthy_volunteers IS NULL OR healthy_volunteers = 1)")
+    if source in ("eu", "ctgov"):
+        clauses.append("source = ?")
+        args.append(source)
+    patient_terms = [t for t in patient_terms or [] if t.strip()]
+    with span("eligibility.match"):
+        connection = connect(path)
+        try:
+            if condition:
+                condition_ids = trials_with_terms(connection, "inclusion", [condition])
+                tokens = phrase_tokens(condition) or [condition.lower()]
+                clauses.append(
+                    "("
+                    + " AND ".join(
+                        ["lower(conditions || ' ' || title) LIKE ?"] * len(tokens)
+                    )
+                    + f" OR trial_id IN ({','.join('?' * len(condition_ids))}))"
+                )
+                args.extend([f"%{t}%" for t in tokens] + sorted(condition_ids))
+            where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+            candidates = connection.execute(
+                f"SELECT {', '.join(TRIAL_COLUMNS)} FROM trials {where} "
+                "ORDER BY last_updated DESC, trial_id",
+                args,
+            ).fetchall()
+            excluded = trials_with_terms(connection, "exclusion", patient_terms)
+            supported = trials_with_terms(connection, "inclusion", patient_terms)
+            total = connection.execute("SELECT COUNT(*) FROM trials").fetchone()[0]
+        finally:
+            connection.close()
+    matches = [
+        dict(zip(TRIAL_COLUMNS, row)) for row in candidates if row[0] not in excluded
+    ]
+    # trials whose inclusion criteria name the patient's features come first
+    matches.sort(key=lambda m: m["trial_id"] not in supported)
+    set_attributes(indexed=total, candidates=len(candidates), matches=len(matches))
+    return {
+        "indexed": total,
+        "matches": matches[:max_results],
+        "total_matches": len(matches),
+        "excluded": len(candidates) - len(matches),
+        "supported": supported,
+    }
+
+
+def format_age(value: float) -> str:
+    return f"{int(value)}" if value >= 1 else f"{int(value * 12)} mo"
+
+
+def format_ages(min_age: Optional[float], max_age: Optional[float]) -> str:
+    if min_age is None and max_age is None:
+        return "any"
+    if max_age is None:
+        return f"{format_age(min_age)}+"
+    return f"{format_age(min_age or 0)}-{format_age(max_age)}"
+
+
+def format_matches(result: Dict[str, Any]) -> str:
+    if not result["indexed"]:
+        return "The eligibility index is empty. Build it with the index_trial_eligibility tool or `python eligibility_.py index`.\n"
+    out = f"# {result['total_matches']} of {result['indexed']} indexed trials could enroll this patient\n\n"
+    if result["excluded"]:
+        out += f"{result['excluded']} otherwise matching trials were left out because their exclusion criteria mention the patient's conditions.\n\n"
+    if not result["matches"]:
+        return out
+    out += "| Trial | Status | Ages | Sex | Conditions | Title |\n|---|---|---|---|---|---|\n"
+    for m in result["matches"]:
+        marker = " ✓" if m["trial_id"] in result["supported"] else ""
+        out += (
+            f"| {m['trial_id']}{marker} | {m['status'] or '-'} | {format_ages(m['min_age'], m['max_age'])} "
+            f"| {m['sex'] or '-'} | {(m['conditions'] or '-')[:60]} | {(m['title'] or '-')[:80]} |\n"
+        )
+    if result["supported"]:
+        out += "\n✓ inclusion criteria mention the patient's conditions.\n"
+    out += "\nEligibility is matched on structured fields and criteria keywords only; confirm with fetch_trial before contacting a site.\n"
+    return out
+
+
+def format_index_summary(index: Dict[str, Any]) -> str:
+    counts = ", ".join(f"{n} {source}" for source, n in index["counts"].items())
+    result = f"Indexed the eligibility of {sum(index['counts'].values())} trials ({counts}).\n"
+    for source, error in index["errors"].items():
+        result += f"*Indexing {source} stopped early after {index['counts'][source]} trials: {error}*\n"
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Eligibility index for patient matching."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    index = commands.add_parser("index", help="Index trials from the live registries")
+    index.add_argument("search_terms")
+    index.add_argument("--sources", choices=["both", "eu", "ctgov"], default="both")
+    index.add_argument("--max-trials", type=int, default=1000)
+    index.add_argument("--condition", default="")
+    index.add_argument("--location", default="")
+    index.add_argument("--sponsor", default="")
+    index.add_argument("--status", type=int, default=4)
+    mirror = commands.add_parser("mirror", help="Index the offline CTIS mirror")
+    mirror.add_argument("--mirror-file", default=CTIS_MIRROR_FILE)
+    match = commands.add_parser("match", help="Find trials a patient could join")
+    match.add_argument("--age", type=float)
+    match.add_argument("--sex", choices=["female", "male"])
+    match.add_argument("--condition", default="")
+    match.add_argument("--healthy-volunteer", action="store_true")
+    match.add_argument("--patient-terms", nargs="*", default=[])
+    match.add_argument("--max-results", type=int, default=25)
+    for command in (index, mirror, match):
+        command.add_argument("--file", default=ELIGIBILITY_INDEX_FILE)
+    args = parser.parse_args()
+    if args.command == "index":
+        print(
+            format_index_summary(
+                index_trials(
+                    args.search_terms,
+                    path=args.file,
+                    sources=args.sources,
+                    max_trials=args.max_trials,
+                    condition=args.condition,
+                    location=args.location,
+                    sponsor=args.sponsor,
+                    status=args.status,
+                )
+            )
+        )
+    elif args.command == "mirror":
+        print(json.dumps(index_mirror(args.file, args.mirror_file)))
+    else:
+        print(
+            format_matches(
+                match_trials(
+                    age=args.age,
+                    sex=args.sex,
+                    condition=args.condition,
+                    healthy_volunteer=args.healthy_volunteer,
+                    patient_terms=args.patient_terms,
+                    max_results=args.max_results,
+                    path=args.file,
+                )
+            )
+        )
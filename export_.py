@@ -0,0 +1,264 @@
+from parsers_ import (
+    eu_trial_record,
+    ctgov_study_record,
+    TRIAL_RECORD_FIELDS,
+    TRIAL_RECORD_LIST_FIELDS,
+)
+from registries_ import (
+    ctis_search,
+    ctgov_studies,
+    eu_search_criteria,
+    ctgov_search_params,
+)
+from typing import Dict, Any, Iterator, Optional
+from datetime import datetime, timezone
+import argparse
+import csv
+import json
+import os
+import re
+
+##############################################################################
+# bulk export of normalized trial records; pages are streamed straight to the
+# output file so memory stays at one registry page (plus one parquet row group)
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+EXPORT_FORMATS = ["jsonl", "csv", "parquet"]
+EU_EXPORT_PAGE_SIZE = 20
+CTGOV_EXPORT_PAGE_SIZE = 100
+PARQUET_ROW_GROUP_SIZE = 5000
+
+
+def iter_eu_trials(criteria: Dict[str, Any], max_trials: int) -> Iterator[Dict]:
+    page, exported = 1, 0
+    while exported < max_trials:
+        data = ctis_search(
+            {
+                "pagination": {"page": page, "size": EU_EXPORT_PAGE_SIZE},
+                "sort": {"property": "decisionDate", "direction": "DESC"},
+                "searchCriteria": criteria,
+            }
+        )
+        trials = [t for t in data.get("data", []) if "ctNumber" in t]
+        for trial in trials[: max_trials - exported]:
+            yield trial
+            exported += 1
+        if not trials or not data.get("pagination", {}).get("nextPage"):
+            break
+        page += 1
+
+
+def iter_eu_records(criteria: Dict[str, Any], max_trials: int) -> Iterator[Dict]:
+    for trial in iter_eu_trials(criteria, max_trials):
+        yield eu_trial_record(trial)
+
+
+def iter_ctgov_studies(params: Dict[str, Any], max_trials: int) -> Iterator[Dict]:
+    page_token, exported = "", 0
+    while exported < max_trials:
+        data = ctgov_studies(
+            dict(params, pageToken=page_token) if page_token else params
+        )
+        studies = data.get("studies", [])
+        for study in studies[: max_trials - exported]:
+            yield study
+            exported += 1
+        page_token = data.get("nextPageToken", "")
+        if not studies or not page_token:
+            break
+
+
+def iter_ctgov_records(params: Dict[str, Any], max_trials: int) -> Iterator[Dict]:
+    for study in iter_ctgov_studies(params, max_trials):
+        yield ctgov_study_record(study)
+
+
+class JSONLWriter:
+    def __init__(self, path: str):
+        self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class CSVWriter:
+    def __init__(self, path: str):
+        self.file = open(path, "w", encoding="utf-8", newline="")
+        self.writer = csv.DictWriter(self.file, TRIAL_RECORD_FIELDS)
+        self.writer.writeheader()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self.writer.writerow(
+            {
+                k: "; ".join(v) if k in TRIAL_RECORD_LIST_FIELDS else v
+                for k, v in record.items()
+            }
+        )
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError(
+                "parquet export needs pyarrow (pip install pyarrow); use jsonl or csv instead"
+            )
+        self.pa = pa
+        types = {"enrollment": pa.int64(), "has_results": pa.bool_()}
+        self.schema = pa.schema(
+            [
+                (
+                    field,
+                    (
+                        pa.list_(pa.string())
+                        if field in TRIAL_RECORD_LIST_FIELDS
+                        else types.get(field, pa.string())
+                    ),
+                )
+                for field in TRIAL_RECORD_FIELDS
+            ]
+        )
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+        self.rows = []
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self.rows.append(record)
+        if len(self.rows) >= PARQUET_ROW_GROUP_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.rows:
+            self.writer.write_table(
+                self.pa.Table.from_pylist(self.rows, schema=self.schema)
+            )
+            self.rows = []
+
+    def close(self) -> None:
+        self.flush()
+        self.writer.close()
+
+
+WRITERS = {"jsonl": JSONLWriter, "csv": CSVWriter, "parquet": ParquetWriter}
+
+
+def default_export_path(query: str, file_format: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "-", query.lower()).strip("-")[:40] or "trials"
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return os.path.join(EXPORT_DIR, f"{slug}-{stamp}.{file_format}")
+
+
+def export_trials(
+    search_terms: str,
+    path: Optional[str] = None,
+    file_format: str = "jsonl",
+    sources: str = "both",
+    max_trials: int = 1000,
+    condition: str = "",
+    location: str = "",
+    sponsor: str = "",
+    status: int = 8,
+) -> Dict[str, Any]:
+    if file_format not in WRITERS:
+        raise ValueError(
+            f"unknown export format {file_format}; use one of {EXPORT_FORMATS}"
+        )
+    path = path or default_export_path(search_terms, file_format)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    streams = []
+    if sources in ("both", "eu"):
+        streams.append(
+            (
+                "eu",
+                iter_eu_records(
+                    eu_search_criteria(search_terms, status, condition, sponsor),
+                    max_trials,
+                ),
+            )
+        )
+    if sources in ("both", "ctgov"):
+        streams.append(
+            (
+                "ctgov",
+                iter_ctgov_records(
+                    ctgov_search_params(
+                        search_terms,
+                        CTGOV_EXPORT_PAGE_SIZE,
+                        condition,
+                        location,
+                        sponsor,
+                    ),
+                    max_trials,
+                ),
+            )
+        )
+    tmp_path = f"{path}.tmp"
+    writer = WRITERS[file_format](tmp_path)
+    counts, errors = {}, {}
+    try:
+        for source, records in streams:
+            counts[source] = 0
+            try:
+                for record in records:
+                    writer.write(record)
+                    counts[source] += 1
+            except Exception as e:
+                errors[source] = str(e)
+    finally:
+        writer.close()
+    os.replace(tmp_path, path)
+    return {
+        "path": path,
+        "format": file_format,
+        "counts": counts,
+        "errors": errors,
+        "bytes": os.path.getsize(path),
+    }
+
+
+def format_export_summary(export: Dict[str, Any]) -> str:
+    total = sum(export["counts"].values())
+    counts = ", ".join(f"{n} {source}" for source, n in export["counts"].items())
+    result = f"Exported {total} trials ({counts}) to {export['path']} ({export['format']}, {export['bytes']:,} bytes).\n"
+    result += f"Columns: {', '.join(TRIAL_RECORD_FIELDS)}.\n"
+    for source, error in export["errors"].items():
+        result += f"*Export from {source} stopped early after {export['counts'][source]} trials: {error}*\n"
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export normalized trial records from both registries to JSONL, CSV or Parquet."
+    )
+    parser.add_argument("search_terms")
+    parser.add_argument("--out", help="Output file (default: a new file in EXPORT_DIR)")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="jsonl")
+    parser.add_argument("--sources", choices=["both", "eu", "ctgov"], default="both")
+    parser.add_argument("--max-trials", type=int, default=1000)
+    parser.add_argument("--condition", default="")
+    parser.add_argument("--location", default="")
+    parser.add_argument("--sponsor", default="")
+    parser.add_argument("--status", type=int, default=8)
+    args = parser.parse_args()
+    print(
+        format_export_summary(
+            export_trials(
+                args.search_terms,
+                path=args.out,
+                file_format=args.format,
+                sources=args.sources,
+                max_trials=args.max_trials,
+                condition=args.condition,
+                location=args.location,
+                sponsor=args.sponsor,
+                status=args.status,
+            )
+        )
+    )
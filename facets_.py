@@ -0,0 +1,178 @@
+from export_ import iter_eu_records, iter_ctgov_records
+from registries_ import eu_search_criteria, ctgov_search_params, CTGOV_STATUSES
+from tracing_ import span, set_attributes
+from collections import Counter
+from typing import Dict, Any, Iterable, List, Optional
+import argparse
+import json
+import re
+
+##############################################################################
+# facet counts over every trial matching a search: records are streamed page
+# by page and only the counters are kept, so memory grows with the number of
+# distinct values, not with the number of trials. No LLM is involved
+
+FACETS = ["status", "phase", "sponsor_type", "country", "start_year"]
+# sponsor names are nearly unique per trial, so they are only counted on request
+OPTIONAL_FACETS = ["sponsor"]
+# the largest page ClinicalTrials.gov serves; only the fields facets read are requested
+CTGOV_FACET_PAGE_SIZE = 1000
+CTGOV_FACET_FIELDS = [
+    "NCTId",
+    "OverallStatus",
+    "Phase",
+    "LeadSponsorName",
+    "LeadSponsorClass",
+    "LocationCountry",
+    "StartDate",
+]
+NOT_REPORTED = "(not reported)"
+YEAR_PATTERN = re.compile(r"\b(19|20)\d{2}\b")
+
+
+def facet_values(record: Dict[str, Any], facet: str) -> List[str]:
+    """The values a normalized trial record counts under for one facet."""
+    if facet == "country":
+        values = record["countries"]
+    elif facet == "start_year":
+        match = YEAR_PATTERN.search(record["start_date"] or "")
+        values = [match.group(0)] if match else []
+    elif facet == "phase" and record["source"] == "ctgov":
+        # CT.gov lists the phases of a phase 1/2 trial separately
+        values = (record["phase"] or "").split(", ")
+    else:
+        values = [record[facet]]
+    values = [str(v).strip() for v in values if v and str(v).strip()]
+    return list(dict.fromkeys(values)) or [NOT_REPORTED]
+
+
+def count_facets(
+    records: Iterable[Dict[str, Any]], facets: List[str], counted: Dict[str, Any]
+) -> None:
+    """Adds records to counted in place, so a failed page keeps the counts before it."""
+    for record in records:
+        counted["trials"] += 1
+        for facet in facets:
+            counted["counts"][facet].update(facet_values(record, facet))
+
+
+def aggregate_facets(
+    search_terms: str,
+    sources: str = "both",
+    max_trials: int = 10000,
+    condition: str = "",
+    location: str = "",
+    sponsor: str = "",
+    status: int = 8,
+    facets: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    facets = facets or FACETS
+    unknown = [f for f in facets if f not in FACETS + OPTIONAL_FACETS]
+    if unknown:
+        raise ValueError(
+            f"unknown facets {unknown}; use any of {FACETS + OPTIONAL_FACETS}"
+        )
+    streams = []
+    if sources in ("both", "eu"):
+        streams.append(
+            (
+                "eu",
+                lambda: iter_eu_records(
+                    eu_search_criteria(search_terms, status, condition, sponsor),
+                    max_trials,
+                ),
+            )
+        )
+    if sources in ("both", "ctgov"):
+        params = ctgov_search_params(
+            search_terms,
+            CTGOV_FACET_PAGE_SIZE,
+            condition,
+            location,
+            sponsor,
+            CTGOV_STATUSES.get(status, "COMPLETED"),
+        )
+        params["fields"] = ",".join(CTGOV_FACET_FIELDS)
+        streams.append(("ctgov", lambda: iter_ctgov_records(params, max_trials)))
+    result = {"facets": facets, "sources": {}, "errors": {}}
+    for source, records in streams:
+        counted = {"trials": 0, "counts": {f: Counter() for f in facets}}
+        with span(f"facets.{source}"):
+            try:
+                count_facets(records(), facets, counted)
+            except Exception as e:
+                result["errors"][source] = str(e)
+            set_attributes(trials=counted["trials"])
+        counted["truncated"] = counted["trials"] >= max_trials
+        result["sources"][source] = counted
+    return result
+
+
+def format_facets(result: Dict[str, Any], top_values: int = 15) -> str:
+    sources = list(result["sources"])
+    names = {"eu": "EU", "ctgov": "CT.gov"}
+    totals = ", ".join(
+        f"{result['sources'][s]['trials']} {names[s]}"
+        + (" (max_trials reached)" if result["sources"][s]["truncated"] else "")
+        for s in sources
+    )
+    output = f"# Facet counts\n\nTrials counted: {totals}.\n"
+    output += "Registries use their own status, phase and sponsor-type vocabularies; each is counted as reported. Countries count a trial once per country.\n"
+    for facet in result["facets"]:
+        combined = Counter()
+        for source in sources:
+            combined.update(result["sources"][source]["counts"][facet])
+        output += f"\n## {facet.replace('_', ' ').title()}\n\n"
+        output += "| Value | " + " | ".join(names[s] for s in sources) + " | Total |\n"
+        output += "|---" * (len(sources) + 2) + "|\n"
+        # years read best in order, everything else by count
+        if facet == "start_year":
+            rows = sorted(combined.items(), reverse=True)
+        else:
+            rows = combined.most_common()
+        for value, total in rows[:top_values]:
+            cells = " | ".join(
+                str(result["sources"][s]["counts"][facet][value]) for s in sources
+            )
+            output += f"| {value} | {cells} | {total} |\n"
+        if len(rows) > top_values:
+            rest = sum(total for _, total in rows[top_values:])
+            output += (
+                f"\n*{len(rows) - top_values} more values ({rest} counts) not shown.*\n"
+            )
+    for source, error in result["errors"].items():
+        output += f"\n*Counting {names[source]} trials stopped early after {result['sources'][source]['trials']} trials: {error}*\n"
+    return output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Count trials matching a search by status, phase, sponsor type, country and start year."
+    )
+    parser.add_argument("search_terms")
+    parser.add_argument("--sources", choices=["both", "eu", "ctgov"], default="both")
+    parser.add_argument("--max-trials", type=int, default=10000)
+    parser.add_argument("--condition", default="")
+    parser.add_argument("--location", default="")
+    parser.add_argument("--sponsor", default="")
+    parser.add_argument("--status", type=int, default=8)
+    parser.add_argument(
+        "--facets", nargs="+", choices=FACETS + OPTIONAL_FACETS, default=FACETS
+    )
+    parser.add_argument("--top-values", type=int, default=15)
+    parser.add_argument("--json", action="store_true", help="Print raw counts")
+    args = parser.parse_args()
+    result = aggregate_facets(
+        args.search_terms,
+        sources=args.sources,
+        max_trials=args.max_trials,
+        condition=args.condition,
+        location=args.location,
+        sponsor=args.sponsor,
+        status=args.status,
+        facets=args.facets,
+    )
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(format_facets(result, args.top_values))
@@ -0,0 +1,284 @@
+from typing import Dict, Any, List, Tuple, Optional
+from difflib import SequenceMatcher
+import argparse
+import json
+import re
+
+##############################################################################
+# cross-registry trial linking (EU CTIS <-> ClinicalTrials.gov)
+
+NCT_PATTERN = re.compile(r"NCT\d{8}")
+EU_ID_PATTERN = re.compile(r"\b\d{4}-\d{6}-\d{2}(?:-\d{2})?\b")
+PHASE_PATTERN = re.compile(r"phase\s*(iv|i{1,3}|[1-4])\b", re.IGNORECASE)
+ROMAN_PHASES = {"i": 1, "ii": 2, "iii": 3, "iv": 4}
+
+TITLE_STOPWORDS = set(
+    "a an and as at by for from in into of on or the to versus vs with "
+    "without study trial clinical randomized randomised multicenter "
+    "multicentre open label double blind placebo controlled participants "
+    "patients subjects evaluate evaluating assess assessing efficacy safety "
+    "phase compared comparing".split()
+)
+SPONSOR_STOPWORDS = set(
+    "inc incorporated ltd limited llc gmbh ag sa sas bv nv spa srl plc co "
+    "corp corporation company kg ab as oy the and of pharma pharmaceuticals "
+    "pharmaceutical international group holding holdings".split()
+)
+
+STRONG_TITLE_MATCH = 0.85
+TITLE_MATCH = 0.6
+SPONSOR_MATCH = 0.5
+
+
+def normalize_tokens(text: str, stopwords: set) -> set:
+    tokens = re.findall(r"[a-z0-9]+", (text or "").lower())
+    return {t for t in tokens if t not in stopwords and len(t) > 1}
+
+
+def extract_phases(*texts: str) -> set:
+    phases = set()
+    for text in texts:
+        for match in PHASE_PATTERN.findall(str(text or "")):
+            match = match.lower()
+            phases.add(ROMAN_PHASES.get(match) or int(match))
+    return phases
+
+
+def find_ids(value: Any, pattern: re.Pattern) -> set:
+    if isinstance(value, str):
+        return set(pattern.findall(value))
+    if isinstance(value, dict):
+        return set().union(*(find_ids(v, pattern) for v in value.values()))
+    if isinstance(value, list):
+        return set().union(*(find_ids(v, pattern) for v in value))
+    return set()
+
+
+def eu_link_record(trial: Dict[str, Any]) -> Dict[str, Any]:
+    titles = [trial.get("ctTitle"), trial.get("shortTitle")]
+    return {
+        "id": trial.get("ctNumber"),
+        "titles": [t for t in titles if t],
+        "sponsor": trial.get("sponsor") or "",
+        "acronym": trial.get("shortTitle") or "",
+        "phases": extract_phases(trial.get("trialPhase")),
+        "ids": find_ids(trial, NCT_PATTERN),
+    }
+
+
+def ct_gov_link_record(study: Dict[str, Any]) -> Dict[str, Any]:
+    protocol = study.get("protocolSection", {})
+    identification = protocol.get("identificationModule", {})
+    secondary_ids = [
+        info.get("id", "") for info in identification.get("secondaryIdInfos", [])
+    ]
+    secondary_ids.append(identification.get("orgStudyIdInfo", {}).get("id", ""))
+    titles = [
+        identification.get("officialTitle"),
+        identification.get("briefTitle"),
+        identification.get("acronym"),
+    ]
+    return {
+        "id": identification.get("nctId"),
+        "titles": [t for t in titles if t],
+        "sponsor": protocol.get("sponsorCollaboratorsModule", {})
+        .get("leadSponsor", {})
+        .get("name", ""),
+        "acronym": identification.get("acronym") or "",
+        "phases": extract_phases(
+            *[
+                p.replace("PHASE", "phase ")
+                for p in protocol.get("designModule", {}).get("phases", [])
+            ]
+        ),
+        "ids": find_ids(secondary_ids, EU_ID_PATTERN),
+    }
+
+
+def title_similarity(titles_a: List[str], titles_b: List[str]) -> float:
+    best = 0.0
+    for a in titles_a:
+        tokens_a = normalize_tokens(a, TITLE_STOPWORDS)
+        for b in titles_b:
+            if a.strip().lower() == b.strip().lower():
+                return 1.0
+            tokens_b = normalize_tokens(b, TITLE_STOPWORDS)
+            if not tokens_a or not tokens_b:
+                continue
+            jaccard = len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+            ratio = SequenceMatcher(
+                None, " ".join(sorted(tokens_a)), " ".join(sorted(tokens_b))
+            ).ratio()
+            best = max(best, (jaccard + ratio) / 2)
+    return best
+
+
+def acronyms_conflict(acronym_a: str, acronym_b: str) -> bool:
+    tokens_a = normalize_tokens(acronym_a, set())
+    tokens_b = normalize_tokens(acronym_b, set())
+    if not tokens_a or not tokens_b:
+        return False
+    return not (tokens_a <= tokens_b or tokens_b <= tokens_a)
+
+
+def sponsor_similarity(sponsor_a: str, sponsor_b: str) -> float:
+    tokens_a = normalize_tokens(sponsor_a, SPONSOR_STOPWORDS)
+    tokens_b = normalize_tokens(sponsor_b, SPONSOR_STOPWORDS)
+    if not tokens_a or not tokens_b:
+        return 0.0
+    return len(tokens_a & tokens_b) / min(len(tokens_a), len(tokens_b))
+
+
+class TrialLinkIndex:
+    def __init__(self, ct_gov_records: List[Dict[str, Any]]):
+        self.records = {r["id"]: r for r in ct_gov_records if r["id"]}
+        self.by_secondary_id: Dict[str, str] = {}
+        self.by_token: Dict[str, set] = {}
+        for record in self.records.values():
+            for secondary_id in record["ids"]:
+                self.by_secondary_id[secondary_id] = record["id"]
+            for title in record["titles"]:
+                for token in normalize_tokens(title, TITLE_STOPWORDS):
+                    self.by_token.setdefault(token, set()).add(record["id"])
+
+    def candidates(self, eu_record: Dict[str, Any]) -> set:
+        counts: Dict[str, int] = {}
+        for title in eu_record["titles"]:
+            for token in normalize_tokens(title, TITLE_STOPWORDS):
+                for nct_id in self.by_token.get(token, ()):
+                    counts[nct_id] = counts.get(nct_id, 0) + 1
+        return {nct_id for nct_id, count in counts.items() if count >= 2}
+
+    def match(self, eu_record: Dict[str, Any]) -> List[Tuple[str, float, str]]:
+        matches = []
+        for nct_id in eu_record["ids"]:
+            if nct_id in self.records:
+                matches.append((nct_id, 1.0, "secondary_id"))
+        if eu_record["id"] in self.by_secondary_id:
+            matches.append((self.by_secondary_id[eu_record["id"]], 1.0, "secondary_id"))
+        if matches:
+            return matches
+        for nct_id in self.candidates(eu_record):
+            record = self.records[nct_id]
+            if eu_record["phases"] and record["phases"]:
+                if not eu_record["phases"] & record["phases"]:
+                    continue
+            if acronyms_conflict(eu_record["acronym"], record["acronym"]):
+                continue
+            title_sim = title_similarity(eu_record["titles"], record["titles"])
+            sponsor_sim = sponsor_similarity(eu_record["sponsor"], record["sponsor"])
+            if title_sim >= STRONG_TITLE_MATCH or (
+                title_sim >= TITLE_MATCH and sponsor_sim >= SPONSOR_MATCH
+            ):
+                matches.append((nct_id, title_sim, "fuzzy"))
+        return matches
+
+
+def link_trials(
+    eu_trials: List[Dict[str, Any]], ct_studies: List[Dict[str, Any]]
+) -> List[Tuple[str, str, float, str]]:
+    index = TrialLinkIndex([ct_gov_link_record(s) for s in ct_studies])
+    scored = []
+    for trial in eu_trials:
+        eu_record = eu_link_record(trial)
+        for nct_id, score, method in index.match(eu_record):
+            scored.append((eu_record["id"], nct_id, score, method))
+    scored.sort(key=lambda link: -link[2])
+    links, used_eu, used_nct = [], set(), set()
+    for eu_id, nct_id, score, method in scored:
+        if eu_id in used_eu or nct_id in used_nct:
+            continue
+        used_eu.add(eu_id)
+        used_nct.add(nct_id)
+        links.append((eu_id, nct_id, score, method))
+    return links
+
+
+def merge_linked_trial(trial: Dict[str, Any], study: Dict[str, Any]) -> Dict[str, Any]:
+    protocol = study.get("protocolSection", {})
+    identification = protocol.get("identificationModule", {})
+    merged = dict(trial)
+    merged["linkedTrialIds"] = trial.get("linkedTrialIds", []) + [
+        identification.get("nctId")
+    ]
+    if not merged.get("conditions"):
+        merged["conditions"] = ", ".join(
+            protocol.get("conditionsModule", {}).get("conditions", [])
+        )
+    if not merged.get("totalNumberEnrolled"):
+        merged["totalNumberEnrolled"] = (
+            protocol.get("designModule", {}).get("enrollmentInfo", {}).get("count")
+        )
+    if not merged.get("resultsFirstReceived") and study.get("hasResults"):
+        merged["resultsFirstReceived"] = "Yes (ClinicalTrials.gov)"
+    if not merged.get("briefSummary"):
+        merged["briefSummary"] = protocol.get("descriptionModule", {}).get(
+            "briefSummary"
+        )
+    return merged
+
+
+def collapse_duplicates(
+    eu_trials: List[Dict[str, Any]], ct_studies: List[Dict[str, Any]]
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Dict[str, List[str]]]:
+    links = link_trials(eu_trials, ct_studies)
+    if not links:
+        return eu_trials, ct_studies, {}
+    studies_by_id = {ct_gov_link_record(s)["id"]: s for s in ct_studies}
+    eu_to_nct = {eu_id: nct_id for eu_id, nct_id, _, _ in links}
+    merged_eu_trials = [
+        (
+            merge_linked_trial(trial, studies_by_id[eu_to_nct[trial.get("ctNumber")]])
+            if trial.get("ctNumber") in eu_to_nct
+            else trial
+        )
+        for trial in eu_trials
+    ]
+    linked_nct_ids = set(eu_to_nct.values())
+    remaining_studies = [
+        s for s in ct_studies if ct_gov_link_record(s)["id"] not in linked_nct_ids
+    ]
+    return (
+        merged_eu_trials,
+        remaining_studies,
+        {eu_id: [nct_id] for eu_id, nct_id in eu_to_nct.items()},
+    )
+
+
+def evaluate_linking(fixture: Dict[str, Any]) -> Dict[str, Any]:
+    predicted = {
+        (eu_id, nct_id)
+        for eu_id, nct_id, _, _ in link_trials(
+            fixture["eu_trials"], fixture["ct_gov_studies"]
+        )
+    }
+    expected = {tuple(pair) for pair in fixture["duplicates"]}
+    true_positives = len(predicted & expected)
+    precision = true_positives / len(predicted) if predicted else 1.0
+    recall = true_positives / len(expected) if expected else 1.0
+    return {
+        "precision": precision,
+        "recall": recall,
+        "f1": (
+            2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        ),
+        "true_positives": true_positives,
+        "false_positives": sorted(predicted - expected),
+        "false_negatives": sorted(expected - predicted),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure cross-registry linking precision/recall on a fixture set."
+    )
+    parser.add_argument("fixture", nargs="?", default="fixtures/linking_fixture.json")
+    args = parser.parse_args()
+    with open(args.fixture, "r", encoding="utf-8") as f:
+        report = evaluate_linking(json.load(f))
+    print(f"precision: {report['precision']:.3f}")
+    print(f"recall:    {report['recall']:.3f}")
+    print(f"f1:        {report['f1']:.3f}")
+    for label in ("false_positives", "false_negatives"):
+        for eu_id, nct_id in report[label]:
+            print(f"{label[:-1].replace('_', ' ')}: {eu_id} <-> {nct_id}")
@@ -0,0 +1,462 @@
+from parsers_ import extract_cro_data
+from registries_ import ctis_search, ctis_search_fresh, ctis_retrieve_if_changed
+from tracing_ import span, set_attributes
+from shared_ import TTLCache
+from compression_ import (
+    Dictionary,
+    compress,
+    decompress,
+    known_dictionary,
+    register,
+    train_dictionary,
+)
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, Optional
+import argparse
+import json
+import logging
+import os
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+##############################################################################
+# offline CTIS mirror: search pages sorted by decisionDate DESC are synced
+# incrementally into SQLite, retrieving only new or changed trials; the raw
+# retrieve body and the extract_cro_data output are stored compressed with
+# dictionaries trained on the mirror's own payloads after the first sync.
+# Incremental syncs stop at the last sync's decision date and so only see new
+# trials; a full pass every CTIS_MIRROR_FULL_SYNC_HOURS compares every
+# trial's lastUpdated to pick up changes to older ones
+
+CTIS_MIRROR_FILE = os.getenv("CTIS_MIRROR_FILE", "ctis_mirror.db")
+# a mirror older than this is ignored and CTIS is queried live (0 never expires)
+CTIS_MIRROR_MAX_AGE_HOURS = float(os.getenv("CTIS_MIRROR_MAX_AGE_HOURS", "48"))
+# syncs run a full pass when the last one is older than this
+CTIS_MIRROR_FULL_SYNC_HOURS = float(os.getenv("CTIS_MIRROR_FULL_SYNC_HOURS", "24"))
+# how long mirror_fresh trusts the last full pass it read, so that serving a
+# search page does not open the database every time
+CTIS_MIRROR_STATE_TTL = float(os.getenv("CTIS_MIRROR_STATE_TTL", "30"))
+MIRROR_SYNC_WORKERS = int(os.getenv("MIRROR_SYNC_WORKERS", "8"))
+MIRROR_PAGE_SIZE = 50
+# SQLite reads pages through a shared memory map instead of copying them per process
+SQLITE_MMAP_BYTES = int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 2**20)))
+
+# CTIS search status codes -> ctStatus values of the search records
+STATUS_NAMES = {
+    1: "authorised",
+    4: "ongoing, recruiting",
+    5: "ongoing, recruitment ended",
+    8: "ended",
+}
+SEARCH_TEXT_FIELDS = [
+    "ctNumber",
+    "ctTitle",
+    "shortTitle",
+    "sponsor",
+    "conditions",
+    "product",
+    "primaryEndPoint",
+    "endPoint",
+    "therapeuticAreas",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    ct_number TEXT PRIMARY KEY,
+    decision_date TEXT,
+    last_updated TEXT,
+    status TEXT,
+    sponsor TEXT,
+    conditions TEXT,
+    search_text TEXT,
+    search_record BLOB,
+    raw BLOB,
+    extracted BLOB,
+    synced_at TEXT
+);
+CREATE INDEX IF NOT EXISTS trials_decision_date ON trials (decision_date);
+CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS dictionaries (
+    id INTEGER PRIMARY KEY,
+    kind TEXT,
+    codec TEXT,
+    data BLOB,
+    created_at TEXT
+);
+"""
+# compressed columns, each with its own dictionary
+PAYLOAD_KINDS = ["search_record", "raw", "extracted"]
+DICTIONARY_SAMPLES = 500
+
+
+def pack(value: Any, dictionary: Optional[Dictionary] = None) -> bytes:
+    if not isinstance(value, bytes):
+        value = json.dumps(value, default=str).encode("utf-8")
+    return compress(value, dictionary)
+
+
+def unpack(blob: bytes) -> Any:
+    return json.loads(decompress(blob))
+
+
+def connect(path: Optional[str] = None) -> sqlite3.Connection:
+    connection = sqlite3.connect(path or CTIS_MIRROR_FILE, timeout=30)
+    connection.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_BYTES}")
+    connection.executescript(SCHEMA)
+    # blobs name the dictionary they were compressed with; load the new ones
+    for (dictionary_id,) in connection.execute("SELECT id FROM dictionaries"):
+        if not known_dictionary(dictionary_id):
+            codec, data = connection.execute(
+                "SELECT codec, data FROM dictionaries WHERE id = ?", (dictionary_id,)
+            ).fetchone()
+            register(Dictionary(codec, data))
+    return connection
+
+
+def get_state(connection: sqlite3.Connection, key: str) -> Optional[str]:
+    row = connection.execute(
+        "SELECT value FROM sync_state WHERE key = ?", (key,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def set_state(connection: sqlite3.Connection, key: str, value: str) -> None:
+    connection.execute(
+        "INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, value)
+    )
+    if key == "last_full_sync_at":
+        last_full_syncs.clear()
+
+
+##############################################################################
+# sync
+
+
+def search_text(record: Dict[str, Any]) -> str:
+    values = []
+    for field in SEARCH_TEXT_FIELDS:
+        value = record.get(field)
+        values.extend(value if isinstance(value, list) else [value])
+    return " ".join(str(v) for v in values if v).lower()
+
+
+def active_dictionaries(
+    connection: sqlite3.Connection,
+) -> Dict[str, Optional[Dictionary]]:
+    dictionaries = {}
+    for kind in PAYLOAD_KINDS:
+        row = connection.execute(
+            "SELECT codec, data FROM dictionaries WHERE id = ?",
+            (get_state(connection, f"dictionary:{kind}"),),
+        ).fetchone()
+        dictionaries[kind] = register(Dictionary(*row)) if row else None
+    return dictionaries
+
+
+def train_dictionaries(connection: sqlite3.Connection) -> Dict[str, Any]:
+    """Trains a dictionary per payload column on a sample of mirrored trials and
+    recompresses every row with it."""
+    stats = {}
+    for kind in PAYLOAD_KINDS:
+        samples = [
+            decompress(blob)
+            for (blob,) in connection.execute(
+                f"SELECT {kind} FROM trials ORDER BY RANDOM() LIMIT ?",
+                (DICTIONARY_SAMPLES,),
+            )
+        ]
+        dictionary = train_dictionary(samples)
+        if dictionary is None:
+            continue
+        before = after = 0
+        with connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO dictionaries VALUES (?, ?, ?, ?, ?)",
+                (
+                    dictionary.id,
+                    kind,
+                    dictionary.codec,
+                    dictionary.data,
+                    datetime.now(timezone.utc).isoformat(),
+                ),
+            )
+            rows = connection.execute(f"SELECT rowid, {kind} FROM trials").fetchall()
+            for rowid, blob in rows:
+                packed = compress(decompress(blob), dictionary)
+                before, after = before + len(blob), after + len(packed)
+                connection.execute(
+                    f"UPDATE trials SET {kind} = ? WHERE rowid = ?", (packed, rowid)
+                )
+            set_state(connection, f"dictionary:{kind}", str(dictionary.id))
+        stats[kind] = {
+            "codec": dictionary.codec,
+            "dictionary_bytes": len(dictionary.data),
+            "bytes_before": before,
+            "bytes_after": after,
+        }
+    return stats
+
+
+def mirror_row(
+    record: Dict[str, Any],
+    synced_at: str,
+    dictionaries: Dict[str, Optional[Dictionary]],
+) -> tuple:
+    body, _ = ctis_retrieve_if_changed(record["ctNumber"])
+    return (
+        record["ctNumber"],
+        record.get("decisionDate"),
+        record.get("lastUpdated"),
+        (record.get("ctStatus") or "").lower(),
+        (record.get("sponsor") or "").lower(),
+        str(record.get("conditions") or "").lower(),
+        search_text(record),
+        pack(record, dictionaries["search_record"]),
+        compress(body, dictionaries["raw"]),
+        pack(extract_cro_data(json.loads(body)), dictionaries["extracted"]),
+        synced_at,
+    )
+
+
+def sync_mirror(
+    path: Optional[str] = None,
+    full: bool = False,
+    max_pages: Optional[int] = None,
+) -> Dict[str, Any]:
+    connection = connect(path)
+    synced_at = datetime.now(timezone.utc).isoformat()
+    last_full = get_state(connection, "last_full_sync_at")
+    full = full or not last_full or older_than(last_full, CTIS_MIRROR_FULL_SYNC_HOURS)
+    watermark = None if full else get_state(connection, "decision_date_watermark")
+    stats = {"pages": 0, "seen": 0, "new": 0, "changed": 0, "failed": 0, "full": full}
+    newest = watermark
+    complete = False
+    page = 1
+    try:
+        dictionaries = active_dictionaries(connection)
+        with ThreadPoolExecutor(MIRROR_SYNC_WORKERS) as pool:
+            while max_pages is None or page <= max_pages:
+                # uncached: a page read earlier in this process may be stale
+                data = ctis_search_fresh(
+                    {
+                        "pagination": {"page": page, "size": MIRROR_PAGE_SIZE},
+                        "sort": {"property": "decisionDate", "direction": "DESC"},
+                        "searchCriteria": {},
+                    }
+                )
+                records = [r for r in data.get("data", []) if "ctNumber" in r]
+                stats["pages"] += 1
+                stats["seen"] += len(records)
+                stored = dict(
+                    connection.execute(
+                        f"SELECT ct_number, last_updated FROM trials WHERE ct_number IN ({','.join('?' * len(records))})",
+                        [r["ctNumber"] for r in records],
+                    ).fetchall()
+                )
+                todo = [
+                    r
+                    for r in records
+                    if r["ctNumber"] not in stored
+                    or stored[r["ctNumber"]] != r.get("lastUpdated")
+                ]
+                rows = []
+                for record, future in [
+                    (r, pool.submit(mirror_row, r, synced_at, dictionaries))
+                    for r in todo
+                ]:
+                    try:
+                        rows.append(future.result())
+                        stats["changed" if record["ctNumber"] in stored else "new"] += 1
+                    except Exception as e:
+                        stats["failed"] += 1
+                        logger.warning("could not mirror %s: %s", record["ctNumber"], e)
+                with connection:
+                    connection.executemany(
+                        "INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                dates = [r["decisionDate"] for r in records if r.get("decisionDate")]
+                if dates and (newest is None or max(dates) > newest):
+                    newest = max(dates)
+                # pages are newest first: once a whole page was decided before the
+                # last complete sync, everything after it is already mirrored
+                if watermark and dates and max(dates) < watermark:
+                    complete = True
+                    break
+                if not records or not data.get("pagination", {}).get("nextPage"):
+                    complete = True
+                    break
+                page += 1
+        # the mirror is served only after a complete pass; failed trials are
+        # retried next time by not moving the watermark past them
+        if complete:
+            with connection:
+                set_state(connection, "last_sync_at", synced_at)
+                if not stats["failed"] and newest:
+                    set_state(connection, "decision_date_watermark", newest)
+                # a failed trial may be a changed one, so the full pass is redone
+                if full and not stats["failed"]:
+                    set_state(connection, "last_full_sync_at", synced_at)
+            # the first complete sync has enough payloads to train on
+            if not any(dictionaries.values()):
+                stats["dictionaries"] = train_dictionaries(connection)
+        stats["watermark"] = get_state(connection, "decision_date_watermark")
+        return stats
+    finally:
+        connection.close()
+
+
+##############################################################################
+# serving
+
+
+def older_than(timestamp: str, hours: float) -> bool:
+    age = datetime.now(timezone.utc) - datetime.fromisoformat(timestamp)
+    return age > timedelta(hours=hours)
+
+
+# mirror file -> (time of its last full pass,)
+last_full_syncs = TTLCache(64, CTIS_MIRROR_STATE_TTL)
+
+
+def mirror_fresh(path: Optional[str] = None) -> bool:
+    """Whether the mirror can stand in for CTIS: only changes to older trials
+    are caught by full passes, so their age is what counts."""
+    path = path or CTIS_MIRROR_FILE
+    if not os.path.exists(path):
+        return False
+    cached = last_full_syncs.get(path)
+    if cached is None:
+        connection = connect(path)
+        try:
+            cached = (get_state(connection, "last_full_sync_at"),)
+        finally:
+            connection.close()
+        last_full_syncs.set(path, cached)
+    last_full = cached[0]
+    if last_full is None:
+        return False
+    return CTIS_MIRROR_MAX_AGE_HOURS <= 0 or not older_than(
+        last_full, CTIS_MIRROR_MAX_AGE_HOURS
+    )
+
+
+def local_trial_summary(ct_number: str, path: Optional[str] = None) -> Optional[str]:
+    with span("mirror.retrieve", trial_id=ct_number):
+        connection = connect(path)
+        try:
+            row = connection.execute(
+                "SELECT extracted FROM trials WHERE ct_number = ?", (ct_number,)
+            ).fetchone()
+        finally:
+            connection.close()
+        set_attributes(hit=row is not None)
+        return unpack(row[0])["summary"] if row else None
+
+
+def local_search(payload: Dict[str, Any], path: Optional[str] = None) -> Dict:
+    """Answers a CTIS search payload from the mirror in the shape of the live API."""
+    criteria = payload.get("searchCriteria", {})
+    page = int(payload.get("pagination", {}).get("page", 1))
+    size = int(payload.get("pagination", {}).get("size", 20))
+    clauses, args = [], []
+    for term in (criteria.get("containAll") or "").lower().split():
+        clauses.append("search_text LIKE ?")
+        args.append(f"%{term}%")
+    statuses = [
+        STATUS_NAMES[s] for s in criteria.get("status", []) if s in STATUS_NAMES
+    ]
+    if statuses:
+        clauses.append(f"status IN ({','.join('?' * len(statuses))})")
+        args.extend(statuses)
+    for column, key in (("conditions", "medicalCondition"), ("sponsor", "sponsor")):
+        if criteria.get(key):
+            clauses.append(f"{column} LIKE ?")
+            args.append(f"%{criteria[key].lower()}%")
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with span("mirror.search", page=page):
+        connection = connect(path)
+        try:
+            total = connection.execute(
+                f"SELECT COUNT(*) FROM trials {where}", args
+            ).fetchone()[0]
+            rows = connection.execute(
+                f"SELECT search_record FROM trials {where} "
+                "ORDER BY decision_date DESC, ct_number LIMIT ? OFFSET ?",
+                args + [size, (page - 1) * size],
+            ).fetchall()
+        finally:
+            connection.close()
+    total_pages = (total + size - 1) // size
+    return {
+        "data": [unpack(row[0]) for row in rows],
+        "pagination": {
+            "page": page,
+            "size": size,
+            "totalRecords": total,
+            "totalPages": total_pages,
+            "currentPage": page,
+            "nextPage": page < total_pages,
+            "previousPage": page > 1,
+        },
+    }
+
+
+def eu_search(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return local_search(payload) if mirror_fresh() else ctis_search(payload)
+
+
+def mirror_status(path: Optional[str] = None) -> Dict[str, Any]:
+    path = path or CTIS_MIRROR_FILE
+    if not os.path.exists(path):
+        return {"path": path, "trials": 0}
+    connection = connect(path)
+    try:
+        return {
+            "path": path,
+            "trials": connection.execute("SELECT COUNT(*) FROM trials").fetchone()[0],
+            "last_sync_at": get_state(connection, "last_sync_at"),
+            "last_full_sync_at": get_state(connection, "last_full_sync_at"),
+            "watermark": get_state(connection, "decision_date_watermark"),
+            "bytes": os.path.getsize(path),
+            "dictionaries": dict(
+                connection.execute(
+                    "SELECT kind, codec FROM dictionaries "
+                    "WHERE id IN (SELECT value FROM sync_state WHERE key LIKE 'dictionary:%')"
+                ).fetchall()
+            ),
+        }
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline EU CTIS mirror.")
+    parser.add_argument("command", choices=["sync", "status", "compact"])
+    parser.add_argument("--file", default=CTIS_MIRROR_FILE)
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Compare every trial's last update instead of stopping at the last sync's decision date",
+    )
+    parser.add_argument("--max-pages", type=int)
+    args = parser.parse_args()
+    if args.command == "sync":
+        stats = sync_mirror(args.file, full=args.full, max_pages=args.max_pages)
+        print(
+            f"Synced {args.file} ({'full' if stats['full'] else 'incremental'} pass): {stats['pages']} pages, {stats['seen']} trials seen, "
+            f"{stats['new']} new, {stats['changed']} changed, {stats['failed']} failed "
+            f"(decision date watermark {stats['watermark']})"
+        )
+    elif args.command == "compact":
+        # retrain on the current payloads, recompress and give the space back
+        connection = connect(args.file)
+        try:
+            print(json.dumps(train_dictionaries(connection), indent=2))
+            connection.execute("VACUUM")
+        finally:
+            connection.close()
+    else:
+        print(json.dumps(mirror_status(args.file), indent=2))
@@ -0,0 +1,498 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Callable, List
+from urllib.parse import urlsplit, parse_qs
+import synthetic_
+import argparse
+import gzip
+import json
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+
+##############################################################################
+# local stand-in servers
+
+
+TRIAL_ID_PATTERN = re.compile(r"\bNCT\d{8}\b|\b\d{4}-\d{6}-\d{2}-\d{2}\b")
+
+
+def fake_relevance_reply(prompt: str) -> str:
+    trial_ids = list(dict.fromkeys(TRIAL_ID_PATTERN.findall(prompt)))
+    if not trial_ids:
+        return "None of these trials are relevant."
+    return "\n".join(
+        f"{trial_id} | {7 - i % 5} | Matches the request (fake analysis)."
+        for i, trial_id in enumerate(trial_ids)
+    )
+
+
+class MockServer:
+    def __init__(self, handler_class, host: str = "127.0.0.1", port: int = 0):
+        self.httpd = ThreadingHTTPServer((host, port), handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class JSONHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self) -> Any:
+        length = int(self.headers.get("content-length", 0))
+        return json.loads(self.rfile.read(length) or b"null")
+
+    def send_body(
+        self,
+        body: bytes,
+        content_type: str,
+        status: int = 200,
+        headers: Dict[str, str] = None,
+    ):
+        self.send_response(status)
+        self.send_header("content-type", content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        # like the real registries, larger responses are gzipped when accepted
+        if len(body) > 1024 and "gzip" in self.headers.get("accept-encoding", ""):
+            body = gzip.compress(body, 6)
+            self.send_header("content-encoding", "gzip")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data: Any, status: int = 200):
+        body = json.dumps(data).encode("utf-8")
+        # successful responses carry an ETag and honour If-None-Match
+        if status == 200:
+            etag = f'"{zlib.crc32(body):08x}"'
+            if self.headers.get("if-none-match") == etag:
+                self.send_response(304)
+                self.send_header("etag", etag)
+                self.end_headers()
+                return
+            return self.send_body(body, "application/json", headers={"etag": etag})
+        self.send_body(body, "application/json", status)
+
+
+##############################################################################
+# anthropic messages (streamed) and message batches
+
+
+def prompt_text(params: Dict[str, Any]) -> str:
+    return "\n".join(
+        m["content"] if isinstance(m["content"], str) else json.dumps(m["content"])
+        for m in params.get("messages", [])
+    )
+
+
+class FakeBatchHandler(JSONHandler):
+    def send_event(self, event: str, data: Dict[str, Any]):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+        self.wfile.flush()
+
+    def stream_message(self, params: Dict[str, Any]):
+        mock = self.server.mock
+        prompt = prompt_text(params)
+        usage = {"input_tokens": len(prompt) // 4, "output_tokens": 0}
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.end_headers()
+        message = {
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": params.get("model"),
+            "content": [],
+            "stop_reason": None,
+            "stop_sequence": None,
+            "usage": usage,
+        }
+        try:
+            time.sleep(mock.first_token_seconds)
+            self.send_event(
+                "message_start", {"type": "message_start", "message": message}
+            )
+            block = {"type": "text", "text": ""}
+            self.send_event(
+                "content_block_start",
+                {"type": "content_block_start", "index": 0, "content_block": block},
+            )
+            stop_reason = "end_turn"
+            for line in mock.responder(prompt).splitlines(keepends=True):
+                # like the API, output stops at max_tokens
+                if usage["output_tokens"] + len(line) // 4 > params.get(
+                    "max_tokens", 8000
+                ):
+                    stop_reason = "max_tokens"
+                    break
+                usage["output_tokens"] += len(line) // 4
+                delta = {"type": "text_delta", "text": line}
+                self.send_event(
+                    "content_block_delta",
+                    {"type": "content_block_delta", "index": 0, "delta": delta},
+                )
+                time.sleep(mock.line_seconds)
+            self.send_event(
+                "content_block_stop", {"type": "content_block_stop", "index": 0}
+            )
+            self.send_event(
+                "message_delta",
+                {
+                    "type": "message_delta",
+                    "delta": {"stop_reason": stop_reason, "stop_sequence": None},
+                    "usage": {"output_tokens": usage["output_tokens"]},
+                },
+            )
+            self.send_event("message_stop", {"type": "message_stop"})
+        except (BrokenPipeError, ConnectionResetError):
+            # the client stops reading once every trial has a verdict
+            pass
+
+    def do_POST(self):
+        if self.path.rstrip("/") == "/v1/messages":
+            return self.stream_message(self.read_json())
+        if self.path.rstrip("/") != "/v1/messages/batches":
+            return self.send_json({"error": "not found"}, 404)
+        body = self.read_json()
+        batch = self.server.mock.create_batch(body.get("requests", []))
+        self.send_json(self.server.mock.batch_object(batch))
+
+    def do_GET(self):
+        match = re.fullmatch(r"/v1/messages/batches/([^/]+)(/results)?", self.path)
+        batch = self.server.mock.batches.get(match.group(1)) if match else None
+        if batch is None:
+            return self.send_json({"error": "not found"}, 404)
+        if not match.group(2):
+            return self.send_json(self.server.mock.batch_object(batch))
+        if not self.server.mock.is_ended(batch):
+            return self.send_json({"error": "batch still in progress"}, 400)
+        lines = [json.dumps(result) for result in batch["results"]]
+        self.send_body("\n".join(lines).encode("utf-8"), "application/x-jsonl")
+
+
+class FakeBatchServer(MockServer):
+    def __init__(
+        self,
+        processing_seconds: float = 1.0,
+        responder: Callable[[str], str] = fake_relevance_reply,
+        first_token_seconds: float = 0.6,
+        line_seconds: float = 0.08,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        super().__init__(FakeBatchHandler, host, port)
+        self.processing_seconds = processing_seconds
+        self.first_token_seconds = first_token_seconds
+        self.line_seconds = line_seconds
+        self.responder = responder
+        self.batches: Dict[str, Dict[str, Any]] = {}
+
+    def create_batch(self, requests: list) -> Dict[str, Any]:
+        batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+        results = []
+        for request in requests:
+            params = request.get("params", {})
+            prompt = prompt_text(params)
+            text = self.responder(prompt)
+            results.append(
+                {
+                    "custom_id": request.get("custom_id"),
+                    "result": {
+                        "type": "succeeded",
+                        "message": {
+                            "id": f"msg_{uuid.uuid4().hex[:24]}",
+                            "type": "message",
+                            "role": "assistant",
+                            "model": params.get("model"),
+                            "content": [{"type": "text", "text": text}],
+                            "stop_reason": "end_turn",
+                            "stop_sequence": None,
+                            "usage": {
+                                "input_tokens": len(prompt) // 4,
+                                "output_tokens": len(text) // 4,
+                            },
+                        },
+                    },
+                }
+            )
+        batch = {"id": batch_id, "created": time.time(), "results": results}
+        self.batches[batch_id] = batch
+        return batch
+
+    def is_ended(self, batch: Dict[str, Any]) -> bool:
+        return time.time() - batch["created"] >= self.processing_seconds
+
+    def batch_object(self, batch: Dict[str, Any]) -> Dict[str, Any]:
+        created_at = datetime.fromtimestamp(batch["created"], timezone.utc)
+        ended = self.is_ended(batch)
+        count = len(batch["results"])
+        return {
+            "id": batch["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else count,
+                "succeeded": count if ended else 0,
+                "errored": 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": created_at.isoformat(),
+            "expires_at": (created_at + timedelta(hours=24)).isoformat(),
+            "ended_at": datetime.now(timezone.utc).isoformat() if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": (
+                f"{self.url}/v1/messages/batches/{batch['id']}/results"
+                if ended
+                else None
+            ),
+        }
+
+
+##############################################################################
+# registries (CTIS search/retrieve, ClinicalTrials.gov studies)
+
+
+class FakeRegistryHandler(JSONHandler):
+    def do_POST(self):
+        if not self.server.mock.admit("ctis_search"):
+            return self.send_json({"error": "service unavailable"}, 503)
+        if self.path.rstrip("/") != "/ctis-public-api/search":
+            return self.send_json({"error": "not found"}, 404)
+        payload = self.read_json() or {}
+        pagination = payload.get("pagination", {})
+        contain_all = payload.get("searchCriteria", {}).get("containAll") or ""
+        if re.fullmatch(r"\d{4}-\d{6}-\d{2}-\d{2}", contain_all):
+            trial = self.server.mock.ctis_search_record(contain_all)
+            return self.send_json({"data": [trial] if trial else []})
+        self.send_json(
+            self.server.mock.ctis_search_page(
+                int(pagination.get("page", 1)), int(pagination.get("size", 20))
+            )
+        )
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        match = re.fullmatch(r"/ctis-public-api/retrieve/([^/]+)", url.path)
+        if match:
+            if not self.server.mock.admit("ctis_retrieve"):
+                return self.send_json({"error": "service unavailable"}, 503)
+            trial = self.server.mock.ctis_trial(match.group(1))
+            return self.send_json(trial) if trial else self.send_json({}, 404)
+        if url.path.rstrip("/") == "/api/v2/studies":
+            if not self.server.mock.admit("ctgov_studies"):
+                return self.send_json({"error": "service unavailable"}, 503)
+            if query.get("filter.ids"):
+                return self.send_json(
+                    {
+                        "studies": [
+                            study
+                            for nct_id in query["filter.ids"].split(",")
+                            for study in [self.server.mock.ctgov_study(nct_id)]
+                            if study
+                        ]
+                    }
+                )
+            return self.send_json(
+                self.server.mock.ctgov_studies_page(
+                    int(query.get("pageToken") or 0), int(query.get("pageSize", 10))
+                )
+            )
+        match = re.fullmatch(r"/api/v2/studies/(NCT\d{8})", url.path)
+        if match:
+            if not self.server.mock.admit("ctgov_study"):
+                return self.send_json({"error": "service unavailable"}, 503)
+            study = self.server.mock.ctgov_study(match.group(1))
+            return self.send_json(study) if study else self.send_json({}, 404)
+        self.send_json({"error": "not found"}, 404)
+
+
+class FakeRegistryServer(MockServer):
+    def __init__(
+        self,
+        n_trials: int = 1000,
+        latency: float = 0.1,
+        jitter: float = 0.03,
+        error_rate: float = 0.0,
+        overlap: float = 0.1,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        super().__init__(FakeRegistryHandler, host, port)
+        self.n_trials = n_trials
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.overlap_every = max(round(1 / overlap), 1) if overlap else 0
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        # CTIS trials decided after start-up (newest last) and per-trial field changes
+        self.published: List[int] = []
+        self.ctis_changes: Dict[int, Dict[str, Any]] = {}
+        # per-study module changes, e.g. {"statusModule": {"overallStatus": ...}}
+        self.ctgov_changes: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    def admit(self, endpoint: str) -> bool:
+        with self.lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+            delay = max(self.rng.gauss(self.latency, self.jitter), 0.0)
+            failed = self.rng.random() < self.error_rate
+            if failed:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+        time.sleep(delay)
+        return not failed
+
+    def reset_counts(self):
+        with self.lock:
+            self.counts, self.errors = {}, {}
+
+    def ctgov_index(self, position: int) -> int:
+        if self.overlap_every and position % self.overlap_every == 0:
+            return position
+        return 1000000 + position
+
+    def publish_ctis_trials(self, count: int, decision_date: str) -> List[str]:
+        with self.lock:
+            start = self.n_trials + len(self.published)
+            for i in range(start, start + count):
+                self.published.append(i)
+                self.ctis_changes[i] = {"decisionDate": decision_date}
+        return [synthetic_.eu_trial_id(i) for i in range(start, start + count)]
+
+    def update_ctis_trial(self, i: int, **fields) -> None:
+        with self.lock:
+            self.ctis_changes.setdefault(i, {}).update(fields)
+
+    def update_ctgov_study(self, nct_id: str, module: str, **fields) -> None:
+        with self.lock:
+            self.ctgov_changes.setdefault(nct_id, {}).setdefault(module, {}).update(
+                fields
+            )
+
+    def ctis_order(self) -> List[int]:
+        return list(reversed(self.published)) + list(range(self.n_trials))
+
+    def ctis_record(self, i: int) -> Dict[str, Any]:
+        return dict(synthetic_.ctis_search_record(i), **self.ctis_changes.get(i, {}))
+
+    def ctis_search_page(self, page: int, size: int) -> Dict[str, Any]:
+        order = self.ctis_order()
+        start = (page - 1) * size
+        total_pages = (len(order) + size - 1) // size
+        return {
+            "data": [self.ctis_record(i) for i in order[start : start + size]],
+            "pagination": {
+                "page": page,
+                "size": size,
+                "totalRecords": len(order),
+                "totalPages": total_pages,
+                "currentPage": page,
+                "nextPage": page < total_pages,
+                "previousPage": page > 1,
+            },
+        }
+
+    def ctis_search_record(self, ct_number: str) -> Dict[str, Any]:
+        for i in self.ctis_order():
+            if synthetic_.eu_trial_id(i) == ct_number:
+                return self.ctis_record(i)
+        return None
+
+    def ctis_trial(self, ct_number: str) -> Dict[str, Any]:
+        for i in self.ctis_order():
+            if synthetic_.eu_trial_id(i) == ct_number:
+                trial = synthetic_.ctis_trial(i)
+                changes = self.ctis_changes.get(i, {})
+                return dict(trial, **{k: v for k, v in changes.items() if k in trial})
+        return None
+
+    def ctgov_record(self, i: int, eu_secondary_id: bool) -> Dict[str, Any]:
+        study = synthetic_.ctgov_study(i, eu_secondary_id=eu_secondary_id)
+        protocol = study["protocolSection"]
+        for module, fields in self.ctgov_changes.get(synthetic_.nct_id(i), {}).items():
+            protocol[module] = dict(protocol.get(module, {}), **fields)
+        return study
+
+    def ctgov_studies_page(self, offset: int, size: int) -> Dict[str, Any]:
+        end = min(offset + size, self.n_trials)
+        page = {
+            "totalCount": self.n_trials,
+            "studies": [
+                self.ctgov_record(
+                    self.ctgov_index(p), eu_secondary_id=self.ctgov_index(p) == p
+                )
+                for p in range(offset, end)
+            ],
+        }
+        if end < self.n_trials:
+            page["nextPageToken"] = str(end)
+        return page
+
+    def ctgov_study(self, nct_id: str) -> Dict[str, Any]:
+        for p in range(self.n_trials):
+            i = self.ctgov_index(p)
+            if synthetic_.nct_id(i) == nct_id:
+                return self.ctgov_record(i, eu_secondary_id=i == p)
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run local stand-in servers.")
+    parser.add_argument("server", choices=["anthropic-batches", "registries"])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--processing-seconds", type=float, default=5.0)
+    parser.add_argument("--trials", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--jitter", type=float, default=0.03)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    if args.server == "registries":
+        server = FakeRegistryServer(
+            n_trials=args.trials,
+            latency=args.latency,
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+            port=args.port,
+        )
+        print(
+            f"Serving fake registries on {server.url} "
+            f"(set CTIS_API_URL={server.url}/ctis-public-api and CTGOV_API_URL={server.url}/api/v2)"
+        )
+    else:
+        server = FakeBatchServer(
+            processing_seconds=args.processing_seconds, port=args.port
+        )
+        print(
+            f"Serving fake messages and message batches API on {server.url} (set ANTHROPIC_BASE_URL)"
+        )
+    server.httpd.serve_forever()
@@ -1,10 +1,42 @@
-from anthropic import AsyncAnthropic
-from dotenv import load_dotenv
+from tracing_ import set_attributes
+from usage_ import record_usage
+from shared_ import request_timeout, remaining_seconds
 import asyncio
+import logging
+import os
 
-load_dotenv()
+_client = None
 
-client = AsyncAnthropic(timeout=100)
+
+def get_client():
+    # created on first use so a freshly spawned stdio server can answer
+    # initialize before the SDK is imported and .env is read
+    global _client
+    if _client is None:
+        from anthropic import AsyncAnthropic
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _client = AsyncAnthropic(timeout=100)
+    return _client
+
+
+# stdout carries the stdio MCP transport, so diagnostics go to logging (stderr)
+logger = logging.getLogger(__name__)
+
+# output tokens of each partial and final synthesis of search results
+SYNTHESIS_TOKENS = int(os.getenv("SYNTHESIS_TOKENS", "700"))
+
+# (base, per item) output token budgets per task; replaces the blanket 8000
+OUTPUT_BUDGETS = {
+    "relevance": (60, 80),
+    "synthesis": (SYNTHESIS_TOKENS, 0),
+}
+
+
+def output_budget(task: str, items: int = 1) -> int:
+    base, per_item = OUTPUT_BUDGETS[task]
+    return base + per_item * max(items, 1)
 
 
 async def model_call(
@@ -28,20 +60,145 @@ async def model_call(
     }
     for attempt in range(retries):
         try:
-            response = await client.messages.create(**api_parameters)
+            timeout = request_timeout(None)
+            if timeout is not None:
+                api_parameters["timeout"] = timeout
+            response = await get_client().messages.create(**api_parameters)
+            if not stream:
+                record_message_usage(response, model)
             return response
 
         except Exception as e:
-            print(f"\n[model_call]: {e}")
-            if attempt < retries - 1:
+            logger.warning("[model_call]: %s", e)
+            set_attributes(retries=attempt + 1)
+            remaining = remaining_seconds()
+            if attempt < retries - 1 and (
+                remaining is None or remaining > sleep_time * (2**attempt)
+            ):
                 sleep_time = sleep_time * (2**attempt)
-                print(f"\n[model_call]: Retrying in {sleep_time} seconds...")
+                logger.warning("[model_call]: Retrying in %s seconds...", sleep_time)
                 await asyncio.sleep(sleep_time)
             else:
-                print(f"\n[model_call]: Failed after {retries} attempts")
+                logger.error("[model_call]: Failed after %s attempts", attempt + 1)
                 break
 
     return None
 
 
+def record_message_usage(message, model, source=None, batch=False, streamed_text=None):
+    usage = message.usage
+    output_tokens = usage.output_tokens
+    estimated = streamed_text is not None and message.stop_reason is None
+    if estimated:
+        output_tokens = max(output_tokens, len(streamed_text) // 4)
+    return record_usage(
+        message.model or model,
+        usage.input_tokens,
+        output_tokens,
+        usage.cache_creation_input_tokens,
+        usage.cache_read_input_tokens,
+        source=source,
+        batch=batch,
+        estimated=estimated,
+    )
+
+
+async def model_stream(
+    messages: list | str,
+    model="claude-3-5-haiku-20241022",
+    max_tokens=8000,
+    source=None,
+):
+    retries = 3
+    sleep_time = 2
+
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    api_parameters = {
+        "model": model,
+        "messages": messages,
+        "max_tokens": max_tokens,
+    }
+    for attempt in range(retries):
+        started = False
+        streamed_text = ""
+        try:
+            timeout = request_timeout(None)
+            if timeout is not None:
+                api_parameters["timeout"] = timeout
+            async with get_client().messages.stream(**api_parameters) as stream:
+                try:
+                    async for text in stream.text_stream:
+                        started = True
+                        streamed_text += text
+                        yield text
+                finally:
+                    # also runs when the caller stops early; usage so far is still billed
+                    if started:
+                        record_message_usage(
+                            stream.current_message_snapshot,
+                            model,
+                            source,
+                            streamed_text=streamed_text,
+                        )
+            return
+
+        except Exception as e:
+            logger.warning("[model_stream]: %s", e)
+            remaining = remaining_seconds()
+            if (
+                started
+                or attempt == retries - 1
+                or (remaining is not None and remaining <= sleep_time * (2**attempt))
+            ):
+                raise
+            set_attributes(retries=attempt + 1)
+            sleep_time = sleep_time * (2**attempt)
+            logger.warning("[model_stream]: Retrying in %s seconds...", sleep_time)
+            await asyncio.sleep(sleep_time)
+
+
+async def batch_create(
+    prompts: list,
+    model="claude-3-5-haiku-20241022",
+    max_tokens=8000,
+):
+    requests = [
+        {
+            "custom_id": custom_id,
+            "params": {
+                "model": model,
+                "max_tokens": max_tokens,
+                "messages": [{"role": "user", "content": prompt}],
+            },
+        }
+        for custom_id, prompt in prompts
+    ]
+    return await get_client().messages.batches.create(requests=requests)
+
+
+async def batch_retrieve(batch_id: str):
+    return await get_client().messages.batches.retrieve(batch_id)
+
+
+async def batch_results(batch_id: str, sources: dict = None) -> dict:
+    results = {}
+    async for entry in await get_client().messages.batches.results(batch_id):
+        if entry.result.type == "succeeded":
+            record_message_usage(
+                entry.result.message,
+                entry.result.message.model,
+                (sources or {}).get(entry.custom_id),
+                batch=True,
+            )
+            results[entry.custom_id] = "".join(
+                block.text
+                for block in entry.result.message.content
+                if block.type == "text"
+            )
+        else:
+            results[entry.custom_id] = None
+    return results
+
+
 ############################################################################################################
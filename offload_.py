@@ -0,0 +1,81 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from tracing_ import set_attributes
+from typing import Any, Callable, Optional, Tuple
+import json
+import logging
+import multiprocessing
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+##############################################################################
+# parse+render of large registry payloads in a process pool; workers receive
+# the raw response bytes and return the rendered text, so no decoded dicts
+# cross the process boundary (0 workers keeps everything inline)
+
+OFFLOAD_WORKERS = int(os.getenv("OFFLOAD_WORKERS", str(min(os.cpu_count() or 1, 4))))
+OFFLOAD_THRESHOLD_KB = float(os.getenv("OFFLOAD_THRESHOLD_KB", "256"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def process_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if OFFLOAD_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the server process runs an event loop and threads
+            _pool = ProcessPoolExecutor(
+                OFFLOAD_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def reset_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def render(func: Callable, body: bytes, *args) -> Any:
+    """Run func(body, *args) in the pool if body is over the threshold; blocking, call from a worker thread."""
+    pool = process_pool() if len(body) >= OFFLOAD_THRESHOLD_KB * 1024 else None
+    set_attributes(bytes=len(body), offloaded=pool is not None)
+    if pool is not None:
+        try:
+            return pool.submit(func, body, *args).result()
+        except BrokenProcessPool as e:
+            logger.warning("offload pool failed, rendering inline: %s", e)
+            reset_pool()
+            set_attributes(offloaded=False)
+    return func(body, *args)
+
+
+##############################################################################
+# worker functions (module-level so the pool can pickle them by name)
+
+
+def ctis_trial_summary(body: bytes) -> str:
+    from parsers_ import extract_cro_data
+
+    return extract_cro_data(json.loads(body))["summary"]
+
+
+def ctgov_trial_details(body: bytes) -> str:
+    from parsers_ import format_ctgov_trial_details
+
+    return format_ctgov_trial_details(json.loads(body))
+
+
+def ctgov_trial_details_page(
+    body: bytes, max_bytes: int, cursor: Tuple[int, int]
+) -> Tuple[str, Optional[Tuple[int, int]]]:
+    from parsers_ import render_ctgov_trial_details_page
+
+    return render_ctgov_trial_details_page(json.loads(body), max_bytes, cursor)
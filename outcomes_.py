@@ -0,0 +1,259 @@
+from parsers_ import ctgov_outcome_analyses
+from statistics import NormalDist
+from typing import Dict, Any, List
+import re
+
+##############################################################################
+# cross-trial outcome comparison: the statistical analyses of many trials are
+# laid out as column arrays, the best-matching analysis per trial is picked and
+# effect sizes are pooled by inverse variance in one vectorized pass; numpy is
+# imported on first use to keep server start-up fast
+
+NUMERIC_COLUMNS = [
+    "enrollment",
+    "param_value",
+    "p_value",
+    "ci_pct",
+    "ci_lower",
+    "ci_upper",
+]
+TEXT_COLUMNS = [
+    "trial_id",
+    "outcome_type",
+    "title",
+    "description",
+    "time_frame",
+    "unit",
+    "method",
+    "param_type",
+    "p_qualifier",
+]
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+PARENTHESES_PATTERN = re.compile(r"\([^)]*\)")
+# words of the requested outcome that need not appear in a matching analysis
+STOP_WORDS = set("a an and at by for from in of on the to with".split())
+# effects on a ratio scale are pooled as logarithms
+RATIO_PATTERN = re.compile(r"ratio", re.I)
+SIGNIFICANCE_LEVEL = 0.05
+
+
+def load_numpy():
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError(
+            "outcome comparison needs numpy (pip install numpy)"
+        ) from None
+    return np
+
+
+def outcome_arrays(studies: List[Dict[str, Any]]) -> Dict[str, Any]:
+    np = load_numpy()
+    rows = [row for study in studies for row in ctgov_outcome_analyses(study)]
+    arrays = {
+        column: np.array([row[column] for row in rows], dtype=np.float64)
+        for column in NUMERIC_COLUMNS
+    }
+    arrays.update(
+        {
+            column: np.array([row[column] or "" for row in rows], dtype=object)
+            for column in TEXT_COLUMNS
+        }
+    )
+    return arrays
+
+
+def query_words(outcome: str) -> set:
+    words = set(WORD_PATTERN.findall(outcome.lower()))
+    return words - STOP_WORDS or words
+
+
+def match_scores(arrays: Dict[str, Any], outcome: str) -> Any:
+    """Share of the outcome's words found in the title, description and unit
+    of each analysis, plus 1 when the title alone has all of them."""
+    np = load_numpy()
+    words = query_words(outcome)
+
+    def coverage(texts):
+        return np.fromiter(
+            (len(words & set(WORD_PATTERN.findall(text.lower()))) for text in texts),
+            dtype=np.float64,
+            count=len(texts),
+        ) / max(len(words), 1)
+
+    texts = arrays["title"] + " " + arrays["description"] + " " + arrays["unit"]
+    full = coverage(texts)
+    return full + (coverage(arrays["title"]) == 1)
+
+
+def outcome_key(title: str, unit: str) -> str:
+    """Outcome title and unit with case, punctuation and bracketed
+    abbreviations normalized, so that only analyses of the same outcome are
+    pooled."""
+    title = PARENTHESES_PATTERN.sub(" ", title)
+    return " ".join(WORD_PATTERN.findall(f"{title} | {unit}".lower()))
+
+
+def select_analyses(arrays: Dict[str, Any], outcome: str, primary_only: bool):
+    """Indexes of the best-matching analysis of each trial."""
+    np = load_numpy()
+    if not len(arrays["trial_id"]):
+        return np.array([], dtype=np.int64)
+    score = (
+        match_scores(arrays, outcome) if outcome else np.zeros(len(arrays["trial_id"]))
+    )
+    primary = arrays["outcome_type"] == "PRIMARY"
+    has_effect = np.isfinite(arrays["param_value"])
+    # every word of the outcome has to match: a shared word such as "survival"
+    # would otherwise pick progression-free survival for overall survival
+    eligible = (score >= 1) | (not outcome)
+    if primary_only:
+        eligible &= primary
+    # best score first, then primary outcomes, then analyses with an estimate
+    order = np.lexsort((~has_effect, ~primary, -score, arrays["trial_id"]))
+    order = order[eligible[order]]
+    _, first = np.unique(arrays["trial_id"][order], return_index=True)
+    return order[first]
+
+
+def compare_outcomes(
+    studies: List[Dict[str, Any]], outcome: str = "", primary_only: bool = False
+) -> Dict[str, Any]:
+    np = load_numpy()
+    arrays = outcome_arrays(studies)
+    picked = select_analyses(arrays, outcome, primary_only)
+    table = {column: values[picked] for column, values in arrays.items()}
+
+    ratio = np.array(
+        [bool(RATIO_PATTERN.search(p)) for p in table["param_type"]], dtype=bool
+    )
+
+    def scale(values):
+        return np.where(ratio, np.log(values), values)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        effect, lower, upper = (
+            scale(table["param_value"]),
+            scale(table["ci_lower"]),
+            scale(table["ci_upper"]),
+        )
+        pct = np.where(np.isfinite(table["ci_pct"]), table["ci_pct"], 95.0)
+        z = np.array(
+            [NormalDist().inv_cdf(0.5 + min(p, 99.99) / 200) for p in pct],
+            dtype=np.float64,
+        )
+        se = (upper - lower) / (2 * z)
+        weight = np.where(np.isfinite(se) & (se > 0) & np.isfinite(effect), se**-2, 0)
+
+    # effects are pooled only across analyses of the same outcome, unit and
+    # effect measure
+    keys = np.array(
+        [
+            f"{outcome_key(title, unit)} | {param_type}"
+            for title, unit, param_type in zip(
+                table["title"], table["unit"], table["param_type"]
+            )
+        ],
+        dtype=object,
+    )
+    pooled, share = [], np.zeros(len(weight))
+    for key in np.unique(keys):
+        group = (keys == key) & (weight > 0)
+        first = np.flatnonzero(keys == key)[0]
+        param_type = table["param_type"][first]
+        if not param_type or group.sum() < 2:
+            continue
+        w, x = weight[group], effect[group]
+        estimate = (w * x).sum() / w.sum()
+        pooled_se = np.sqrt(1 / w.sum())
+        q = (w * (x - estimate) ** 2).sum()
+        i2 = max(0.0, (q - (len(x) - 1)) / q) if q > 0 else 0.0
+        unscale = np.exp if ratio[group][0] else (lambda v: v)
+        pooled.append(
+            {
+                "title": table["title"][first],
+                "unit": table["unit"][first],
+                "param_type": param_type,
+                "trials": int(group.sum()),
+                "estimate": float(unscale(estimate)),
+                "ci_lower": float(unscale(estimate - 1.96 * pooled_se)),
+                "ci_upper": float(unscale(estimate + 1.96 * pooled_se)),
+                "i2": float(i2),
+            }
+        )
+        share[group] = w / w.sum()
+
+    p_value = table["p_value"]
+    order = np.lexsort(
+        (-table["enrollment"], np.where(np.isfinite(p_value), p_value, np.inf))
+    )
+    return {
+        "table": {column: values[order] for column, values in table.items()},
+        "weight": share[order],
+        "pooled": pooled,
+        "trials": len(studies),
+        "analyses": len(arrays["trial_id"]),
+        "matched": len(picked),
+        # "> 0.01" says nothing about whether p is below the significance level
+        "significant": int(
+            (
+                (p_value < SIGNIFICANCE_LEVEL)
+                & ~np.isin(table["p_qualifier"], [">", ">=", "≥"])
+            ).sum()
+        ),
+        "enrollment": float(np.nansum(table["enrollment"])),
+        "median_enrollment": (
+            float(np.nanmedian(table["enrollment"]))
+            if np.isfinite(table["enrollment"]).any()
+            else None
+        ),
+    }
+
+
+def format_number(value: float, digits: int = 3) -> str:
+    if value != value:
+        return "-"
+    return f"{value:.{digits}g}"
+
+
+def format_comparison(result: Dict[str, Any], outcome: str, top_n: int = 50) -> str:
+    table = result["table"]
+    heading = f" for '{outcome}'" if outcome else ""
+    out = f"# Outcome comparison{heading}\n\n"
+    out += (
+        f"{result['matched']} of {result['trials']} trials have a matching outcome "
+        f"({result['analyses']} analyses parsed); {result['significant']} report p < {SIGNIFICANCE_LEVEL}. "
+    )
+    if result["median_enrollment"] is not None:
+        out += f"Enrollment {result['enrollment']:,.0f} in total, median {result['median_enrollment']:,.0f}.\n\n"
+    else:
+        out += "\n\n"
+    if not result["matched"]:
+        return out + "No outcome measures with results matched this outcome.\n"
+    if result["pooled"]:
+        out += "| Outcome | Parameter | Trials | Pooled estimate [95% CI] | I² |\n|---|---|---|---|---|\n"
+        for pooled in result["pooled"]:
+            unit = f" ({pooled['unit']})" if pooled["unit"] else ""
+            out += (
+                f"| {pooled['title'][:70]}{unit} | {pooled['param_type']} | {pooled['trials']} | {format_number(pooled['estimate'])} "
+                f"[{format_number(pooled['ci_lower'])}, {format_number(pooled['ci_upper'])}] | {pooled['i2']:.0%} |\n"
+            )
+        out += "\nPooled with inverse-variance (fixed-effect) weights from each trial's confidence interval.\n\n"
+    out += "| Trial | Enrollment | Outcome | Time frame | Parameter | Estimate [CI] | p | Weight |\n"
+    out += "|---|---|---|---|---|---|---|---|\n"
+    shown = min(len(table["trial_id"]), top_n)
+    for i in range(shown):
+        ci = ""
+        if table["ci_lower"][i] == table["ci_lower"][i]:
+            ci = f" [{format_number(table['ci_lower'][i])}, {format_number(table['ci_upper'][i])}]"
+        p = format_number(table["p_value"][i], 2)
+        weight = result["weight"][i]
+        out += (
+            f"| {table['trial_id'][i]} | {format_number(table['enrollment'][i], 6)} "
+            f"| {table['title'][i][:70]} | {table['time_frame'][i][:30]} "
+            f"| {table['param_type'][i] or '-'} | {format_number(table['param_value'][i])}{ci} "
+            f"| {table['p_qualifier'][i]}{p} | {f'{weight:.0%}' if weight else '-'} |\n"
+        )
+    if shown < len(table["trial_id"]):
+        out += f"\n*{len(table['trial_id']) - shown} more trials not shown.*\n"
+    return out
@@ -1,5 +1,8 @@
-from typing import Dict, Any, List
+from linking_ import find_ids, NCT_PATTERN, EU_ID_PATTERN
+from typing import Dict, Any, List, Optional, Tuple
 import json
+import re
+import time
 
 ##############################################################################
 # euclinicaltrials parsers
@@ -57,8 +60,14 @@ Primary Endpoint: {safe_extract(trial, "primaryEndPoint", default="N/A")}
 Other Endpoints: {safe_extract(trial, "endPoint", default="N/A")}
 Products: {safe_extract(trial, "product", default="N/A")}
 Therapeutic Areas: {', '.join(safe_extract(trial, "therapeuticAreas", default=[]))}
-----------------------------------------
 """
+        if safe_extract(trial, "linkedTrialIds"):
+            trial_details += (
+                f"Also Registered As: {', '.join(trial['linkedTrialIds'])}\n"
+            )
+        if safe_extract(trial, "briefSummary"):
+            trial_details += f"Summary: {trial['briefSummary']}\n"
+        trial_details += "----------------------------------------\n"
         summary += trial_details
 
     return summary
@@ -628,312 +637,683 @@ def format_ct_gov_study_batch(studies: List[Dict[str, Any]]) -> str:
     return result
 
 
-def format_ctgov_trial_details(study_data: dict) -> str:
-    try:
-        protocol = study_data.get("protocolSection", {})
-        results = study_data.get("resultsSection", {})
-
-        identification = protocol.get("identificationModule", {})
-        status = protocol.get("statusModule", {})
-        sponsor = protocol.get("sponsorCollaboratorsModule", {})
-        design = protocol.get("designModule", {})
-        arms = protocol.get("armsInterventionsModule", {})
-        outcomes = protocol.get("outcomesModule", {})
-        eligibility = protocol.get("eligibilityModule", {})
-        description = protocol.get("descriptionModule", {})
-        conditions = protocol.get("conditionsModule", {})
-
-        participant_flow = results.get("participantFlowModule", {})
-        outcome_results = results.get("outcomeMeasuresModule", {})
-        adverse = results.get("adverseEventsModule", {})
-
-        result = (
-            f"# Clinical Trial Details: {identification.get('nctId', 'Unknown ID')}\n\n"
+def ctgov_identification_section(study_data: dict) -> Dict[str, Any]:
+    identification = study_data.get("protocolSection", {}).get(
+        "identificationModule", {}
+    )
+    status = study_data.get("protocolSection", {}).get("statusModule", {})
+    block = f"**Trial ID**: {identification.get('nctId', 'Not provided')}\n"
+    block += f"**Title**: {identification.get('officialTitle', identification.get('briefTitle', 'Not provided'))}\n"
+    block += f"**Status**: {status.get('overallStatus', 'Not provided')}\n"
+    block += f"**Started**: {status.get('startDateStruct', {}).get('date', 'Not provided')}\n"
+    block += f"**Primary Completion**: {status.get('primaryCompletionDateStruct', {}).get('date', 'Not provided')}\n"
+    return {
+        "title": "Trial Identification and Status",
+        "header": f"# Clinical Trial Details: {identification.get('nctId', 'Unknown ID')}\n\n"
+        "## Trial Identification and Status\n\n",
+        "blocks": [block],
+        "unit": "fields",
+    }
+
+
+def ctgov_sponsor_section(study_data: dict) -> Dict[str, Any]:
+    sponsor = study_data.get("protocolSection", {}).get(
+        "sponsorCollaboratorsModule", {}
+    )
+    return {
+        "title": "Sponsor and Collaborator Information",
+        "header": "\n## Sponsor and Collaborator Information\n\n",
+        "blocks": [
+            f"**Lead Sponsor**: {sponsor.get('leadSponsor', {}).get('name', 'Not provided')} ({sponsor.get('leadSponsor', {}).get('class', 'Unknown')})\n"
+        ],
+        "unit": "fields",
+    }
+
+
+def ctgov_conditions_section(study_data: dict) -> Dict[str, Any]:
+    conditions = study_data.get("protocolSection", {}).get("conditionsModule", {})
+    if not conditions:
+        return None
+    blocks = []
+    if conditions.get("conditions"):
+        blocks.append(
+            "**Conditions**: " + ", ".join(conditions.get("conditions", [])) + "\n"
         )
+    return {
+        "title": "Conditions and Keywords",
+        "header": "\n## Conditions and Keywords\n\n",
+        "blocks": blocks,
+        "unit": "fields",
+    }
 
-        result += "## Trial Identification and Status\n\n"
-        result += f"**Trial ID**: {identification.get('nctId', 'Not provided')}\n"
-        result += f"**Title**: {identification.get('officialTitle', identification.get('briefTitle', 'Not provided'))}\n"
-        result += f"**Status**: {status.get('overallStatus', 'Not provided')}\n"
-        result += f"**Started**: {status.get('startDateStruct', {}).get('date', 'Not provided')}\n"
-        result += f"**Primary Completion**: {status.get('primaryCompletionDateStruct', {}).get('date', 'Not provided')}\n"
-
-        result += "\n## Sponsor and Collaborator Information\n\n"
-        result += f"**Lead Sponsor**: {sponsor.get('leadSponsor', {}).get('name', 'Not provided')} ({sponsor.get('leadSponsor', {}).get('class', 'Unknown')})\n"
-
-        if conditions:
-            result += "\n## Conditions and Keywords\n\n"
-            if conditions.get("conditions"):
-                result += (
-                    "**Conditions**: "
-                    + ", ".join(conditions.get("conditions", []))
-                    + "\n"
-                )
 
-        result += "\n## Study Design\n\n"
-        if design:
-            result += f"**Study Type**: {design.get('studyType', 'Not provided')}\n"
-            if design.get("phases"):
-                result += (
-                    f"**Phase**: {', '.join(design.get('phases', ['Not provided']))}\n"
-                )
+def ctgov_design_section(study_data: dict) -> Dict[str, Any]:
+    design = study_data.get("protocolSection", {}).get("designModule", {})
+    blocks = []
+    if design:
+        block = f"**Study Type**: {design.get('studyType', 'Not provided')}\n"
+        if design.get("phases"):
+            block += f"**Phase**: {', '.join(design.get('phases', ['Not provided']))}\n"
 
-            design_info = design.get("designInfo", {})
-            if design_info:
-                for k, v in design_info.items():
-                    if v:
-                        result += f"**{k.capitalize()}**: {v}\n"
-
-            result += f"**Target Duration**: {design.get('targetDuration', 'Not specified')}\n"
-            result += f"**Enrollment**: {design.get('enrollmentInfo', {}).get('count', 'Not specified')} ({design.get('enrollmentInfo', {}).get('type', 'Not specified')})\n"
-
-            if design.get("studyType") == "OBSERVATIONAL":
-                result += f"**Observational Model**: {design.get('designInfo', {}).get('observationalModel', 'Not specified')}\n"
-                result += f"**Time Perspective**: {design.get('designInfo', {}).get('timePerspective', 'Not specified')}\n"
-
-        if arms:
-            result += "\n## Arms and Interventions\n\n"
-            for arm in arms.get("arms", []):
-                result += f"### Arm: {arm.get('label', 'Unnamed Arm')}\n"
-                result += f"**Type**: {arm.get('type', 'Not specified')}\n"
-                result += f"**Description**: {arm.get('description', 'No description provided')}\n"
-                if arm.get("interventionNames"):
-                    result += f"**Interventions**: {', '.join(arm.get('interventionNames', []))}\n\n"
-
-            if arms.get("interventions"):
-                result += "### Detailed Interventions\n\n"
-                for intervention in arms.get("interventions", []):
-                    result += f"**{intervention.get('type', 'Unknown Type')}**: {intervention.get('name', 'Unnamed')}\n"
-                    result += f"**Description**: {intervention.get('description', 'No description provided')}\n"
-                    if intervention.get("armGroupLabels"):
-                        result += f"**Arms**: {', '.join(intervention.get('armGroupLabels', []))}\n\n"
-
-        if outcomes:
-            result += "\n## Outcome Measures\n\n"
-
-            if outcomes.get("primaryOutcomes"):
-                result += "### Primary Outcomes\n\n"
-                for outcome in outcomes.get("primaryOutcomes", []):
-                    result += (
-                        f"- **Measure**: {outcome.get('measure', 'Not specified')}\n"
-                    )
-                    result += f"  **Time Frame**: {outcome.get('timeFrame', 'Not specified')}\n"
-                    if outcome.get("description"):
-                        result += f"  **Description**: {outcome.get('description')}\n"
-                    result += "\n"
-
-            if outcomes.get("secondaryOutcomes"):
-                result += "### Secondary Outcomes\n\n"
-                for outcome in outcomes.get("secondaryOutcomes", []):
-                    result += (
-                        f"- **Measure**: {outcome.get('measure', 'Not specified')}\n"
-                    )
-                    result += f"  **Time Frame**: {outcome.get('timeFrame', 'Not specified')}\n"
-                    if outcome.get("description"):
-                        result += f"  **Description**: {outcome.get('description')}\n"
-                    result += "\n"
-
-        if eligibility:
-            result += "\n## Eligibility\n\n"
-            result += (
-                f"**Minimum Age**: {eligibility.get('minimumAge', 'Not specified')}\n"
+        design_info = design.get("designInfo", {})
+        if design_info:
+            for k, v in design_info.items():
+                if v:
+                    block += f"**{k.capitalize()}**: {v}\n"
+
+        block += (
+            f"**Target Duration**: {design.get('targetDuration', 'Not specified')}\n"
+        )
+        block += f"**Enrollment**: {design.get('enrollmentInfo', {}).get('count', 'Not specified')} ({design.get('enrollmentInfo', {}).get('type', 'Not specified')})\n"
+
+        if design.get("studyType") == "OBSERVATIONAL":
+            block += f"**Observational Model**: {design.get('designInfo', {}).get('observationalModel', 'Not specified')}\n"
+            block += f"**Time Perspective**: {design.get('designInfo', {}).get('timePerspective', 'Not specified')}\n"
+        blocks.append(block)
+    return {
+        "title": "Study Design",
+        "header": "\n## Study Design\n\n",
+        "blocks": blocks,
+        "unit": "fields",
+    }
+
+
+def ctgov_arms_section(study_data: dict) -> Dict[str, Any]:
+    arms = study_data.get("protocolSection", {}).get("armsInterventionsModule", {})
+    if not arms:
+        return None
+    blocks = []
+    for arm in arms.get("arms", []):
+        block = f"### Arm: {arm.get('label', 'Unnamed Arm')}\n"
+        block += f"**Type**: {arm.get('type', 'Not specified')}\n"
+        block += (
+            f"**Description**: {arm.get('description', 'No description provided')}\n"
+        )
+        if arm.get("interventionNames"):
+            block += (
+                f"**Interventions**: {', '.join(arm.get('interventionNames', []))}\n\n"
             )
-            result += (
-                f"**Maximum Age**: {eligibility.get('maximumAge', 'Not specified')}\n"
+        blocks.append(block)
+
+    for i, intervention in enumerate(arms.get("interventions", [])):
+        block = "### Detailed Interventions\n\n" if i == 0 else ""
+        block += f"**{intervention.get('type', 'Unknown Type')}**: {intervention.get('name', 'Unnamed')}\n"
+        block += f"**Description**: {intervention.get('description', 'No description provided')}\n"
+        if intervention.get("armGroupLabels"):
+            block += (
+                f"**Arms**: {', '.join(intervention.get('armGroupLabels', []))}\n\n"
             )
-            result += f"**Sex**: {eligibility.get('sex', 'Not specified')}\n"
-            result += f"**Gender**: {eligibility.get('gender', 'Not specified')}\n"
+        blocks.append(block)
+    return {
+        "title": "Arms and Interventions",
+        "header": "\n## Arms and Interventions\n\n",
+        "blocks": blocks,
+        "unit": "arms/interventions",
+    }
 
-            if eligibility.get("stdAges"):
-                result += (
-                    f"**Standard Ages**: {', '.join(eligibility.get('stdAges', []))}\n"
-                )
 
-            if eligibility.get("healthyVolunteers") is not None:
-                result += f"**Accepts Healthy Volunteers**: {'Yes' if eligibility.get('healthyVolunteers') else 'No'}\n"
+def ctgov_outcomes_section(study_data: dict) -> Dict[str, Any]:
+    outcomes = study_data.get("protocolSection", {}).get("outcomesModule", {})
+    if not outcomes:
+        return None
+    blocks = []
+    for key, heading in (
+        ("primaryOutcomes", "### Primary Outcomes\n\n"),
+        ("secondaryOutcomes", "### Secondary Outcomes\n\n"),
+    ):
+        for i, outcome in enumerate(outcomes.get(key, [])):
+            block = heading if i == 0 else ""
+            block += f"- **Measure**: {outcome.get('measure', 'Not specified')}\n"
+            block += f"  **Time Frame**: {outcome.get('timeFrame', 'Not specified')}\n"
+            if outcome.get("description"):
+                block += f"  **Description**: {outcome.get('description')}\n"
+            block += "\n"
+            blocks.append(block)
+    return {
+        "title": "Outcome Measures",
+        "header": "\n## Outcome Measures\n\n",
+        "blocks": blocks,
+        "unit": "outcome measures",
+    }
 
-            if eligibility.get("studyPopulation"):
-                result += (
-                    f"**Study Population**: {eligibility.get('studyPopulation')}\n"
-                )
 
-            if eligibility.get("samplingMethod"):
-                result += f"**Sampling Method**: {eligibility.get('samplingMethod')}\n"
-
-            if eligibility.get("criteria"):
-                result += "\n### Inclusion/Exclusion Criteria\n\n"
-                result += eligibility.get("criteria", "Not provided")
-                result += "\n"
-
-        if description:
-            result += "\n## Study Description\n\n"
-            if description.get("briefSummary"):
-                result += "### Brief Summary\n\n"
-                result += description.get("briefSummary", "Not provided")
-                result += "\n\n"
-
-            if description.get("detailedDescription"):
-                result += "### Detailed Description\n\n"
-                result += description.get("detailedDescription", "Not provided")
-                result += "\n\n"
-
-        if results:
-            result += "\n# Study Results\n\n"
-
-            if participant_flow:
-                result += "## Participant Flow\n\n"
-
-                if participant_flow.get("preAssignmentDetails"):
-                    result += (
-                        "**Pre-assignment Details**: "
-                        + participant_flow.get("preAssignmentDetails")
-                        + "\n\n"
-                    )
+def ctgov_eligibility_section(study_data: dict) -> Dict[str, Any]:
+    eligibility = study_data.get("protocolSection", {}).get("eligibilityModule", {})
+    if not eligibility:
+        return None
+    block = f"**Minimum Age**: {eligibility.get('minimumAge', 'Not specified')}\n"
+    block += f"**Maximum Age**: {eligibility.get('maximumAge', 'Not specified')}\n"
+    block += f"**Sex**: {eligibility.get('sex', 'Not specified')}\n"
+    block += f"**Gender**: {eligibility.get('gender', 'Not specified')}\n"
 
-                if participant_flow.get("recruitmentDetails"):
-                    result += (
-                        "**Recruitment Details**: "
-                        + participant_flow.get("recruitmentDetails")
-                        + "\n\n"
-                    )
+    if eligibility.get("stdAges"):
+        block += f"**Standard Ages**: {', '.join(eligibility.get('stdAges', []))}\n"
+
+    if eligibility.get("healthyVolunteers") is not None:
+        block += f"**Accepts Healthy Volunteers**: {'Yes' if eligibility.get('healthyVolunteers') else 'No'}\n"
+
+    if eligibility.get("studyPopulation"):
+        block += f"**Study Population**: {eligibility.get('studyPopulation')}\n"
+
+    if eligibility.get("samplingMethod"):
+        block += f"**Sampling Method**: {eligibility.get('samplingMethod')}\n"
+    blocks = [block]
+
+    if eligibility.get("criteria"):
+        lines = (eligibility.get("criteria", "Not provided") + "\n").splitlines(
+            keepends=True
+        )
+        lines[0] = "\n### Inclusion/Exclusion Criteria\n\n" + lines[0]
+        blocks.extend(lines)
+    return {
+        "title": "Eligibility",
+        "header": "\n## Eligibility\n\n",
+        "blocks": blocks,
+        "unit": "criteria lines",
+    }
+
+
+def ctgov_brief_summary_section(study_data: dict) -> Dict[str, Any]:
+    description = study_data.get("protocolSection", {}).get("descriptionModule", {})
+    if not description:
+        return None
+    blocks = []
+    if description.get("briefSummary"):
+        blocks.append(
+            "### Brief Summary\n\n"
+            + description.get("briefSummary", "Not provided")
+            + "\n\n"
+        )
+    return {
+        "title": "Study Description",
+        "header": "\n## Study Description\n\n",
+        "blocks": blocks,
+        "unit": "paragraphs",
+    }
+
+
+def ctgov_detailed_description_section(study_data: dict) -> Dict[str, Any]:
+    description = study_data.get("protocolSection", {}).get("descriptionModule", {})
+    if not description.get("detailedDescription"):
+        return None
+    lines = (
+        description.get("detailedDescription", "Not provided") + "\n\n"
+    ).splitlines(keepends=True)
+    lines[0] = "### Detailed Description\n\n" + lines[0]
+    return {
+        "title": "Detailed Description",
+        "header": "",
+        "blocks": lines,
+        "unit": "description lines",
+    }
+
+
+def ctgov_participant_flow_section(study_data: dict) -> Dict[str, Any]:
+    results = study_data.get("resultsSection", {})
+    if not results:
+        return None
+    participant_flow = results.get("participantFlowModule", {})
+    header = "\n# Study Results\n\n"
+    blocks = []
+    if participant_flow:
+        header += "## Participant Flow\n\n"
+        group_names = {
+            g.get("id"): g.get("title") for g in participant_flow.get("groups", [])
+        }
+
+        if participant_flow.get("preAssignmentDetails"):
+            blocks.append(
+                "**Pre-assignment Details**: "
+                + participant_flow.get("preAssignmentDetails")
+                + "\n\n"
+            )
+
+        if participant_flow.get("recruitmentDetails"):
+            blocks.append(
+                "**Recruitment Details**: "
+                + participant_flow.get("recruitmentDetails")
+                + "\n\n"
+            )
+
+        if participant_flow.get("groups"):
+            block = "### Study Groups\n\n"
+            for group in participant_flow.get("groups", []):
+                block += f"- **{group.get('title', 'Unnamed')}**: {group.get('description', 'No description')}\n"
+            blocks.append(block + "\n")
+
+        for i, period in enumerate(participant_flow.get("periods", [])):
+            block = "### Flow Periods\n\n" if i == 0 else ""
+            block += f"**{period.get('title', 'Unnamed Period')}**:\n\n"
+
+            if period.get("milestones"):
+                block += "**Milestones**:\n\n"
+                for milestone in period.get("milestones", []):
+                    block += f"- {milestone.get('type', 'Unnamed')}: "
+                    achievements = []
+                    for achievement in milestone.get("achievements", []):
+                        group_id = achievement.get("groupId")
+                        num = achievement.get("numSubjects", "0")
+                        group_name = group_names.get(group_id, group_id)
+                        achievements.append(f"{group_name}: {num}")
+                    block += ", ".join(achievements) + "\n"
+                block += "\n"
+
+            if period.get("dropWithdraws"):
+                block += "**Dropouts/Withdrawals**:\n\n"
+                for dropout in period.get("dropWithdraws", []):
+                    block += f"- {dropout.get('type', 'Unnamed')}: "
+                    reasons = []
+                    for reason in dropout.get("reasons", []):
+                        group_id = reason.get("groupId")
+                        num = reason.get("numSubjects", "0")
+                        group_name = group_names.get(group_id, group_id)
+                        reasons.append(f"{group_name}: {num}")
+                    block += ", ".join(reasons) + "\n"
+                block += "\n"
+            blocks.append(block)
+    return {
+        "title": "Participant Flow",
+        "header": header,
+        "blocks": blocks,
+        "unit": "flow entries",
+    }
+
+
+def ctgov_outcome_results_section(
+    study_data: dict, max_outcomes: int = None
+) -> Dict[str, Any]:
+    outcome_results = study_data.get("resultsSection", {}).get(
+        "outcomeMeasuresModule", {}
+    )
+    if not (outcome_results and outcome_results.get("outcomeMeasures")):
+        return None
+    blocks = []
+    for i, outcome in enumerate(outcome_results.get("outcomeMeasures", []), 1):
+        if max_outcomes is not None and i > max_outcomes:
+            blocks.append("*(Additional outcome measures available but not shown)*\n\n")
+            break
+
+        block = f"### {outcome.get('type', 'Outcome')} Outcome: {outcome.get('title', 'Unnamed')}\n\n"
+
+        if outcome.get("description"):
+            block += f"**Description**: {outcome.get('description')}\n"
+
+        if outcome.get("timeFrame"):
+            block += f"**Time Frame**: {outcome.get('timeFrame')}\n"
+
+        if outcome.get("classes"):
+            block += "\n**Results**:\n\n"
+            group_names = {
+                g.get("id"): g.get("title") for g in outcome.get("groups", [])
+            }
+
+            for cls in outcome.get("classes", []):
+                for cat in cls.get("categories", []):
+                    for measurement in cat.get("measurements", []):
+                        group_id = measurement.get("groupId")
+                        group_name = group_names.get(group_id, group_id)
+                        value = measurement.get("value", "")
+
+                        block += f"- {group_name}: {value} {outcome.get('unitOfMeasure', '')}\n"
+
+            block += "\n"
+
+        if outcome.get("analyses"):
+            block += "**Statistical Analysis**:\n\n"
+
+            for analysis in outcome.get("analyses", []):
+                method = analysis.get("statisticalMethod", "")
+                param_type = analysis.get("paramType", "")
+                param_value = analysis.get("paramValue", "")
+                p_value = analysis.get("pValue", "")
+
+                block += f"- Method: {method}\n"
+                block += f"  {param_type}: {param_value}\n"
+
+                if p_value:
+                    block += f"  p-value: {p_value}\n"
+
+                if analysis.get("ciPctValue"):
+                    block += f"  {analysis.get('ciPctValue')}% CI: [{analysis.get('ciLowerLimit', '')}, {analysis.get('ciUpperLimit', '')}]\n"
+
+                block += "\n"
+        blocks.append(block)
+    return {
+        "title": "Outcome Results",
+        "header": "## Outcome Results\n\n",
+        "blocks": blocks,
+        "unit": "outcome measures",
+    }
+
+
+def ctgov_adverse_events_section(study_data: dict) -> Dict[str, Any]:
+    adverse = study_data.get("resultsSection", {}).get("adverseEventsModule", {})
+    if not adverse:
+        return None
+    blocks = []
+    if adverse.get("description"):
+        blocks.append(f"**Description**: {adverse.get('description')}\n\n")
 
-                if participant_flow.get("groups"):
-                    result += "### Study Groups\n\n"
-                    for group in participant_flow.get("groups", []):
-                        result += f"- **{group.get('title', 'Unnamed')}**: {group.get('description', 'No description')}\n"
-                    result += "\n"
-
-                if participant_flow.get("periods"):
-                    result += "### Flow Periods\n\n"
-                    for period in participant_flow.get("periods", []):
-                        result += f"**{period.get('title', 'Unnamed Period')}**:\n\n"
-
-                        if period.get("milestones"):
-                            result += "**Milestones**:\n\n"
-                            for milestone in period.get("milestones", []):
-                                result += f"- {milestone.get('type', 'Unnamed')}: "
-                                achievements = []
-                                for achievement in milestone.get("achievements", []):
-                                    group_id = achievement.get("groupId")
-                                    num = achievement.get("numSubjects", "0")
-                                    group_name = next(
-                                        (
-                                            g.get("title")
-                                            for g in participant_flow.get("groups", [])
-                                            if g.get("id") == group_id
-                                        ),
-                                        group_id,
-                                    )
-                                    achievements.append(f"{group_name}: {num}")
-                                result += ", ".join(achievements) + "\n"
-                            result += "\n"
-
-                        if period.get("dropWithdraws"):
-                            result += "**Dropouts/Withdrawals**:\n\n"
-                            for dropout in period.get("dropWithdraws", []):
-                                result += f"- {dropout.get('type', 'Unnamed')}: "
-                                reasons = []
-                                for reason in dropout.get("reasons", []):
-                                    group_id = reason.get("groupId")
-                                    num = reason.get("numSubjects", "0")
-                                    group_name = next(
-                                        (
-                                            g.get("title")
-                                            for g in participant_flow.get("groups", [])
-                                            if g.get("id") == group_id
-                                        ),
-                                        group_id,
-                                    )
-                                    reasons.append(f"{group_name}: {num}")
-                                result += ", ".join(reasons) + "\n"
-                            result += "\n"
-
-            if outcome_results and outcome_results.get("outcomeMeasures"):
-                result += "## Outcome Results\n\n"
-
-                for i, outcome in enumerate(
-                    outcome_results.get("outcomeMeasures", []), 1
-                ):
-                    if i > 3:
-                        result += "*(Additional outcome measures available but not shown)*\n\n"
-                        break
-
-                    result += f"### {outcome.get('type', 'Outcome')} Outcome: {outcome.get('title', 'Unnamed')}\n\n"
-
-                    if outcome.get("description"):
-                        result += f"**Description**: {outcome.get('description')}\n"
-
-                    if outcome.get("timeFrame"):
-                        result += f"**Time Frame**: {outcome.get('timeFrame')}\n"
-
-                    if outcome.get("classes"):
-                        result += "\n**Results**:\n\n"
-
-                        for cls in outcome.get("classes", []):
-                            for cat in cls.get("categories", []):
-                                for measurement in cat.get("measurements", []):
-                                    group_id = measurement.get("groupId")
-                                    group_name = next(
-                                        (
-                                            g.get("title")
-                                            for g in outcome.get("groups", [])
-                                            if g.get("id") == group_id
-                                        ),
-                                        group_id,
-                                    )
-                                    value = measurement.get("value", "")
-
-                                    result += f"- {group_name}: {value} {outcome.get('unitOfMeasure', '')}\n"
-
-                        result += "\n"
-
-                    if outcome.get("analyses"):
-                        result += "**Statistical Analysis**:\n\n"
-
-                        for analysis in outcome.get("analyses", []):
-                            method = analysis.get("statisticalMethod", "")
-                            param_type = analysis.get("paramType", "")
-                            param_value = analysis.get("paramValue", "")
-                            p_value = analysis.get("pValue", "")
-
-                            result += f"- Method: {method}\n"
-                            result += f"  {param_type}: {param_value}\n"
-
-                            if p_value:
-                                result += f"  p-value: {p_value}\n"
-
-                            if analysis.get("ciPctValue"):
-                                result += f"  {analysis.get('ciPctValue')}% CI: [{analysis.get('ciLowerLimit', '')}, {analysis.get('ciUpperLimit', '')}]\n"
-
-                            result += "\n"
-
-            if adverse:
-                result += "## Adverse Events Summary\n\n"
-
-                if adverse.get("description"):
-                    result += f"**Description**: {adverse.get('description')}\n\n"
-
-                if adverse.get("eventGroups"):
-                    result += "### Event Groups\n\n"
-
-                    for group in adverse.get("eventGroups", []):
-                        result += f"- **{group.get('title', 'Unnamed')}**:\n"
-
-                        serious_affected = group.get("seriousNumAffected", 0)
-                        serious_at_risk = group.get("seriousNumAtRisk", 0)
-
-                        if serious_at_risk:
-                            result += f"  Serious Events: {serious_affected}/{serious_at_risk} participants\n"
-
-                        other_affected = group.get("otherNumAffected", 0)
-                        other_at_risk = group.get("otherNumAtRisk", 0)
+    event_groups = adverse.get("eventGroups", [])
+    for i, group in enumerate(event_groups):
+        block = "### Event Groups\n\n" if i == 0 else ""
+        block += f"- **{group.get('title', 'Unnamed')}**:\n"
 
-                        if other_at_risk:
-                            result += f"  Other Events: {other_affected}/{other_at_risk} participants\n"
+        serious_affected = group.get("seriousNumAffected", 0)
+        serious_at_risk = group.get("seriousNumAtRisk", 0)
+
+        if serious_at_risk:
+            block += (
+                f"  Serious Events: {serious_affected}/{serious_at_risk} participants\n"
+            )
+
+        other_affected = group.get("otherNumAffected", 0)
+        other_at_risk = group.get("otherNumAtRisk", 0)
+
+        if other_at_risk:
+            block += f"  Other Events: {other_affected}/{other_at_risk} participants\n"
+        if i == len(event_groups) - 1:
+            block += "\n"
+        blocks.append(block)
+    return {
+        "title": "Adverse Events Summary",
+        "header": "## Adverse Events Summary\n\n",
+        "blocks": blocks,
+        "unit": "event groups",
+    }
 
-                    result += "\n"
 
+# (priority, builder) in document order; lower priority numbers are rendered first
+# when a size budget forces the record to be split across pages
+CTGOV_DETAIL_SECTIONS = [
+    (0, ctgov_identification_section),
+    (0, ctgov_sponsor_section),
+    (1, ctgov_conditions_section),
+    (1, ctgov_design_section),
+    (3, ctgov_arms_section),
+    (2, ctgov_outcomes_section),
+    (1, ctgov_eligibility_section),
+    (1, ctgov_brief_summary_section),
+    (5, ctgov_detailed_description_section),
+    (4, ctgov_participant_flow_section),
+    (2, ctgov_outcome_results_section),
+    (4, ctgov_adverse_events_section),
+]
+
+# the parts of a study each section is built from, so a changed study only has
+# the sections over changed parts rebuilt
+CTGOV_SECTION_SOURCES = {
+    ctgov_identification_section: [
+        ("protocolSection", "identificationModule"),
+        ("protocolSection", "statusModule"),
+    ],
+    ctgov_sponsor_section: [("protocolSection", "sponsorCollaboratorsModule")],
+    ctgov_conditions_section: [("protocolSection", "conditionsModule")],
+    ctgov_design_section: [("protocolSection", "designModule")],
+    ctgov_arms_section: [("protocolSection", "armsInterventionsModule")],
+    ctgov_outcomes_section: [("protocolSection", "outcomesModule")],
+    ctgov_eligibility_section: [("protocolSection", "eligibilityModule")],
+    ctgov_brief_summary_section: [("protocolSection", "descriptionModule")],
+    ctgov_detailed_description_section: [("protocolSection", "descriptionModule")],
+    ctgov_participant_flow_section: [("resultsSection", "participantFlowModule")],
+    ctgov_outcome_results_section: [("resultsSection", "outcomeMeasuresModule")],
+    ctgov_adverse_events_section: [("resultsSection", "adverseEventsModule")],
+}
+
+
+def format_ctgov_trial_details(study_data: dict) -> str:
+    try:
+        result = ""
+        for _, builder in CTGOV_DETAIL_SECTIONS:
+            if builder is ctgov_outcome_results_section:
+                section = builder(study_data, max_outcomes=3)
+            else:
+                section = builder(study_data)
+            if section:
+                result += section["header"] + "".join(section["blocks"])
         return result
 
     except Exception as e:
         return f"Error formatting trial details: {str(e)}\n\nRaw data:\n{json.dumps(study_data, indent=2)[:5000]}..."
+
+
+TOKEN_BYTES = 4
+PAGE_NOTE_RESERVE = 300
+
+
+def split_oversized_block(block: str, max_bytes: int) -> List[str]:
+    if len(block.encode("utf-8")) <= max_bytes:
+        return [block]
+    pieces, current = [], ""
+    for line in block.splitlines(keepends=True):
+        while len(line.encode("utf-8")) > max_bytes:
+            cut = max_bytes
+            while len(line[:cut].encode("utf-8")) > max_bytes:
+                cut = cut * 3 // 4
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:cut])
+            line = line[cut:]
+        if current and len((current + line).encode("utf-8")) > max_bytes:
+            pieces.append(current)
+            current = ""
+        current += line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def render_ctgov_trial_details_page(
+    study_data: dict,
+    max_bytes: int,
+    cursor: Tuple[int, int] = (0, 0),
+    time_limit: float = 2.0,
+) -> Tuple[str, Optional[Tuple[int, int]]]:
+    started = time.perf_counter()
+    capacity = max(max_bytes - PAGE_NOTE_RESERVE, 500)
+    order = sorted(
+        range(len(CTGOV_DETAIL_SECTIONS)), key=lambda i: CTGOV_DETAIL_SECTIONS[i][0]
+    )
+    page: Dict[int, str] = {}
+    used = 0
+    next_cursor = None
+    for pos in range(cursor[0], len(order)):
+        if page and time.perf_counter() - started > time_limit:
+            next_cursor = (pos, 0)
+            break
+        section = CTGOV_DETAIL_SECTIONS[order[pos]][1](study_data)
+        if not section:
+            continue
+        blocks = [
+            piece
+            for block in section["blocks"]
+            for piece in split_oversized_block(block, capacity // 2)
+        ]
+        first = cursor[1] if pos == cursor[0] else 0
+        header = (
+            section["header"]
+            if first == 0
+            else f"\n## {section['title']} (continued)\n\n"
+        )
+        text = header
+        taken = first
+        for block in blocks[first:]:
+            cost = len(block.encode("utf-8"))
+            if taken == first:
+                cost += len(header.encode("utf-8"))
+            if used + cost > capacity and (page or taken > first):
+                break
+            # one section can hold thousands of sites or events, so the time
+            # limit is checked per block too; the rest continues on the next page
+            if (page or taken > first) and time.perf_counter() - started > time_limit:
+                break
+            text += block
+            used += cost
+            taken += 1
+        if taken == first and blocks[first:]:
+            next_cursor = (pos, first)
+            break
+        if not blocks:
+            if page and used + len(header.encode("utf-8")) > capacity:
+                next_cursor = (pos, 0)
+                break
+            used += len(header.encode("utf-8"))
+        page[order[pos]] = text
+        if taken < len(blocks):
+            page[
+                order[pos]
+            ] += f"\n*[{len(blocks) - taken} more {section['unit']} not shown]*\n"
+            next_cursor = (pos, taken)
+            break
+    return "".join(page[i] for i in sorted(page)), next_cursor
+
+
+############################################################################################################
+##normalized trial records (one flat row per trial with the same columns for both registries)
+
+TRIAL_RECORD_FIELDS = [
+    "source",
+    "trial_id",
+    "title",
+    "short_title",
+    "status",
+    "phase",
+    "sponsor",
+    "sponsor_type",
+    "conditions",
+    "countries",
+    "start_date",
+    "last_updated",
+    "enrollment",
+    "has_results",
+    "primary_endpoint",
+    "linked_ids",
+]
+TRIAL_RECORD_LIST_FIELDS = {"conditions", "countries", "linked_ids"}
+
+
+def as_int(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def eu_trial_record(trial: Dict[str, Any]) -> Dict[str, Any]:
+    conditions = safe_extract(trial, "conditions", default=[])
+    results = safe_extract(trial, "resultsFirstReceived")
+    return {
+        "source": "eu",
+        "trial_id": safe_extract(trial, "ctNumber"),
+        "title": safe_extract(trial, "ctTitle"),
+        "short_title": safe_extract(trial, "shortTitle"),
+        "status": safe_extract(trial, "ctStatus"),
+        "phase": safe_extract(trial, "trialPhase"),
+        "sponsor": safe_extract(trial, "sponsor"),
+        "sponsor_type": safe_extract(trial, "sponsorType"),
+        "conditions": [conditions] if isinstance(conditions, str) else conditions,
+        "countries": [
+            c.split(":")[0] for c in safe_extract(trial, "trialCountries", default=[])
+        ],
+        "start_date": safe_extract(trial, "startDateEU"),
+        "last_updated": safe_extract(trial, "lastUpdated"),
+        "enrollment": as_int(safe_extract(trial, "totalNumberEnrolled")),
+        "has_results": bool(results) and results != "No",
+        "primary_endpoint": safe_extract(trial, "primaryEndPoint"),
+        "linked_ids": sorted(
+            set(safe_extract(trial, "linkedTrialIds", default=[]))
+            | find_ids(trial, NCT_PATTERN)
+        ),
+    }
+
+
+def ctgov_study_record(study: Dict[str, Any]) -> Dict[str, Any]:
+    protocol = study.get("protocolSection", {})
+    identification = protocol.get("identificationModule", {})
+    status = protocol.get("statusModule", {})
+    sponsor = protocol.get("sponsorCollaboratorsModule", {}).get("leadSponsor", {})
+    design = protocol.get("designModule", {})
+    locations = protocol.get("contactsLocationsModule", {}).get("locations", [])
+    primary_outcomes = protocol.get("outcomesModule", {}).get("primaryOutcomes", [])
+    other_ids = [
+        info.get("id", "") for info in identification.get("secondaryIdInfos", [])
+    ]
+    other_ids.append(identification.get("orgStudyIdInfo", {}).get("id", ""))
+    return {
+        "source": "ctgov",
+        "trial_id": identification.get("nctId"),
+        "title": identification.get("officialTitle")
+        or identification.get("briefTitle"),
+        "short_title": identification.get("acronym")
+        or identification.get("briefTitle"),
+        "status": status.get("overallStatus"),
+        "phase": ", ".join(design.get("phases", [])) or None,
+        "sponsor": sponsor.get("name"),
+        "sponsor_type": sponsor.get("class"),
+        "conditions": protocol.get("conditionsModule", {}).get("conditions", []),
+        "countries": sorted({l["country"] for l in locations if l.get("country")}),
+        "start_date": status.get("startDateStruct", {}).get("date"),
+        "last_updated": status.get("lastUpdatePostDateStruct", {}).get("date"),
+        "enrollment": as_int(design.get("enrollmentInfo", {}).get("count")),
+        "has_results": bool(study.get("hasResults")),
+        "primary_endpoint": "; ".join(o.get("measure", "") for o in primary_outcomes)
+        or None,
+        "linked_ids": sorted(find_ids(other_ids, EU_ID_PATTERN)),
+    }
+
+
+############################################################################################################
+##typed outcome analyses (one row per statistical analysis, numbers parsed for cross-trial comparison)
+
+NUMBER_PATTERN = re.compile(r"([<>]=?|≤|≥)?\s*(-?\d*\.?\d+(?:[eE][-+]?\d+)?)")
+
+
+def as_float(value: Any) -> float:
+    match = NUMBER_PATTERN.search(str(value if value is not None else ""))
+    return float(match.group(2)) if match else float("nan")
+
+
+def p_value_qualifier(value: Any) -> str:
+    match = NUMBER_PATTERN.search(str(value or ""))
+    return (match.group(1) or "") if match else ""
+
+
+def ctgov_outcome_analyses(study: Dict[str, Any]) -> List[Dict[str, Any]]:
+    protocol = study.get("protocolSection", {})
+    trial_id = protocol.get("identificationModule", {}).get("nctId")
+    enrollment = as_float(
+        protocol.get("designModule", {}).get("enrollmentInfo", {}).get("count")
+    )
+    outcomes = (
+        study.get("resultsSection", {})
+        .get("outcomeMeasuresModule", {})
+        .get("outcomeMeasures", [])
+    )
+    rows = []
+    for outcome in outcomes:
+        base = {
+            "trial_id": trial_id,
+            "enrollment": enrollment,
+            "outcome_type": outcome.get("type", ""),
+            "title": outcome.get("title", ""),
+            "description": outcome.get("description", ""),
+            "time_frame": outcome.get("timeFrame", ""),
+            "unit": outcome.get("unitOfMeasure", ""),
+        }
+        # outcomes without a statistical analysis still count for enrollment
+        for analysis in outcome.get("analyses") or [{}]:
+            rows.append(
+                dict(
+                    base,
+                    method=analysis.get("statisticalMethod", ""),
+                    param_type=analysis.get("paramType", ""),
+                    param_value=as_float(analysis.get("paramValue")),
+                    p_value=as_float(analysis.get("pValue")),
+                    p_qualifier=p_value_qualifier(analysis.get("pValue")),
+                    ci_pct=as_float(analysis.get("ciPctValue")),
+                    ci_lower=as_float(analysis.get("ciLowerLimit")),
+                    ci_upper=as_float(analysis.get("ciUpperLimit")),
+                )
+            )
+    return rows
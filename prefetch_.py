@@ -0,0 +1,72 @@
+from registries_ import ctgov_study, ctis_retrieve
+from mirror_ import mirror_fresh
+from linking_ import NCT_PATTERN
+from shared_ import BackgroundDeferred, background, wait_until_idle
+from tracing_ import span, set_attributes
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+##############################################################################
+# speculative prefetch: after a search the client usually fetches details of
+# the top-ranked trials, so their raw records are fetched into the response
+# cache in the background. Prefetches run on their own small pool, wait for
+# interactive registry requests to drain and give up rather than queue for
+# rate-limit tokens (see shared_.background)
+
+PREFETCH_TRIALS = int(os.getenv("PREFETCH_TRIALS", "3"))
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "1"))
+# queued prefetches older than this are dropped; the client has moved on
+PREFETCH_MAX_AGE = float(os.getenv("PREFETCH_MAX_AGE", "60"))
+MAX_PENDING = 50
+
+_executor: Optional[ThreadPoolExecutor] = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def prefetch_trials(trials: List[List[str]], limit: Optional[int] = None) -> List[str]:
+    """Queues the IDs of the first limit (default PREFETCH_TRIALS) trials, each
+    given as its IDs in both registries; returns the IDs queued."""
+    global _executor
+    limit = PREFETCH_TRIALS if limit is None else limit
+    queued = []
+    with _lock:
+        for trial_id in [i for ids in trials[:limit] for i in ids]:
+            if trial_id in _pending or len(_pending) >= MAX_PENDING:
+                continue
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    PREFETCH_WORKERS, thread_name_prefix="prefetch"
+                )
+            _pending.add(trial_id)
+            _executor.submit(prefetch_trial, trial_id, time.monotonic())
+            queued.append(trial_id)
+    return queued
+
+
+def prefetch_trial(trial_id: str, queued_at: float) -> None:
+    try:
+        with background(), span("prefetch", trial_id=trial_id):
+            waited = time.monotonic() - queued_at
+            if not wait_until_idle(max(PREFETCH_MAX_AGE - waited, 0)):
+                set_attributes(outcome="expired")
+                return
+            try:
+                if NCT_PATTERN.fullmatch(trial_id):
+                    ctgov_study(trial_id, raw=True)
+                elif not mirror_fresh():
+                    ctis_retrieve(trial_id, raw=True)
+                set_attributes(outcome="fetched")
+            except BackgroundDeferred:
+                set_attributes(outcome="deferred")
+    except Exception as e:
+        logger.debug("prefetch of %s failed: %s", trial_id, e)
+    finally:
+        with _lock:
+            _pending.discard(trial_id)
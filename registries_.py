@@ -0,0 +1,322 @@
+from tracing_ import span, set_attributes
+from shared_ import (
+    response_cache,
+    http_session,
+    RateLimiter,
+    ctis_limiter,
+    ctgov_limiter,
+    request_timeout,
+    registry_request,
+    in_background,
+    BackgroundDeferred,
+    DeadlineExceeded,
+    DEADLINE_EXCEEDED,
+    REGISTRY_TIMEOUT,
+)
+from typing import Dict, Any, List, Optional, Tuple, Union
+import json
+import os
+import threading
+
+##############################################################################
+# registry endpoints (overridable so benchmarks can point at local stand-ins);
+# requests is imported on first call to keep server start-up fast and raw
+# responses are cached across clients; raw=True returns the undecoded body
+
+CTIS_API_URL = os.getenv(
+    "CTIS_API_URL", "https://euclinicaltrials.eu/ctis-public-api"
+).rstrip("/")
+CTGOV_API_URL = os.getenv("CTGOV_API_URL", "https://clinicaltrials.gov/api/v2").rstrip(
+    "/"
+)
+
+CTIS_HEADERS = {
+    "accept": "application/json",
+    "content-type": "application/json",
+    "origin": "https://euclinicaltrials.eu",
+}
+CTIS_COOKIES = {"accepted_cookie": "true"}
+
+
+_inflight: Dict[str, threading.Lock] = {}
+_inflight_lock = threading.Lock()
+
+
+def send_request(method: str, url: str, **kwargs):
+    """One registry request, bounded by the registry timeout and by the
+    deadline of the tool call it serves."""
+    timeout = kwargs.get("timeout", REGISTRY_TIMEOUT)
+    kwargs["timeout"] = request_timeout(timeout)
+    try:
+        with registry_request():
+            return http_session().request(method, url, **kwargs)
+    except Exception as e:
+        import requests
+
+        # a timeout shortened to the deadline means the deadline was reached
+        if isinstance(e, requests.Timeout) and kwargs["timeout"] != timeout:
+            raise DeadlineExceeded(DEADLINE_EXCEEDED) from e
+        raise
+
+
+def fetch_body(method: str, url: str, limiter: RateLimiter, **kwargs) -> bytes:
+    key = json.dumps(
+        [method, url, kwargs.get("params"), kwargs.get("json")],
+        sort_keys=True,
+        default=str,
+    )
+    body = response_cache.get(key)
+    if body is None:
+        # identical concurrent requests (e.g. from different clients) wait for
+        # the first one and read its cached response
+        with _inflight_lock:
+            lock = _inflight.setdefault(key, threading.Lock())
+        try:
+            if not lock.acquire(timeout=request_timeout(None) or -1):
+                raise DeadlineExceeded(DEADLINE_EXCEEDED)
+            try:
+                body = response_cache.get(key)
+                if body is None:
+                    if in_background():
+                        if not limiter.try_acquire(reserve=limiter.burst / 2):
+                            raise BackgroundDeferred("registry rate limit is busy")
+                    else:
+                        waited = limiter.acquire()
+                        if waited:
+                            set_attributes(rate_limited_ms=round(waited * 1000, 1))
+                    response = send_request(method, url, **kwargs)
+                    response.raise_for_status()
+                    body = response.content
+                    # bytes on the wire (compressed) next to the decoded size
+                    set_attributes(
+                        encoding=response.headers.get("Content-Encoding", "identity"),
+                        wire_bytes=response.raw.tell(),
+                        bytes=len(body),
+                    )
+                    response_cache.set(key, body, len(body))
+            finally:
+                lock.release()
+        finally:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+    else:
+        set_attributes(cache="hit")
+    return body
+
+
+def fetch_fresh(
+    method: str,
+    url: str,
+    limiter: RateLimiter,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    **kwargs,
+) -> Tuple[Optional[bytes], Dict[str, Optional[str]]]:
+    """Bypasses the response cache for polling; the body is None when the server
+    answers a conditional request with 304 Not Modified."""
+    headers = dict(kwargs.pop("headers", None) or {})
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    waited = limiter.acquire()
+    if waited:
+        set_attributes(rate_limited_ms=round(waited * 1000, 1))
+    response = send_request(method, url, headers=headers, **kwargs)
+    validators = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+    if response.status_code == 304:
+        set_attributes(not_modified=True)
+        return None, validators
+    response.raise_for_status()
+    return response.content, validators
+
+
+def fetch_json(method: str, url: str, limiter: RateLimiter, **kwargs) -> Dict[str, Any]:
+    body = fetch_body(method, url, limiter, **kwargs)
+    with span("json.decode", bytes=len(body)):
+        return json.loads(body)
+
+
+def ctis_search(payload: Dict[str, Any]) -> Dict[str, Any]:
+    with span("ctis.search", page=payload.get("pagination", {}).get("page")):
+        return fetch_json(
+            "POST",
+            f"{CTIS_API_URL}/search",
+            ctis_limiter,
+            cookies=CTIS_COOKIES,
+            headers=CTIS_HEADERS,
+            json=payload,
+            timeout=10,
+        )
+
+
+def ctis_search_fresh(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """A CTIS search that bypasses the response cache, for syncs that must see
+    the registry's current state."""
+    with span("ctis.search", page=payload.get("pagination", {}).get("page")):
+        body, _ = fetch_fresh(
+            "POST",
+            f"{CTIS_API_URL}/search",
+            ctis_limiter,
+            cookies=CTIS_COOKIES,
+            headers=CTIS_HEADERS,
+            json=payload,
+            timeout=10,
+        )
+    with span("json.decode", bytes=len(body)):
+        return json.loads(body)
+
+
+def ctis_retrieve(ct_number: str, raw: bool = False) -> Union[Dict[str, Any], bytes]:
+    with span("ctis.retrieve", trial_id=ct_number):
+        return (fetch_body if raw else fetch_json)(
+            "GET",
+            f"{CTIS_API_URL}/retrieve/{ct_number}",
+            ctis_limiter,
+            cookies=CTIS_COOKIES,
+            headers=CTIS_HEADERS,
+            timeout=10,
+        )
+
+
+def ctgov_studies(params: Dict[str, Any]) -> Dict[str, Any]:
+    with span("ctgov.studies", page_token=params.get("pageToken", "")):
+        return fetch_json(
+            "GET", f"{CTGOV_API_URL}/studies", ctgov_limiter, params=params
+        )
+
+
+def ctgov_study(nct_id: str, raw: bool = False) -> Union[Dict[str, Any], bytes]:
+    with span("ctgov.study", trial_id=nct_id):
+        return (fetch_body if raw else fetch_json)(
+            "GET",
+            f"{CTGOV_API_URL}/studies/{nct_id}",
+            ctgov_limiter,
+            params={"format": "json", "markupFormat": "markdown"},
+        )
+
+
+def ctis_retrieve_if_changed(
+    ct_number: str, etag: Optional[str] = None, last_modified: Optional[str] = None
+) -> Tuple[Optional[bytes], Dict[str, Optional[str]]]:
+    with span("ctis.retrieve", trial_id=ct_number, conditional=True):
+        return fetch_fresh(
+            "GET",
+            f"{CTIS_API_URL}/retrieve/{ct_number}",
+            ctis_limiter,
+            etag,
+            last_modified,
+            cookies=CTIS_COOKIES,
+            headers=CTIS_HEADERS,
+            timeout=10,
+        )
+
+
+def ctis_last_updated(ct_number: str) -> Optional[str]:
+    """The lastUpdated date of one trial from a small, uncached CTIS search."""
+    with span("ctis.search", trial_id=ct_number):
+        body, _ = fetch_fresh(
+            "POST",
+            f"{CTIS_API_URL}/search",
+            ctis_limiter,
+            cookies=CTIS_COOKIES,
+            headers=CTIS_HEADERS,
+            json={
+                "pagination": {"page": 1, "size": 5},
+                "searchCriteria": {"containAll": ct_number},
+            },
+            timeout=10,
+        )
+    for record in json.loads(body).get("data", []):
+        if record.get("ctNumber") == ct_number:
+            return record.get("lastUpdated")
+    return None
+
+
+def ctgov_study_if_changed(
+    nct_id: str, etag: Optional[str] = None, last_modified: Optional[str] = None
+) -> Tuple[Optional[bytes], Dict[str, Optional[str]]]:
+    with span("ctgov.study", trial_id=nct_id, conditional=True):
+        return fetch_fresh(
+            "GET",
+            f"{CTGOV_API_URL}/studies/{nct_id}",
+            ctgov_limiter,
+            etag,
+            last_modified,
+            params={"format": "json", "markupFormat": "markdown"},
+        )
+
+
+def ctgov_last_updates(nct_ids: List[str]) -> Dict[str, str]:
+    """lastUpdatePostDate of many studies from uncached searches that return only
+    the ID and that date."""
+    updates = {}
+    for start in range(0, len(nct_ids), 500):
+        params = {
+            "format": "json",
+            "filter.ids": ",".join(nct_ids[start : start + 500]),
+            "fields": "NCTId,LastUpdatePostDate",
+            "pageSize": 1000,
+        }
+        with span("ctgov.studies", ids=len(params["filter.ids"].split(","))):
+            body, _ = fetch_fresh(
+                "GET", f"{CTGOV_API_URL}/studies", ctgov_limiter, params=params
+            )
+        for study in json.loads(body).get("studies", []):
+            protocol = study.get("protocolSection", {})
+            nct_id = protocol.get("identificationModule", {}).get("nctId")
+            date = (
+                protocol.get("statusModule", {})
+                .get("lastUpdatePostDateStruct", {})
+                .get("date")
+            )
+            if nct_id:
+                updates[nct_id] = date
+    return updates
+
+
+def eu_search_criteria(
+    search_terms: str, status: int, condition: str = "", sponsor: str = ""
+) -> Dict[str, Any]:
+    criteria = {"containAll": search_terms, "status": [status]}
+    if condition:
+        criteria["medicalCondition"] = condition
+    if sponsor:
+        criteria["sponsor"] = sponsor
+    return criteria
+
+
+# the ClinicalTrials.gov overall statuses closest to each CTIS status code
+CTGOV_STATUSES = {
+    1: "NOT_YET_RECRUITING",
+    4: "RECRUITING|NOT_YET_RECRUITING|ENROLLING_BY_INVITATION",
+    5: "ACTIVE_NOT_RECRUITING",
+    8: "COMPLETED",
+}
+
+
+def ctgov_search_params(
+    query: str,
+    page_size: int,
+    condition: str = "",
+    location: str = "",
+    sponsor: str = "",
+    overall_status: str = "COMPLETED",
+) -> Dict[str, Any]:
+    params = {
+        "format": "json",
+        "markupFormat": "markdown",
+        "query.term": query.replace(" ", "+"),
+        "filter.overallStatus": overall_status,
+        "pageSize": page_size,
+    }
+    if condition:
+        params["query.cond"] = condition
+    if location:
+        params["query.locn"] = location
+    if sponsor:
+        params["query.spons"] = sponsor
+    return params
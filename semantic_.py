@@ -0,0 +1,521 @@
+from registries_ import eu_search_criteria, ctgov_search_params
+from export_ import iter_eu_trials, iter_ctgov_studies, CTGOV_EXPORT_PAGE_SIZE
+from mirror_ import CTIS_MIRROR_FILE, search_text, unpack, connect as connect_mirror
+from tracing_ import span, set_attributes
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+##############################################################################
+# local semantic search: trial text is embedded with LSA over hashed TF-IDF
+# features (a randomized SVD computed with numpy, no network model), so
+# synonyms that co-occur across trials land close together; queries use a
+# brute-force scan or an inverted-file (IVF) index over k-means clusters;
+# the index is a versioned snapshot of .npy files that is memory-mapped on
+# load, so start-up cost does not grow with the corpus and server processes
+# share its pages through the OS cache
+
+SEMANTIC_INDEX_DIR = os.getenv("SEMANTIC_INDEX_DIR", "semantic_index")
+SEMANTIC_DIMENSIONS = int(os.getenv("SEMANTIC_DIMENSIONS", "128"))
+SEMANTIC_PROBES = int(os.getenv("SEMANTIC_PROBES", "8"))
+# bumped whenever the arrays of the snapshot change; older snapshots are rebuilt
+SNAPSHOT_VERSION = 2
+HASH_BUCKETS = 2**16
+OVERSAMPLING = 10
+POWER_ITERATIONS = 2
+KMEANS_ITERATIONS = 10
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = set("""
+    a an and are as at be by for from in into is it of on or than that the their
+    this to with without vs versus study trial phase patients participants subjects
+    """.split())
+# the fields of a ClinicalTrials.gov study kept with the index: enough for the
+# relevance prompt and cross-registry linking without refetching the study
+CTGOV_RECORD_MODULES = [
+    "identificationModule",
+    "statusModule",
+    "conditionsModule",
+    "sponsorCollaboratorsModule",
+    "designModule",
+]
+
+
+def load_numpy():
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError("semantic search needs numpy (pip install numpy)") from None
+    return np
+
+
+##############################################################################
+# documents
+
+
+def ctgov_text(study: Dict[str, Any]) -> str:
+    protocol = study.get("protocolSection", {})
+    identification = protocol.get("identificationModule", {})
+    conditions = protocol.get("conditionsModule", {})
+    interventions = protocol.get("armsInterventionsModule", {}).get("interventions", [])
+    values = [
+        identification.get("briefTitle"),
+        identification.get("officialTitle"),
+        identification.get("acronym"),
+        protocol.get("sponsorCollaboratorsModule", {})
+        .get("leadSponsor", {})
+        .get("name"),
+        protocol.get("descriptionModule", {}).get("briefSummary"),
+        *conditions.get("conditions", []),
+        *conditions.get("keywords", []),
+        *[i.get("name") for i in interventions],
+    ]
+    return " ".join(str(v) for v in values if v).lower()
+
+
+def ctgov_record(study: Dict[str, Any]) -> Dict[str, Any]:
+    protocol = study.get("protocolSection", {})
+    record = {
+        "protocolSection": {
+            module: protocol[module]
+            for module in CTGOV_RECORD_MODULES
+            if module in protocol
+        },
+        "hasResults": study.get("hasResults", False),
+    }
+    summary = protocol.get("descriptionModule", {}).get("briefSummary")
+    if summary:
+        record["protocolSection"]["descriptionModule"] = {"briefSummary": summary}
+    return record
+
+
+def mirror_documents(mirror_path: Optional[str] = None) -> Iterator[Tuple]:
+    connection = connect_mirror(mirror_path)
+    try:
+        for ct_number, blob in connection.execute(
+            "SELECT ct_number, search_record FROM trials"
+        ):
+            record = unpack(blob)
+            yield ct_number, "eu", search_text(record), record
+    finally:
+        connection.close()
+
+
+def registry_documents(
+    search_terms: str, sources: str = "both", max_trials: int = 1000
+) -> Iterator[Tuple]:
+    if sources in ("both", "eu"):
+        for status in (1, 4, 5, 8):
+            criteria = eu_search_criteria(search_terms, status)
+            for trial in iter_eu_trials(criteria, max_trials):
+                yield trial["ctNumber"], "eu", search_text(trial), trial
+    if sources in ("both", "ctgov"):
+        params = ctgov_search_params(search_terms, CTGOV_EXPORT_PAGE_SIZE)
+        for study in iter_ctgov_studies(params, max_trials):
+            nct_id = (
+                study.get("protocolSection", {})
+                .get("identificationModule", {})
+                .get("nctId")
+            )
+            if nct_id:
+                yield nct_id, "ctgov", ctgov_text(study), ctgov_record(study)
+
+
+##############################################################################
+# hashed TF-IDF features (rows are l2-normalized, stored as CSR arrays)
+
+
+def tokens(text: str) -> List[str]:
+    words = [w for w in WORD_PATTERN.findall(text.lower()) if w not in STOPWORDS]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def buckets(text: str) -> List[int]:
+    return [zlib.crc32(t.encode("utf-8")) % HASH_BUCKETS for t in tokens(text)]
+
+
+def term_counts(texts: Iterable[str]):
+    np = load_numpy()
+    indptr, indices, counts = [0], [], []
+    for text in texts:
+        ids, n = np.unique(np.array(buckets(text), dtype=np.int64), return_counts=True)
+        indices.append(ids)
+        counts.append(n)
+        indptr.append(indptr[-1] + len(ids))
+    return (
+        np.array(indptr, dtype=np.int64),
+        np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64),
+        np.concatenate(counts) if counts else np.zeros(0, dtype=np.int64),
+    )
+
+
+def tfidf_rows(indptr, indices, counts, idf):
+    np = load_numpy()
+    data = ((1 + np.log(counts)) * idf[indices]).astype(np.float32)
+    norms = np.sqrt(np.add.reduceat(data**2, indptr[:-1]))
+    data /= np.repeat(norms, np.diff(indptr))
+    return data
+
+
+def coo_matmul(rows, columns, data, matrix, height: int):
+    """A sparse matrix in coordinate form times a dense matrix, one output column at a time."""
+    np = load_numpy()
+    out = np.empty((height, matrix.shape[1]), dtype=np.float32)
+    for j, column in enumerate(np.ascontiguousarray(matrix.T)):
+        out[:, j] = np.bincount(rows, weights=data * column[columns], minlength=height)
+    return out
+
+
+class SparseRows:
+    """The feature matrix in coordinate form, for the products of the randomized SVD."""
+
+    def __init__(self, indptr, indices, data, columns: int):
+        np = load_numpy()
+        self.rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        self.indices, self.data = indices, data
+        self.shape = (len(indptr) - 1, columns)
+
+    def dot(self, matrix):
+        return coo_matmul(self.rows, self.indices, self.data, matrix, self.shape[0])
+
+    def tdot(self, matrix):
+        return coo_matmul(self.indices, self.rows, self.data, matrix, self.shape[1])
+
+
+def lsa_components(features: SparseRows, dimensions: int, seed: int = 0):
+    """Top right singular vectors of the feature matrix (randomized SVD)."""
+    np = load_numpy()
+    rng = np.random.default_rng(seed)
+    rank = min(dimensions + OVERSAMPLING, *features.shape)
+    omega = rng.standard_normal((features.shape[1], rank), dtype=np.float32)
+    basis, _ = np.linalg.qr(features.dot(omega))
+    for _ in range(POWER_ITERATIONS):
+        basis, _ = np.linalg.qr(features.dot(features.tdot(basis)))
+    # the SVD of the wide rank x buckets matrix B = basis^T X comes from the
+    # eigendecomposition of the small B B^T
+    wide = features.tdot(basis)
+    eigenvalues, vectors = np.linalg.eigh(wide.T @ wide)
+    keep = np.argsort(eigenvalues)[::-1][: min(dimensions, rank)]
+    singular = np.sqrt(np.maximum(eigenvalues[keep], 1e-12))
+    return np.ascontiguousarray(wide @ (vectors[:, keep] / singular), dtype=np.float32)
+
+
+def normalize(vectors):
+    np = load_numpy()
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def kmeans(vectors, clusters: int, seed: int = 0):
+    """Spherical k-means; returns unit centroids and each vector's cluster."""
+    np = load_numpy()
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)]
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        filled = np.bincount(assignment, minlength=clusters) > 0
+        centroids[filled] = normalize(sums[filled])
+    return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+
+##############################################################################
+# build
+
+
+def build_index(
+    documents: Iterable[Tuple], path: Optional[str] = None
+) -> Dict[str, Any]:
+    np = load_numpy()
+    path = path or SEMANTIC_INDEX_DIR
+    started = time.perf_counter()
+    tmp_path = f"{path}.tmp"
+    os.makedirs(tmp_path, exist_ok=True)
+    ids, sources, texts, offsets, seen = [], [], [], [], set()
+    with open(os.path.join(tmp_path, "records.jsonl"), "wb") as records:
+        for trial_id, source, text, record in documents:
+            if trial_id in seen or not buckets(text):
+                continue
+            seen.add(trial_id)
+            ids.append(trial_id)
+            sources.append(source)
+            texts.append(text)
+            offsets.append(records.tell())
+            records.write(json.dumps(record, default=str).encode("utf-8") + b"\n")
+    if not ids:
+        raise ValueError("no trial text to index")
+
+    indptr, indices, counts = term_counts(texts)
+    df = np.bincount(indices, minlength=HASH_BUCKETS)
+    idf = (np.log((1 + len(ids)) / (1 + df)) + 1).astype(np.float32)
+    features = SparseRows(
+        indptr, indices, tfidf_rows(indptr, indices, counts, idf), HASH_BUCKETS
+    )
+    components = lsa_components(features, SEMANTIC_DIMENSIONS)
+    vectors = normalize(features.dot(components)).astype(np.float32)
+    clusters = max(1, int(np.sqrt(len(ids))))
+    centroids, assignment = kmeans(vectors, clusters)
+    order = np.argsort(assignment, kind="stable")
+    # fixed-width bytes map directly from disk, unlike a pickled list of str
+    trial_ids = np.array(ids, dtype=np.bytes_)
+    id_order = np.argsort(trial_ids, kind="stable")
+    list_offsets = np.searchsorted(assignment[order], np.arange(clusters + 1))
+
+    arrays = {
+        "ids": trial_ids,
+        "sorted_ids": trial_ids[id_order],
+        "id_positions": id_order.astype(np.int64),
+        "sources": np.array(sources, dtype=np.bytes_),
+        "offsets": np.array(offsets, dtype=np.int64),
+        "idf": idf,
+        "components": components,
+        "vectors": vectors,
+        "centroids": centroids.astype(np.float32),
+        "list_order": order.astype(np.int64),
+        "list_offsets": list_offsets.astype(np.int64),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+    stats = {
+        "trials": len(ids),
+        "eu": sources.count("eu"),
+        "ctgov": sources.count("ctgov"),
+        "dimensions": components.shape[1],
+        "clusters": clusters,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    with open(os.path.join(tmp_path, "meta.json"), "w") as meta:
+        json.dump(dict(stats, version=SNAPSHOT_VERSION, built_at=time.time()), meta)
+    # swap the finished index in so readers never see a half-written one
+    if os.path.exists(path):
+        old_path = f"{path}.old"
+        os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        for name in os.listdir(old_path):
+            os.remove(os.path.join(old_path, name))
+        os.rmdir(old_path)
+    else:
+        os.replace(tmp_path, path)
+    return stats
+
+
+##############################################################################
+# search
+
+
+class SemanticIndex:
+    def __init__(self, path: str):
+        np = load_numpy()
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as meta:
+            self.meta = json.load(meta)
+        if self.meta.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(
+                f"semantic index in {path} has format version {self.meta.get('version', 1)}, "
+                f"expected {SNAPSHOT_VERSION}; rebuild it"
+            )
+        # mapped, not read: pages are loaded on first touch and shared between processes
+        for name in os.listdir(path):
+            if name.endswith(".npy"):
+                array = np.load(os.path.join(path, name), mmap_mode="r")
+                setattr(self, name[:-4], array)
+
+    def position(self, trial_id: str) -> int:
+        key = trial_id.encode("utf-8")
+        i = int(self.sorted_ids.searchsorted(key))
+        if i == len(self.sorted_ids) or self.sorted_ids[i] != key:
+            raise KeyError(trial_id)
+        return int(self.id_positions[i])
+
+    def embed(self, text: str):
+        np = load_numpy()
+        ids, counts = np.unique(
+            np.array(buckets(text), dtype=np.int64), return_counts=True
+        )
+        if not len(ids):
+            return None
+        weights = (1 + np.log(counts)) * self.idf[ids]
+        return normalize(weights.astype(np.float32) @ self.components[ids])
+
+    def search(
+        self,
+        text: str,
+        top_k: int = 10,
+        source: Optional[str] = None,
+        exact: bool = False,
+        probes: Optional[int] = None,
+    ) -> List[Tuple[str, str, float]]:
+        np = load_numpy()
+        query = self.embed(text)
+        if query is None:
+            return []
+        if exact:
+            candidates = np.arange(len(self.ids))
+        else:
+            probes = min(probes or SEMANTIC_PROBES, len(self.centroids))
+            nearest = np.argpartition(-(self.centroids @ query), probes - 1)[:probes]
+            candidates = np.concatenate(
+                [
+                    self.list_order[self.list_offsets[c] : self.list_offsets[c + 1]]
+                    for c in nearest
+                ]
+            )
+        if source in ("eu", "ctgov"):
+            candidates = candidates[self.sources[candidates] == source.encode()]
+        if not len(candidates):
+            return []
+        scores = self.vectors[candidates] @ query
+        k = min(top_k, len(candidates))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [
+            (self.ids[i].decode(), self.sources[i].decode(), float(s))
+            for i, s in zip(candidates[best], scores[best])
+        ]
+
+    def records(self, trial_ids: List[str]) -> List[Dict[str, Any]]:
+        records = []
+        with open(os.path.join(self.path, "records.jsonl"), "rb") as f:
+            for trial_id in trial_ids:
+                f.seek(int(self.offsets[self.position(trial_id)]))
+                records.append(json.loads(f.readline()))
+        return records
+
+
+_index: Optional[SemanticIndex] = None
+_index_lock = threading.Lock()
+
+
+def load_index(path: Optional[str] = None) -> Optional[SemanticIndex]:
+    """The index at path, loaded once and reloaded after a rebuild."""
+    global _index
+    path = path or SEMANTIC_INDEX_DIR
+    meta_path = os.path.join(path, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with _index_lock:
+        built_at = os.path.getmtime(meta_path)
+        if _index is None or _index.path != path or _index.loaded_at != built_at:
+            with span("semantic.load"):
+                try:
+                    _index = SemanticIndex(path)
+                except (ValueError, ImportError) as e:
+                    # an old snapshot or a missing numpy: search the registries instead
+                    logger.warning("%s", e)
+                    _index = None
+                    return None
+                _index.loaded_at = built_at
+        return _index
+
+
+def semantic_candidates(
+    text: str, top_k: int, path: Optional[str] = None, **filters
+) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+    """The top_k nearest EU search records and ClinicalTrials.gov studies, or None without an index."""
+    index = load_index(path)
+    if index is None:
+        return None
+    candidates = {}
+    with span("semantic.search", top_k=top_k):
+        for source in ("eu", "ctgov"):
+            # over-fetch so that filtering by status or sponsor still fills top_k
+            hits = index.search(text, top_k * 4, source=source)
+            records = [
+                r
+                for r in index.records([trial_id for trial_id, _, _ in hits])
+                if record_matches(r, source, **filters)
+            ]
+            candidates[source] = records[:top_k]
+        set_attributes(
+            eu_candidates=len(candidates["eu"]),
+            ctgov_candidates=len(candidates["ctgov"]),
+        )
+    return candidates
+
+
+def record_matches(
+    record: Dict[str, Any],
+    source: str,
+    status: Optional[str] = None,
+    ctgov_status: Optional[str] = None,
+    condition: str = "",
+    sponsor: str = "",
+) -> bool:
+    if source == "eu":
+        fields = {
+            "status": (record.get("ctStatus") or "").lower(),
+            "condition": str(record.get("conditions") or "").lower(),
+            "sponsor": (record.get("sponsor") or "").lower(),
+        }
+        wanted_status = (status or "").lower()
+    else:
+        protocol = record.get("protocolSection", {})
+        fields = {
+            "status": protocol.get("statusModule", {}).get("overallStatus", ""),
+            "condition": " ".join(
+                protocol.get("conditionsModule", {}).get("conditions", [])
+            ).lower(),
+            "sponsor": protocol.get("sponsorCollaboratorsModule", {})
+            .get("leadSponsor", {})
+            .get("name", "")
+            .lower(),
+        }
+        wanted_status = ctgov_status or ""
+    if wanted_status and fields["status"] not in wanted_status.split("|"):
+        return False
+    return condition.lower() in fields["condition"] and (
+        sponsor.lower() in fields["sponsor"]
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local semantic search over trials.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Build the index from scratch")
+    build.add_argument(
+        "--terms",
+        nargs="*",
+        default=[],
+        help="Index the results of these registry searches",
+    )
+    build.add_argument(
+        "--mirror", action="store_true", help="Index every trial of the CTIS mirror"
+    )
+    build.add_argument("--mirror-file", default=CTIS_MIRROR_FILE)
+    build.add_argument("--sources", choices=["both", "eu", "ctgov"], default="both")
+    build.add_argument("--max-trials", type=int, default=1000)
+    query = commands.add_parser("query", help="Search the index")
+    query.add_argument("text")
+    query.add_argument("--top-k", type=int, default=10)
+    query.add_argument("--exact", action="store_true", help="Brute-force search")
+    for command in (build, query):
+        command.add_argument("--dir", default=SEMANTIC_INDEX_DIR)
+    args = parser.parse_args()
+    if args.command == "build":
+
+        def documents():
+            if args.mirror:
+                yield from mirror_documents(args.mirror_file)
+            for terms in args.terms:
+                yield from registry_documents(terms, args.sources, args.max_trials)
+
+        print(json.dumps(build_index(documents(), args.dir)))
+    else:
+        index = load_index(args.dir)
+        if index is None:
+            raise SystemExit(f"No semantic index in {args.dir}; run build first.")
+        started = time.perf_counter()
+        hits = index.search(args.text, args.top_k, exact=args.exact)
+        elapsed = (time.perf_counter() - started) * 1000
+        for trial_id, source, score in hits:
+            print(f"{score:.3f}  {source:5}  {trial_id}")
+        print(f"({elapsed:.1f} ms over {len(index.ids)} trials)")
@@ -0,0 +1,312 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Hashable, Optional
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+import weakref
+
+##############################################################################
+# state shared by every client of one server process: caches, HTTP pool,
+# rate limiters and per-client concurrency limits (0 disables a limit)
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "900"))
+RESPONSE_CACHE_MB = float(os.getenv("RESPONSE_CACHE_MB", "64"))
+VERDICT_CACHE_TTL = float(os.getenv("VERDICT_CACHE_TTL", "86400"))
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", "20000"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+REGISTRY_TIMEOUT = float(os.getenv("REGISTRY_TIMEOUT", "30"))
+CTIS_RATE_LIMIT = float(os.getenv("CTIS_RATE_LIMIT", "0"))
+CTGOV_RATE_LIMIT = float(os.getenv("CTGOV_RATE_LIMIT", "0"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "0"))
+CLIENT_CONCURRENCY = int(os.getenv("CLIENT_CONCURRENCY", "4"))
+
+
+class TTLCache:
+    def __init__(self, max_size: float, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, size: int = 1) -> None:
+        if self.ttl <= 0 or size > self.max_size:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, value, size)
+            self.size += size
+            while self.size > self.max_size:
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key: Hashable) -> None:
+        self.size -= self.entries.pop(key)[2]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+# raw response bytes, decoded per hit so callers never share mutable dicts
+response_cache = TTLCache(RESPONSE_CACHE_MB * 2**20, RESPONSE_CACHE_TTL)
+verdict_cache = TTLCache(VERDICT_CACHE_SIZE, VERDICT_CACHE_TTL)
+
+
+def verdict_key(user_request: str, trial_id: str, model: str) -> tuple:
+    return (" ".join(user_request.lower().split()), trial_id, model)
+
+
+##############################################################################
+# outbound limits
+
+
+class RateLimiter:
+    """Token bucket shared by all worker threads calling one registry."""
+
+    def __init__(self, rate: float, burst: int = 10):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def try_acquire(self, reserve: float = 0.0) -> bool:
+        """Takes a token only if more than reserve would be left; never waits."""
+        if self.rate <= 0:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens - 1 < reserve:
+                return False
+            self.tokens -= 1
+            return True
+
+
+ctis_limiter = RateLimiter(CTIS_RATE_LIMIT)
+ctgov_limiter = RateLimiter(CTGOV_RATE_LIMIT)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def http_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=4, pool_maxsize=HTTP_POOL_SIZE
+            )
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+class LoopSemaphore:
+    """asyncio.Semaphore per event loop, so module-level limits survive asyncio.run."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.semaphores = weakref.WeakKeyDictionary()
+
+    def __call__(self):
+        if self.limit <= 0:
+            return NoLimit()
+        loop = asyncio.get_running_loop()
+        if loop not in self.semaphores:
+            self.semaphores[loop] = asyncio.Semaphore(self.limit)
+        return self.semaphores[loop]
+
+
+class NoLimit:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+llm_slot = LoopSemaphore(LLM_CONCURRENCY)
+
+
+class ClientLimiter:
+    """Caps concurrent tool calls per MCP session so one client cannot starve the rest."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.semaphores = weakref.WeakKeyDictionary()
+
+    def __call__(self, ctx=None):
+        try:
+            session = ctx.session if ctx is not None else None
+        except ValueError:
+            session = None
+        if session is None or self.limit <= 0:
+            return NoLimit()
+        if session not in self.semaphores:
+            self.semaphores[session] = asyncio.Semaphore(self.limit)
+        return self.semaphores[session]
+
+
+client_slot = ClientLimiter(CLIENT_CONCURRENCY)
+
+
+def per_client(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        async with client_slot(kwargs.get("ctx")):
+            return await func(*args, **kwargs)
+
+    return wrapper
+
+
+##############################################################################
+# per-call deadlines: an absolute time.monotonic() value (the clock asyncio
+# loops use) that follows the call into tasks and worker threads
+
+
+DEADLINE_EXCEEDED = "deadline exceeded"
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline_after(seconds: Optional[float]):
+    current = _deadline.get()
+    deadline = time.monotonic() + seconds if seconds and seconds > 0 else None
+    if current is not None and (deadline is None or current < deadline):
+        deadline = current
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def current_deadline() -> Optional[float]:
+    return _deadline.get()
+
+
+def remaining_seconds() -> Optional[float]:
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def request_timeout(default: Optional[float]) -> Optional[float]:
+    remaining = remaining_seconds()
+    if remaining is None:
+        return default
+    if remaining <= 0:
+        raise DeadlineExceeded(DEADLINE_EXCEEDED)
+    return min(default, remaining) if default else remaining
+
+
+def with_deadline(default_seconds: float):
+    """Runs a tool under its deadline_seconds argument, or default_seconds when not given."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            seconds = kwargs.get("deadline_seconds")
+            with deadline_after(default_seconds if seconds is None else seconds):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+##############################################################################
+# background work (prefetching) yields to interactive tool calls: it starts a
+# registry request only when none of theirs is in flight, and only takes
+# rate-limit tokens that leave half the burst for them
+
+
+class BackgroundDeferred(RuntimeError):
+    pass
+
+
+_background = contextvars.ContextVar("background", default=False)
+_interactive_requests = 0
+_interactive_idle = threading.Condition()
+
+
+@contextmanager
+def background():
+    token = _background.set(True)
+    try:
+        yield
+    finally:
+        _background.reset(token)
+
+
+def in_background() -> bool:
+    return _background.get()
+
+
+@contextmanager
+def registry_request():
+    global _interactive_requests
+    if _background.get():
+        yield
+        return
+    with _interactive_idle:
+        _interactive_requests += 1
+    try:
+        yield
+    finally:
+        with _interactive_idle:
+            _interactive_requests -= 1
+            if not _interactive_requests:
+                _interactive_idle.notify_all()
+
+
+def wait_until_idle(timeout: float) -> bool:
+    with _interactive_idle:
+        return _interactive_idle.wait_for(lambda: _interactive_requests == 0, timeout)
@@ -0,0 +1,166 @@
+from models_ import model_stream, output_budget, SYNTHESIS_TOKENS
+from tracing_ import span, set_attributes
+from shared_ import llm_slot, current_deadline, DEADLINE_EXCEEDED
+from contextlib import aclosing
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
+import logging
+import math
+import os
+
+logger = logging.getLogger(__name__)
+
+##############################################################################
+# hierarchical synthesis of relevance verdicts: verdict lines are packed into
+# as few prompts as fit SYNTHESIS_MAX_INPUT_TOKENS, each prompt is condensed
+# into a partial synthesis of SYNTHESIS_TOKENS, and partial syntheses are
+# merged the same way, one parallel level at a time, until one remains. Every
+# call has the same output budget, so the synthesis is the same size for 10
+# trials or 1000. Cost is mostly input tokens plus a fixed prompt and output
+# per call, so packing each call as full as the cap allows means the fewest
+# calls and the shallowest tree; the cap trades that against how much a small
+# model is asked to keep track of at once
+
+SYNTHESIS_MODEL = os.getenv("SYNTHESIS_MODEL", "claude-3-5-haiku-20241022")
+SYNTHESIS_MAX_INPUT_TOKENS = int(os.getenv("SYNTHESIS_MAX_INPUT_TOKENS", "6000"))
+# instructions and request text around the items of each prompt
+PROMPT_OVERHEAD_TOKENS = 250
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def verdict_line(verdict: Dict[str, Any]) -> str:
+    trial_id = " / ".join([verdict["trial_id"], *verdict.get("linked_ids", [])])
+    reason = verdict["reason"].replace("\n", " ")
+    return f"{trial_id} | {verdict.get('source') or 'N/A'} | {verdict['score']:g} | {reason}"
+
+
+def group_sizes(tokens: List[int], max_input_tokens: int) -> List[int]:
+    """Sizes of the fewest equal groups of items whose text fits max_input_tokens,
+    always fewer groups than items so every level shrinks."""
+    budget = max(max_input_tokens - PROMPT_OVERHEAD_TOKENS, 1)
+    count = max(math.ceil(sum(tokens) / budget), 1)
+    if len(tokens) > 1:
+        count = min(count, math.ceil(len(tokens) / 2))
+    size = math.ceil(len(tokens) / count)
+    return [min(size, len(tokens) - i) for i in range(0, len(tokens), size)]
+
+
+def leaf_prompt(user_request: str, lines: List[str]) -> str:
+    items = "\n".join(lines)
+    return f"""
+            The user is looking for information about: "{user_request}"
+
+            Below are relevance verdicts for {len(lines)} clinical trials, one per line as
+            <Trial ID> | <registry> | <relevance score 0-10> | <reason>.
+            In at most {SYNTHESIS_TOKENS * 3 // 4} words, synthesize what these trials together show
+            for the user's request: the main groups of trials (intervention, phase, population,
+            status), how they differ, and the strongest matches. Cite trial IDs in brackets.
+            Do not describe the trials one by one.
+
+            {items}
+            """
+
+
+def merge_prompt(user_request: str, parts: List[str]) -> str:
+    items = "\n\n".join(
+        f"--- Partial synthesis {i} ---\n{part}" for i, part in enumerate(parts, 1)
+    )
+    return f"""
+            The user is looking for information about: "{user_request}"
+
+            Below are {len(parts)} partial syntheses, each covering a different group of relevant
+            clinical trials. Merge them into one synthesis of at most {SYNTHESIS_TOKENS * 3 // 4} words:
+            combine groups of trials that recur across parts, and keep the differences that matter
+            for the request and the strongest matches. Keep trial IDs in brackets as citations,
+            preferring the highest-scored trials when there is no room for all.
+
+            {items}
+            """
+
+
+async def condense(prompt: str, level: int) -> Optional[str]:
+    text = ""
+    with span("llm.synthesis", level=level):
+        try:
+            async with asyncio.timeout_at(current_deadline()), llm_slot(), aclosing(
+                model_stream(
+                    messages=prompt,
+                    model=SYNTHESIS_MODEL,
+                    max_tokens=output_budget("synthesis"),
+                )
+            ) as stream:
+                async for chunk in stream:
+                    text += chunk
+        except TimeoutError:
+            set_attributes(error=DEADLINE_EXCEEDED)
+            return None
+        except Exception as e:
+            logger.warning("synthesis call failed: %s", e)
+            set_attributes(error=str(e))
+            return None
+    return text.strip() or None
+
+
+async def synthesize_verdicts(
+    user_request: str,
+    verdicts: List[Dict[str, Any]],
+    max_input_tokens: int = SYNTHESIS_MAX_INPUT_TOKENS,
+) -> Dict[str, Any]:
+    """One synthesis of the relevant verdicts, in ranking order. Groups whose
+    call failed are left out and their trials counted in missed_trials."""
+    # each part carries the number of trials it covers
+    parts: List[Tuple[str, int]] = [
+        (verdict_line(v), 1) for v in verdicts if v["relevant"]
+    ]
+    result = {"text": None, "trials": len(parts), "levels": [], "missed_trials": 0}
+    level = 0
+    while parts:
+        sizes = group_sizes([estimate_tokens(t) for t, _ in parts], max_input_tokens)
+        groups, start = [], 0
+        for size in sizes:
+            groups.append(parts[start : start + size])
+            start += size
+        prompt = leaf_prompt if level == 0 else merge_prompt
+        with span("synthesis.level", level=level, calls=len(groups)):
+            outputs = await asyncio.gather(
+                *[
+                    condense(prompt(user_request, [t for t, _ in group]), level)
+                    for group in groups
+                ]
+            )
+        result["levels"].append(len(groups))
+        parts = []
+        for group, output in zip(groups, outputs):
+            covered = sum(n for _, n in group)
+            if output is None:
+                result["missed_trials"] += covered
+            else:
+                parts.append((output, covered))
+        if len(parts) == 1:
+            result["text"] = parts[0][0]
+            break
+        level += 1
+    set_attributes(
+        synthesis_levels=len(result["levels"]),
+        synthesis_calls=sum(result["levels"]),
+    )
+    return result
+
+
+def format_synthesis(synthesis: Dict[str, Any]) -> str:
+    if not synthesis["trials"]:
+        return ""
+    if synthesis["text"] is None:
+        return "## Synthesis\n\n*The synthesis could not be generated; see the ranking below.*\n\n"
+    calls, levels = sum(synthesis["levels"]), len(synthesis["levels"])
+    result = "## Synthesis\n\n" + synthesis["text"] + "\n\n"
+    result += (
+        f"*Synthesized from {synthesis['trials']} relevant trials in "
+        f"{calls} model call{'s' if calls > 1 else ''} over {levels} level{'s' if levels > 1 else ''}"
+    )
+    if synthesis["missed_trials"]:
+        result += f"; {synthesis['missed_trials']} trials are not covered because their synthesis calls failed"
+    return result + ".*\n\n"
@@ -0,0 +1,461 @@
+from typing import Dict, Any
+from datetime import date, timedelta
+import random
+
+##############################################################################
+# synthetic registry payloads (deterministic per trial index)
+
+CONDITIONS = [
+    "Breast Cancer",
+    "Non-Small Cell Lung Cancer",
+    "Type 2 Diabetes",
+    "Rheumatoid Arthritis",
+    "Alzheimer Disease",
+    "Chronic Kidney Disease",
+    "Psoriasis",
+    "Heart Failure",
+]
+DRUGS = [
+    "pembrolizumab",
+    "semaglutide",
+    "tirzepatide",
+    "upadacitinib",
+    "lecanemab",
+    "finerenone",
+    "bimekizumab",
+    "dapagliflozin",
+]
+SPONSORS = [
+    ("Merck Sharp & Dohme LLC", "Pharmaceutical company"),
+    ("Novo Nordisk A/S", "Pharmaceutical company"),
+    ("Eli Lilly and Company", "Pharmaceutical company"),
+    ("AbbVie Deutschland GmbH & Co. KG", "Pharmaceutical company"),
+    (
+        "Charite - Universitaetsmedizin Berlin",
+        "Hospital/Clinic/Other health care facility",
+    ),
+]
+COUNTRIES = ["France", "Germany", "Spain", "Italy", "Poland", "Belgium", "Netherlands"]
+PHASES = ["PHASE1", "PHASE2", "PHASE3", "PHASE4"]
+
+
+def eu_trial_id(i: int) -> str:
+    return f"2024-5{i:05d}-12-00"
+
+
+def nct_id(i: int) -> str:
+    return f"NCT{10000000 + i:08d}"
+
+
+def decision_date(i: int) -> str:
+    # newest first in index order, so decisionDate DESC paging keeps index order
+    return (date(2024, 6, 1) - timedelta(days=i // 5)).isoformat()
+
+
+def trial_acronym(i: int) -> str:
+    return f"{trial_topic(i)['drug'].upper()[:4]}-{i}"
+
+
+def trial_topic(i: int) -> Dict[str, Any]:
+    rng = random.Random(i)
+    sponsor, sponsor_type = rng.choice(SPONSORS)
+    return {
+        "condition": rng.choice(CONDITIONS),
+        "drug": rng.choice(DRUGS),
+        "sponsor": sponsor,
+        "sponsor_type": sponsor_type,
+        "phase": rng.choice(PHASES),
+        "countries": rng.sample(COUNTRIES, rng.randint(1, 4)),
+        "enrolled": rng.randint(20, 3000),
+        "rng": rng,
+    }
+
+
+def ctis_search_record(i: int) -> Dict[str, Any]:
+    topic = trial_topic(i)
+    phase = topic["phase"].replace("PHASE", "Phase ")
+    return {
+        "ctNumber": eu_trial_id(i),
+        "ctStatus": "Ended",
+        "ctTitle": f"A {phase} study of {topic['drug']} in participants with {topic['condition']} (trial {i})",
+        "shortTitle": trial_acronym(i),
+        "startDateEU": "2023-03-01",
+        "decisionDate": decision_date(i),
+        "sponsor": topic["sponsor"],
+        "sponsorType": topic["sponsor_type"],
+        "conditions": topic["condition"],
+        "trialPhase": f"Therapeutic confirmatory ({phase})",
+        "trialCountries": [
+            f"{c}:{topic['rng'].randint(1, 40)}" for c in topic["countries"]
+        ],
+        "ageGroup": "18-64 years",
+        "gender": "Female, Male",
+        "totalNumberEnrolled": topic["enrolled"],
+        "resultsFirstReceived": "No",
+        "lastUpdated": "2024-06-30",
+        "primaryEndPoint": f"Change from baseline in {topic['condition']} activity score",
+        "endPoint": "Safety and tolerability",
+        "product": topic["drug"],
+        "therapeuticAreas": ["Diseases [C] - Immune System Diseases [C20]"],
+    }
+
+
+def ctis_trial(i: int) -> Dict[str, Any]:
+    topic = trial_topic(i)
+    record = ctis_search_record(i)
+    return {
+        "ctNumber": record["ctNumber"],
+        "ctStatus": record["ctStatus"],
+        "startDateEU": record["startDateEU"],
+        "decisionDate": record["decisionDate"],
+        "publishDate": "2023-02-01",
+        "ctPublicStatusCode": 8,
+        "authorizedApplication": {
+            "authorizedPartI": {
+                "rowCountriesInfo": [{"name": c} for c in topic["countries"]],
+                "products": [
+                    {
+                        "id": i,
+                        "productDictionaryInfo": {
+                            "prodName": topic["drug"],
+                            "activeSubstanceName": topic["drug"],
+                            "pharmForm": "Solution for injection",
+                        },
+                        "mpRoleInTrial": "Test",
+                        "routes": ["Subcutaneous use"],
+                    }
+                ],
+                "trialDetails": {
+                    "clinicalTrialIdentifiers": {"fullTitle": record["ctTitle"]},
+                    "trialInformation": {
+                        "medicalCondition": {
+                            "partIMedicalConditions": [
+                                {"medicalCondition": topic["condition"]}
+                            ]
+                        },
+                        "trialObjective": {
+                            "mainObjective": f"To evaluate {topic['drug']} in {topic['condition']}"
+                        },
+                        "endPoint": {
+                            "primaryEndPoints": [
+                                {"endPoint": record["primaryEndPoint"]}
+                            ]
+                        },
+                    },
+                },
+                "sponsors": [{"organisation": {"name": topic["sponsor"]}}],
+            },
+            "authorizedPartsII": [
+                {
+                    "mscInfo": {"mscName": c, "trialStatus": "Ended"},
+                    "recruitmentSubjectCount": topic["enrolled"]
+                    // len(topic["countries"]),
+                }
+                for c in topic["countries"]
+            ],
+        },
+    }
+
+
+def ctgov_study(i: int, eu_secondary_id: bool = False) -> Dict[str, Any]:
+    topic = trial_topic(i)
+    phase = topic["phase"].replace("PHASE", "Phase ")
+    identification = {
+        "nctId": nct_id(i),
+        "acronym": trial_acronym(i),
+        "briefTitle": f"{topic['drug'].title()} in {topic['condition']} (study {i})",
+        "officialTitle": f"A {phase} study of {topic['drug']} in participants with {topic['condition']} (trial {i})",
+    }
+    if eu_secondary_id:
+        identification["secondaryIdInfos"] = [
+            {"id": eu_trial_id(i), "type": "REGISTRY"}
+        ]
+    return {
+        "protocolSection": {
+            "identificationModule": identification,
+            "statusModule": {
+                "overallStatus": "COMPLETED",
+                "startDateStruct": {"date": "2022-05"},
+                "lastUpdatePostDateStruct": {"date": "2024-06-30"},
+            },
+            "sponsorCollaboratorsModule": {
+                "leadSponsor": {"name": topic["sponsor"], "class": "INDUSTRY"}
+            },
+            "conditionsModule": {"conditions": [topic["condition"]]},
+            "designModule": {
+                "studyType": "INTERVENTIONAL",
+                "phases": [topic["phase"]],
+                "enrollmentInfo": {"count": topic["enrolled"], "type": "ACTUAL"},
+            },
+            "descriptionModule": {
+                "briefSummary": f"This study evaluates {topic['drug']} in adults with {topic['condition']}. "
+                * 3
+            },
+        },
+        "hasResults": i % 3 == 0,
+    }
+
+
+##############################################################################
+# scalable worst-case payloads for parser benchmarks
+
+
+def filler(rng: random.Random, words: int) -> str:
+    vocabulary = "patients dose baseline week randomized placebo visit adverse event treatment response assessment criteria serum level".split()
+    return " ".join(rng.choice(vocabulary) for _ in range(words))
+
+
+def large_ctis_trial(
+    i: int,
+    products: int = 2,
+    sites: int = 10,
+    documents: int = 10,
+    events: int = 5,
+    criteria: int = 20,
+) -> Dict[str, Any]:
+    rng = random.Random(i)
+    trial = ctis_trial(i)
+    part_one = trial["authorizedApplication"]["authorizedPartI"]
+    information = part_one["trialDetails"]["trialInformation"]
+    information["trialObjective"]["secondaryObjectives"] = [
+        {"secondaryObjective": filler(rng, 25)} for _ in range(criteria // 2)
+    ]
+    information["trialObjective"]["trialScopes"] = [
+        {"code": f"SCOPE{n}"} for n in range(3)
+    ]
+    information["eligibilityCriteria"] = {
+        "principalInclusionCriteria": [
+            {"principalInclusionCriteria": filler(rng, 30)} for _ in range(criteria)
+        ],
+        "principalExclusionCriteria": [
+            {"principalExclusionCriteria": filler(rng, 30)} for _ in range(criteria)
+        ],
+    }
+    information["endPoint"]["secondaryEndPoints"] = [
+        {"endPoint": filler(rng, 20)} for _ in range(criteria)
+    ]
+    information["medicalCondition"]["meddraConditionTerms"] = [
+        filler(rng, 3) for _ in range(criteria // 4)
+    ]
+    part_one["products"] = [
+        dict(
+            part_one["products"][0],
+            id=n,
+            devices=[filler(rng, 4)],
+            characteristics=[filler(rng, 6) for _ in range(3)],
+            allSubstancesChemicals=filler(rng, 10),
+        )
+        for n in range(products)
+    ]
+    part_one["sponsors"][0]["publicContacts"] = [
+        {
+            "functionalEmailAddress": f"contact{n}@example.org",
+            "organisation": {"name": part_one["sponsors"][0]["organisation"]["name"]},
+        }
+        for n in range(3)
+    ]
+    part_one["partOneTherapeuticAreas"] = [
+        {"therapeuticArea": {"code": f"C{n:02d}", "name": filler(rng, 4)}}
+        for n in range(5)
+    ]
+    for part in trial["authorizedApplication"]["authorizedPartsII"]:
+        part["trialSites"] = [
+            {
+                "organisationAddressInfo": {
+                    "organisation": {"name": f"Site {n} {filler(rng, 3)} Hospital"},
+                    "address": {"countryName": part["mscInfo"]["mscName"]},
+                    "email": f"site{n}@example.org",
+                }
+            }
+            for n in range(sites)
+        ]
+    trial["events"] = {
+        "trialEvents": [
+            {
+                "mscName": country,
+                "events": [
+                    {
+                        "type": "Start of recruitment",
+                        "date": f"2023-{m % 12 + 1:02d}-01",
+                    }
+                    for m in range(events)
+                ],
+            }
+            for country in (c["name"] for c in part_one["rowCountriesInfo"])
+        ]
+    }
+    trial["documents"] = [
+        {"title": f"Document {n}: {filler(rng, 6)}", "uuid": f"{i:08x}-{n:04x}"}
+        for n in range(documents)
+    ]
+    return trial
+
+
+def large_ctgov_study(
+    i: int,
+    arms: int = 4,
+    outcomes: int = 10,
+    adverse_events: int = 50,
+    criteria: int = 30,
+) -> Dict[str, Any]:
+    rng = random.Random(i)
+    study = ctgov_study(i)
+    protocol = study["protocolSection"]
+    groups = [{"id": f"OG{n:03d}", "title": f"Arm {n}"} for n in range(arms)]
+    protocol["armsInterventionsModule"] = {
+        "arms": [
+            {
+                "label": f"Arm {n}",
+                "type": "EXPERIMENTAL" if n else "PLACEBO_COMPARATOR",
+                "description": filler(rng, 30),
+                "interventionNames": [f"Drug: Dose {n}"],
+            }
+            for n in range(arms)
+        ],
+        "interventions": [
+            {
+                "type": "DRUG",
+                "name": f"Dose {n}",
+                "description": filler(rng, 20),
+                "armGroupLabels": [f"Arm {n}"],
+            }
+            for n in range(arms)
+        ],
+    }
+    protocol["outcomesModule"] = {
+        "primaryOutcomes": [
+            {"measure": filler(rng, 8), "timeFrame": "Week 52"} for _ in range(2)
+        ],
+        "secondaryOutcomes": [
+            {
+                "measure": filler(rng, 8),
+                "description": filler(rng, 25),
+                "timeFrame": f"Week {n * 4}",
+            }
+            for n in range(outcomes)
+        ],
+    }
+    protocol["eligibilityModule"] = {
+        "minimumAge": "18 Years",
+        "maximumAge": "75 Years",
+        "sex": "ALL",
+        "stdAges": ["ADULT", "OLDER_ADULT"],
+        "healthyVolunteers": False,
+        "criteria": "Inclusion Criteria:\n\n"
+        + "\n".join(f"* {filler(rng, 20)}" for _ in range(criteria))
+        + "\n\nExclusion Criteria:\n\n"
+        + "\n".join(f"* {filler(rng, 20)}" for _ in range(criteria)),
+    }
+    protocol["descriptionModule"]["detailedDescription"] = "\n\n".join(
+        filler(rng, 60) for _ in range(criteria // 3 + 1)
+    )
+    study["hasResults"] = True
+    study["resultsSection"] = {
+        "participantFlowModule": {
+            "recruitmentDetails": filler(rng, 30),
+            "groups": [dict(g, id=f"FG{n:03d}") for n, g in enumerate(groups)],
+            "periods": [
+                {
+                    "title": "Overall Study",
+                    "milestones": [
+                        {
+                            "type": milestone,
+                            "achievements": [
+                                {
+                                    "groupId": f"FG{n:03d}",
+                                    "numSubjects": str(rng.randint(50, 500)),
+                                }
+                                for n in range(arms)
+                            ],
+                        }
+                        for milestone in ("STARTED", "COMPLETED", "NOT COMPLETED")
+                    ],
+                    "dropWithdraws": [
+                        {
+                            "type": reason,
+                            "reasons": [
+                                {
+                                    "groupId": f"FG{n:03d}",
+                                    "numSubjects": str(rng.randint(0, 20)),
+                                }
+                                for n in range(arms)
+                            ],
+                        }
+                        for reason in ("Adverse Event", "Withdrawal by Subject")
+                    ],
+                }
+            ],
+        },
+        "outcomeMeasuresModule": {
+            "outcomeMeasures": [
+                {
+                    "type": "PRIMARY" if n < 2 else "SECONDARY",
+                    "title": filler(rng, 8),
+                    "description": filler(rng, 25),
+                    "timeFrame": f"Week {n * 4}",
+                    "unitOfMeasure": "percentage of participants",
+                    "groups": groups,
+                    "classes": [
+                        {
+                            "categories": [
+                                {
+                                    "measurements": [
+                                        {
+                                            "groupId": g["id"],
+                                            "value": f"{rng.uniform(0, 100):.1f}",
+                                        }
+                                        for g in groups
+                                    ]
+                                }
+                            ]
+                        }
+                    ],
+                    "analyses": [
+                        {
+                            "groupIds": [groups[0]["id"], g["id"]],
+                            "statisticalMethod": "Cochran-Mantel-Haenszel",
+                            "paramType": "Risk Difference (RD)",
+                            "paramValue": f"{rng.uniform(-5, 40):.1f}",
+                            "pValue": f"{rng.uniform(0, 0.2):.4f}",
+                            "ciPctValue": "95",
+                            "ciLowerLimit": f"{rng.uniform(-10, 5):.1f}",
+                            "ciUpperLimit": f"{rng.uniform(10, 50):.1f}",
+                        }
+                        for g in groups[1:]
+                    ],
+                }
+                for n in range(outcomes)
+            ]
+        },
+        "adverseEventsModule": {
+            "description": filler(rng, 20),
+            "eventGroups": [
+                {
+                    "id": f"EG{n:03d}",
+                    "title": f"Arm {n}",
+                    "seriousNumAffected": rng.randint(0, 50),
+                    "seriousNumAtRisk": 500,
+                    "otherNumAffected": rng.randint(50, 300),
+                    "otherNumAtRisk": 500,
+                }
+                for n in range(arms)
+            ],
+            "seriousEvents": [
+                {
+                    "term": filler(rng, 3),
+                    "organSystem": filler(rng, 4),
+                    "stats": [
+                        {
+                            "groupId": f"EG{n:03d}",
+                            "numEvents": rng.randint(0, 5),
+                            "numAffected": rng.randint(0, 5),
+                            "numAtRisk": 500,
+                        }
+                        for n in range(arms)
+                    ],
+                }
+                for _ in range(adverse_events)
+            ],
+        },
+    }
+    return study
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bulk_  # noqa: E402
+import models_  # noqa: E402
+import registries_  # noqa: E402
+from mocks_ import FakeBatchServer, FakeRegistryServer  # noqa: E402
+from shared_ import response_cache, verdict_cache  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    response_cache.clear()
+    verdict_cache.clear()
+    yield
+
+
+@pytest.fixture
+def registries(monkeypatch):
+    """Fake CTIS and ClinicalTrials.gov APIs without latency, with the
+    registry URLs pointed at them."""
+    with FakeRegistryServer(n_trials=60, latency=0, jitter=0) as server:
+        monkeypatch.setattr(
+            registries_, "CTIS_API_URL", f"{server.url}/ctis-public-api"
+        )
+        monkeypatch.setattr(registries_, "CTGOV_API_URL", f"{server.url}/api/v2")
+        yield server
+
+
+@pytest.fixture
+def batches(tmp_path, monkeypatch):
+    """The fake Anthropic API (messages and message batches), with the client
+    pointed at it."""
+    with FakeBatchServer(processing_seconds=0.5) as server:
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", server.url)
+        monkeypatch.setenv("ANTHROPIC_API_KEY", "fake")
+        monkeypatch.setattr(models_, "_client", None)
+        monkeypatch.setattr(bulk_, "BULK_JOBS_FILE", str(tmp_path / "bulk_jobs.json"))
+        yield server
@@ -0,0 +1,70 @@
+import asyncio
+
+import bulk_
+import clinical_trials_mcp_
+
+BATCHES = [
+    {
+        "custom_id": "eu-0",
+        "source": "eu",
+        "trial_ids": ["2024-500001-12-00", "2024-500002-12-00"],
+        "prompt": "Trials 2024-500001-12-00 and 2024-500002-12-00",
+    },
+    {
+        "custom_id": "ctgov-0",
+        "source": "ctgov",
+        "trial_ids": ["NCT10000003"],
+        "prompt": "Study NCT10000003",
+    },
+]
+
+
+def test_submit_poll_and_collect(batches):
+    async def cycle():
+        job = await bulk_.submit_bulk_job("request", "query", BATCHES, max_tokens=200)
+        polled = await bulk_.refresh_bulk_job(job["job_id"])
+        collected = await bulk_.refresh_bulk_job(
+            job["job_id"], wait_seconds=10, poll_interval=0.1
+        )
+        return job, polled, collected
+
+    job, polled, collected = asyncio.run(cycle())
+    assert job["status"] == "in_progress"
+    assert polled["status"] == "in_progress" and polled["results"] == {}
+    assert collected["status"] == "ended"
+    assert set(collected["results"]) == {"eu-0", "ctgov-0"}
+    # the job survives a restart through the jobs file
+    assert bulk_.load_jobs()[job["job_id"]]["status"] == "ended"
+    output = bulk_.format_bulk_job(collected)
+    assert "Analyzed 3 trials; 3 scored 5/10 or higher" in output
+    for trial_id in ("2024-500001-12-00", "2024-500002-12-00", "NCT10000003"):
+        assert trial_id in output
+
+
+def test_unfinished_job_reports_progress(batches):
+    async def submit():
+        job = await bulk_.submit_bulk_job("request", "query", BATCHES)
+        return await bulk_.refresh_bulk_job(job["job_id"])
+
+    output = bulk_.format_bulk_job(asyncio.run(submit()))
+    assert "2 batches are still being processed" in output
+
+
+def test_search_in_bulk_mode_submits_one_batch_job(batches, registries):
+    result = asyncio.run(
+        clinical_trials_mcp_.search_batch_trials(
+            user_request="Trials of a biologic",
+            search_terms="biologic",
+            no_of_trials=10,
+            bulk=True,
+        )
+    )
+    assert result.startswith("Bulk analysis job msgbatch_")
+    job_id = result.split()[3]
+    [batch] = batches.batches.values()
+    job = bulk_.load_jobs()[job_id]
+    assert len(batch["results"]) == len(job["batches"])
+    job = asyncio.run(
+        bulk_.refresh_bulk_job(job_id, wait_seconds=10, poll_interval=0.1)
+    )
+    assert "## Most Relevant Trials" in bulk_.format_bulk_job(job)
@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+import pytest
+
+import clinical_trials_mcp_
+import prefetch_
+import registries_
+import shared_
+from shared_ import (
+    DEADLINE_EXCEEDED,
+    DeadlineExceeded,
+    deadline_after,
+    remaining_seconds,
+)
+
+
+class FakeContext:
+    """Stands in for the MCP context: one session per client."""
+
+    def __init__(self):
+        self.session = type("Session", (), {})()
+
+    async def info(self, message):
+        pass
+
+
+def search(**kwargs):
+    return clinical_trials_mcp_.search_batch_trials(
+        user_request="Trials of a biologic",
+        search_terms="biologic",
+        **kwargs,
+    )
+
+
+@pytest.fixture(autouse=True)
+def no_prefetch(monkeypatch):
+    monkeypatch.setattr(prefetch_, "PREFETCH_TRIALS", 0)
+
+
+def test_partial_results_list_the_skipped_pages_and_batches(
+    registries, batches, monkeypatch
+):
+    eu_search = clinical_trials_mcp_.eu_search
+
+    def slow_eu_search(payload):
+        # every EU page after the first times out at the deadline, like a
+        # request to a registry that does not answer in time
+        if payload["pagination"]["page"] > 1:
+            time.sleep(max(remaining_seconds() - 0.1, 0))
+            raise DeadlineExceeded(DEADLINE_EXCEEDED)
+        return eu_search(payload)
+
+    monkeypatch.setattr(clinical_trials_mcp_, "eu_search", slow_eu_search)
+    # the model answers too slowly for any batch to finish before the deadline
+    monkeypatch.setattr(batches, "first_token_seconds", 2)
+    result = asyncio.run(search(no_of_trials=20, deadline_seconds=1))
+    assert "Analyzed 5 EU trials and 20 ClinicalTrials.gov trials" in result
+    note = result.split("*Partial results:")[1]
+    assert "3 of 4 EU CTIS result pages" in note
+    # one EU trial is registered on ClinicalTrials.gov too and analyzed once
+    assert "relevance analysis of 24 trials in 5 unfinished batches" in note
+
+
+def test_the_deadline_includes_the_wait_for_a_client_slot(
+    registries, batches, monkeypatch
+):
+    monkeypatch.setattr(shared_.client_slot, "limit", 1)
+    ctx = FakeContext()
+
+    async def queued():
+        slot = shared_.client_slot(ctx)
+        async with slot:
+            task = asyncio.create_task(search(deadline_seconds=0.3, ctx=ctx))
+            await asyncio.sleep(0.5)
+        return await task
+
+    started = time.monotonic()
+    result = asyncio.run(queued())
+    assert time.monotonic() - started < 2
+    assert "the EU CTIS search; the ClinicalTrials.gov search" in result
+
+
+def test_fetch_fresh_turns_a_timeout_at_the_deadline_into_deadline_exceeded(
+    registries,
+):
+    registries.latency = 0.5
+    with deadline_after(0.1):
+        with pytest.raises(DeadlineExceeded):
+            registries_.ctis_search_fresh({"pagination": {"page": 1, "size": 5}})
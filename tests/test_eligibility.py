@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+import clinical_trials_mcp_
+import eligibility_
+import synthetic_
+
+# eligibility of the first ClinicalTrials.gov studies; the rest have none
+STUDIES = [
+    {
+        "minimumAge": "6 Months",
+        "maximumAge": "17 Years",
+        "sex": "ALL",
+        "healthyVolunteers": False,
+        "criteria": "Inclusion Criteria:\n\n* Juvenile arthritis",
+    },
+    {
+        "minimumAge": "18 Years",
+        "sex": "FEMALE",
+        "criteria": "Inclusion Criteria:\n\n* Chronic kidney disease stage 3\n\n"
+        "Exclusion Criteria:\n\n* Pregnancy",
+    },
+    {
+        "minimumAge": "18 Years",
+        "maximumAge": "65 Years",
+        "sex": "ALL",
+        "criteria": "Inclusion Criteria:\n\n* Type 2 diabetes\n\n"
+        "Exclusion Criteria:\n\n* Chronic kidney disease (eGFR < 30)\n* Kidney transplant",
+    },
+    {
+        "minimumAge": "4 Weeks",
+        "maximumAge": "2 Years",
+        "sex": "ALL",
+        "healthyVolunteers": True,
+    },
+]
+
+
+@pytest.fixture
+def index(tmp_path, registries, monkeypatch):
+    path = str(tmp_path / "eligibility.db")
+    monkeypatch.setattr(eligibility_, "ELIGIBILITY_INDEX_FILE", path)
+    ids = [synthetic_.nct_id(registries.ctgov_index(p)) for p in range(10)]
+    for nct_id, eligibility in zip(ids, STUDIES):
+        registries.update_ctgov_study(nct_id, "eligibilityModule", **eligibility)
+    result = eligibility_.index_trials("", path, sources="ctgov", max_trials=10)
+    assert result == {"counts": {"ctgov": 10}, "errors": {}}
+    return ids
+
+
+def matched(**patient):
+    result = eligibility_.match_trials(max_results=100, **patient)
+    return {m["trial_id"] for m in result["matches"]}
+
+
+def test_ages_are_normalized_to_years():
+    assert eligibility_.age_in_years("6 Months") == 0.5
+    assert eligibility_.age_in_years("4 Weeks") == pytest.approx(0.077, abs=1e-3)
+    assert eligibility_.age_in_years("N/A") is None
+    assert eligibility_.eu_age_range("Children (2-11 years), 65+ years") == (
+        2.0,
+        None,
+    )
+    low, high = eligibility_.eu_age_range(["0-17 months", "18-64 years"])
+    assert low == 0.0 and 64.99 < high < 65
+
+
+def test_age_sex_and_healthy_volunteers(index):
+    children, women, adults, infants, *unrestricted = index
+    assert matched(age=0.75) == {children, infants, *unrestricted}
+    assert matched(age=30, sex="female") == {women, adults, *unrestricted}
+    assert matched(age=30, sex="male") == {adults, *unrestricted}
+    assert matched(age=70) == {women, *unrestricted}
+    # trials without a healthy-volunteer flag are kept, those that say no are not
+    assert matched(age=1, healthy_volunteer=True) == {infants, *unrestricted}
+
+
+def test_exclusion_mentioning_a_patient_term_leaves_the_trial_out(index):
+    _, women, adults, *_ = index
+    result = asyncio.run(
+        clinical_trials_mcp_.match_patient_to_trials(
+            age=40,
+            sex="female",
+            patient_conditions="chronic kidney disease, asthma",
+            sources="ctgov",
+            max_results=3,
+        )
+    )
+    assert "# 7 of 10 indexed trials could enroll this patient" in result
+    assert "1 otherwise matching trials were left out" in result
+    assert adults not in result
+    # inclusion criteria naming the patient's condition rank first
+    rows = [line for line in result.splitlines() if line.startswith("| NCT")]
+    assert rows[0].startswith(f"| {women} ✓ |") and len(rows) == 3
+
+
+def test_an_empty_index_says_how_to_build_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        eligibility_, "ELIGIBILITY_INDEX_FILE", str(tmp_path / "empty.db")
+    )
+    result = asyncio.run(clinical_trials_mcp_.match_patient_to_trials(age=40))
+    assert "eligibility index is empty" in result
@@ -0,0 +1,73 @@
+from collections import Counter
+
+import facets_
+import synthetic_
+
+
+def expected(indexes, registry):
+    counts = {facet: Counter() for facet in facets_.FACETS}
+    for i in indexes:
+        topic = synthetic_.trial_topic(i)
+        if registry == "eu":
+            phase = topic["phase"].replace("PHASE", "Phase ")
+            counts["phase"][f"Therapeutic confirmatory ({phase})"] += 1
+            counts["sponsor_type"][topic["sponsor_type"]] += 1
+            counts["country"].update(topic["countries"])
+        else:
+            counts["phase"][topic["phase"]] += 1
+            counts["sponsor_type"]["INDUSTRY"] += 1
+    return counts
+
+
+def test_counts_every_trial_of_both_registries(registries):
+    nct_ids = [synthetic_.nct_id(registries.ctgov_index(p)) for p in range(60)]
+    registries.update_ctis_trial(4, ctStatus="Ongoing, recruiting")
+    registries.update_ctgov_study(
+        nct_ids[0], "designModule", phases=["PHASE1", "PHASE2"]
+    )
+    registries.update_ctgov_study(
+        nct_ids[1],
+        "contactsLocationsModule",
+        locations=[{"country": "France"}, {"country": "France"}, {"country": "Spain"}],
+    )
+    registries.update_ctgov_study(
+        nct_ids[2], "statusModule", overallStatus="RECRUITING", startDateStruct={}
+    )
+    result = facets_.aggregate_facets("", max_trials=1000)
+    assert result["errors"] == {}
+    eu, ctgov = result["sources"]["eu"], result["sources"]["ctgov"]
+    assert (eu["trials"], ctgov["trials"]) == (60, 60)
+    assert not eu["truncated"] and not ctgov["truncated"]
+
+    eu_expected = expected(range(60), "eu")
+    assert eu["counts"]["status"] == Counter({"Ended": 59, "Ongoing, recruiting": 1})
+    assert eu["counts"]["phase"] == eu_expected["phase"]
+    assert eu["counts"]["sponsor_type"] == eu_expected["sponsor_type"]
+    assert eu["counts"]["country"] == eu_expected["country"]
+    assert eu["counts"]["start_year"] == Counter({"2023": 60})
+
+    ctgov_expected = expected([registries.ctgov_index(p) for p in range(60)], "ctgov")
+    first = synthetic_.trial_topic(registries.ctgov_index(0))["phase"]
+    ctgov_expected["phase"].subtract({first: 1})
+    ctgov_expected["phase"].update(["PHASE1", "PHASE2"])
+    assert ctgov["counts"]["phase"] == +ctgov_expected["phase"]
+    assert ctgov["counts"]["sponsor_type"] == ctgov_expected["sponsor_type"]
+    assert ctgov["counts"]["status"] == Counter({"COMPLETED": 59, "RECRUITING": 1})
+    # a trial counts once per country
+    assert ctgov["counts"]["country"] == Counter(
+        {facets_.NOT_REPORTED: 59, "France": 1, "Spain": 1}
+    )
+    assert ctgov["counts"]["start_year"] == Counter(
+        {"2022": 59, facets_.NOT_REPORTED: 1}
+    )
+
+
+def test_max_trials_caps_each_registry(registries):
+    result = facets_.aggregate_facets("", max_trials=25, facets=["status", "sponsor"])
+    for source in ("eu", "ctgov"):
+        counted = result["sources"][source]
+        assert counted["trials"] == 25 and counted["truncated"]
+        assert sum(counted["counts"]["status"].values()) == 25
+        assert set(counted["counts"]) == {"status", "sponsor"}
+    output = facets_.format_facets(result)
+    assert "25 EU (max_trials reached), 25 CT.gov (max_trials reached)" in output
@@ -0,0 +1,120 @@
+import sqlite3
+
+import pytest
+
+import mirror_
+import synthetic_
+from compression_ import blob_dictionary
+
+
+@pytest.fixture
+def mirror(tmp_path, registries, monkeypatch):
+    monkeypatch.setattr(mirror_, "MIRROR_PAGE_SIZE", 10)
+    return str(tmp_path / "mirror.db")
+
+
+def stored(path, ct_number):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute(
+            "SELECT last_updated, status FROM trials WHERE ct_number = ?", (ct_number,)
+        ).fetchone()
+    finally:
+        connection.close()
+
+
+def set_state(path, key, value):
+    connection = mirror_.connect(path)
+    try:
+        with connection:
+            mirror_.set_state(connection, key, value)
+    finally:
+        connection.close()
+
+
+def test_first_sync_mirrors_everything_and_trains_dictionaries(mirror):
+    assert not mirror_.mirror_fresh(mirror)
+    stats = mirror_.sync_mirror(mirror)
+    assert stats["full"]
+    assert (stats["pages"], stats["new"], stats["failed"]) == (6, 60, 0)
+    assert stats["watermark"] == synthetic_.decision_date(0)
+    assert set(stats["dictionaries"]) == set(mirror_.PAYLOAD_KINDS)
+    assert mirror_.mirror_fresh(mirror)
+    connection = sqlite3.connect(mirror)
+    blobs = connection.execute("SELECT raw FROM trials").fetchall()
+    connection.close()
+    assert all(blob_dictionary(blob) is not None for (blob,) in blobs)
+    summary = mirror_.local_trial_summary(synthetic_.eu_trial_id(3), mirror)
+    assert synthetic_.eu_trial_id(3) in summary
+
+
+def test_incremental_sync_stops_at_watermark_and_sees_new_trials(mirror, registries):
+    mirror_.sync_mirror(mirror)
+    new_ids = registries.publish_ctis_trials(3, "2024-07-01")
+    # same process and same search payloads: the sync must not read cached pages
+    stats = mirror_.sync_mirror(mirror)
+    assert not stats["full"]
+    assert (stats["pages"], stats["new"], stats["changed"]) == (2, 3, 0)
+    assert stats["watermark"] == "2024-07-01"
+    assert all(stored(mirror, ct_number) for ct_number in new_ids)
+
+
+def test_full_pass_picks_up_changes_to_older_trials(mirror, registries):
+    mirror_.sync_mirror(mirror)
+    old = synthetic_.eu_trial_id(50)
+    registries.update_ctis_trial(
+        50, ctStatus="Ongoing, recruiting", lastUpdated="2025-01-15"
+    )
+    # an incremental sync stops before reaching the old trial
+    assert mirror_.sync_mirror(mirror)["changed"] == 0
+    # once the last full pass is due, the next sync compares every trial
+    set_state(mirror, "last_full_sync_at", "2000-01-01T00:00:00+00:00")
+    assert not mirror_.mirror_fresh(mirror)
+    stats = mirror_.sync_mirror(mirror)
+    assert stats["full"]
+    assert (stats["changed"], stats["new"]) == (1, 0)
+    assert stored(mirror, old) == ("2025-01-15", "ongoing, recruiting")
+    assert mirror_.mirror_fresh(mirror)
+
+
+def test_failed_trials_are_retried_and_keep_the_mirror_stale(mirror, monkeypatch):
+    failing = synthetic_.eu_trial_id(7)
+    retrieve = mirror_.ctis_retrieve_if_changed
+
+    def flaky(ct_number, *args, **kwargs):
+        if ct_number == failing:
+            raise ConnectionError("registry unavailable")
+        return retrieve(ct_number, *args, **kwargs)
+
+    monkeypatch.setattr(mirror_, "ctis_retrieve_if_changed", flaky)
+    stats = mirror_.sync_mirror(mirror)
+    assert (stats["new"], stats["failed"]) == (59, 1)
+    assert stats["watermark"] is None
+    assert not mirror_.mirror_fresh(mirror)
+
+    monkeypatch.setattr(mirror_, "ctis_retrieve_if_changed", retrieve)
+    stats = mirror_.sync_mirror(mirror)
+    assert stats["full"]
+    assert (stats["new"], stats["failed"]) == (1, 0)
+    assert stored(mirror, failing)
+    assert mirror_.mirror_fresh(mirror)
+
+
+def test_partial_sync_is_not_served(mirror):
+    stats = mirror_.sync_mirror(mirror, max_pages=1)
+    assert stats["new"] == 10
+    assert not mirror_.mirror_fresh(mirror)
+
+
+def test_freshness_is_read_once_per_ttl(mirror, monkeypatch):
+    mirror_.sync_mirror(mirror)
+    opened = []
+    connect = mirror_.connect
+    monkeypatch.setattr(
+        mirror_, "connect", lambda path=None: opened.append(path) or connect(path)
+    )
+    assert all(mirror_.mirror_fresh(mirror) for _ in range(5))
+    assert opened == [mirror]
+    # a new full pass time is seen at once
+    set_state(mirror, "last_full_sync_at", "2000-01-01T00:00:00+00:00")
+    assert not mirror_.mirror_fresh(mirror)
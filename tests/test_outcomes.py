@@ -0,0 +1,96 @@
+import math
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from outcomes_ import compare_outcomes, format_comparison  # noqa: E402
+
+
+def study(nct_id, enrollment, *outcomes):
+    return {
+        "protocolSection": {
+            "identificationModule": {"nctId": nct_id},
+            "designModule": {"enrollmentInfo": {"count": enrollment}},
+        },
+        "resultsSection": {
+            "outcomeMeasuresModule": {"outcomeMeasures": list(outcomes)}
+        },
+    }
+
+
+def hazard_ratio(title, value, lower, upper, p_value, type="PRIMARY"):
+    return {
+        "type": type,
+        "title": title,
+        "unitOfMeasure": "months",
+        "analyses": [
+            {
+                "paramType": "Hazard Ratio (HR)",
+                "paramValue": str(value),
+                "ciPctValue": "95",
+                "ciLowerLimit": str(lower),
+                "ciUpperLimit": str(upper),
+                "pValue": p_value,
+            }
+        ],
+    }
+
+
+# two trials report overall survival, one only progression-free survival
+STUDIES = [
+    study(
+        "NCT10000001",
+        400,
+        hazard_ratio("Progression-Free Survival (PFS)", 0.5, 0.4, 0.625, "<0.001"),
+        hazard_ratio("Overall Survival (OS)", 0.8, 0.64, 1.0, "0.049", "SECONDARY"),
+    ),
+    study(
+        "NCT10000002",
+        300,
+        hazard_ratio("Overall survival", 0.9, 0.72, 1.125, "> 0.01"),
+    ),
+    study(
+        "NCT10000003",
+        200,
+        hazard_ratio("Progression-free Survival", 0.6, 0.45, 0.8, "0.0005"),
+    ),
+]
+
+
+def test_overall_survival_is_not_pooled_with_progression_free_survival():
+    result = compare_outcomes(STUDIES, "overall survival")
+    assert result["matched"] == 2
+    assert set(result["table"]["title"]) == {
+        "Overall Survival (OS)",
+        "Overall survival",
+    }
+    [pooled] = result["pooled"]
+    assert pooled["trials"] == 2
+    # both trials have the same standard error, so the pooled estimate is
+    # the geometric mean of 0.8 and 0.9
+    assert pooled["estimate"] == pytest.approx(math.sqrt(0.8 * 0.9))
+    # "> 0.01" is not counted as significant
+    assert result["significant"] == 1
+    assert "Overall Survival (OS) (months)" in format_comparison(
+        result, "overall survival"
+    )
+
+
+def test_pooling_is_per_outcome_without_a_query():
+    result = compare_outcomes(STUDIES)
+    assert result["matched"] == 3
+    # the first trial contributes its primary outcome, PFS, which is pooled
+    # with the third trial; the second trial's OS stands alone
+    [pooled] = result["pooled"]
+    assert pooled["title"] == "Progression-Free Survival (PFS)"
+    assert pooled["trials"] == 2
+    assert result["significant"] == 2
+
+
+def test_a_partial_match_is_not_an_outcome_match():
+    result = compare_outcomes(STUDIES, "overall response rate")
+    assert result["matched"] == 0
+    assert "No outcome measures with results matched" in format_comparison(
+        result, "overall response rate"
+    )
@@ -0,0 +1,27 @@
+import synthetic_
+from parsers_ import render_ctgov_trial_details_page
+
+
+def pages(study, **kwargs):
+    cursor, rendered = (0, 0), []
+    while cursor is not None:
+        text, next_cursor = render_ctgov_trial_details_page(
+            study, 200000, cursor, **kwargs
+        )
+        assert next_cursor is None or next_cursor > cursor
+        rendered.append(text)
+        cursor = next_cursor
+    return rendered
+
+
+def test_time_limit_splits_a_large_section_between_blocks():
+    study = synthetic_.large_ctgov_study(1, adverse_events=500)
+    [complete] = pages(study)
+    # out of time after every block: each page still makes progress, and the
+    # pages together hold everything one unhurried page does
+    hurried = pages(study, time_limit=0)
+    assert len(hurried) > 10
+    assert "more event groups not shown" in "".join(hurried)
+    for line in complete.splitlines():
+        if line.startswith("- **"):
+            assert any(line in page for page in hurried)
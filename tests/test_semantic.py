@@ -0,0 +1,77 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import clinical_trials_mcp_  # noqa: E402
+import prefetch_  # noqa: E402
+import semantic_  # noqa: E402
+import synthetic_  # noqa: E402
+
+
+@pytest.fixture
+def index_dir(tmp_path, registries, monkeypatch):
+    path = str(tmp_path / "semantic_index")
+    monkeypatch.setattr(semantic_, "SEMANTIC_INDEX_DIR", path)
+    monkeypatch.setattr(semantic_, "SEMANTIC_DIMENSIONS", 16)
+    monkeypatch.setattr(semantic_, "_index", None)
+    stats = semantic_.build_index(semantic_.registry_documents("", "both", 60), path)
+    assert (stats["eu"], stats["ctgov"]) == (60, 60)
+    return path
+
+
+def test_build_and_query_round_trip(index_dir):
+    index = semantic_.load_index()
+    assert index is semantic_.load_index()
+    query = synthetic_.ctis_search_record(7)["ctTitle"]
+    exact = index.search(query, 10, exact=True)
+    assert synthetic_.eu_trial_id(7) in [trial_id for trial_id, _, _ in exact]
+    # probing every cluster scans every trial, so IVF and brute force agree
+    assert index.search(query, 10, probes=len(index.centroids)) == exact
+    assert index.search(query, 1, probes=2)[0][0] == exact[0][0]
+    ctgov = index.search(query, 5, source="ctgov", exact=True)
+    assert {source for _, source, _ in ctgov} == {"ctgov"}
+    [record] = index.records([synthetic_.eu_trial_id(7)])
+    assert record["ctTitle"] == query
+
+
+def test_a_rebuilt_index_is_reloaded(index_dir):
+    index = semantic_.load_index()
+    semantic_.build_index(semantic_.registry_documents("", "ctgov", 20), index_dir)
+    meta = os.path.join(index_dir, "meta.json")
+    os.utime(meta, (index.loaded_at + 1, index.loaded_at + 1))
+    reloaded = semantic_.load_index()
+    assert reloaded is not index
+    assert len(reloaded.ids) == 20
+
+
+def test_an_old_snapshot_is_not_served(index_dir, caplog):
+    meta = os.path.join(index_dir, "meta.json")
+    with open(meta) as f:
+        data = json.load(f)
+    with open(meta, "w") as f:
+        json.dump(dict(data, version=semantic_.SNAPSHOT_VERSION - 1), f)
+    with caplog.at_level(logging.WARNING, logger="semantic_"):
+        assert semantic_.load_index() is None
+    assert "rebuild it" in caplog.text
+    assert semantic_.semantic_candidates("arthritis", 5) is None
+
+
+def test_semantic_search_falls_back_without_numpy(index_dir, batches, monkeypatch):
+    monkeypatch.setitem(sys.modules, "numpy", None)
+    monkeypatch.setattr(prefetch_, "PREFETCH_TRIALS", 0)
+    result = asyncio.run(
+        clinical_trials_mcp_.search_batch_trials(
+            user_request="Trials of a biologic",
+            search_terms="biologic",
+            no_of_trials=10,
+            semantic=True,
+        )
+    )
+    assert "registries' keyword search was used" in result
+    assert "Analyzed 10 EU trials and 10 ClinicalTrials.gov trials" in result
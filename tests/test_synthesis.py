@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+import synthesis_
+from synthesis_ import estimate_tokens, format_synthesis, synthesize_verdicts
+
+
+def verdicts(relevant, irrelevant=0):
+    # each verdict line is 100 tokens
+    result = []
+    for i in range(relevant + irrelevant):
+        verdict = {
+            "trial_id": f"NCT{10000000 + i:08d}",
+            "source": "ClinicalTrials.gov",
+            "score": 8 if i < relevant else 2,
+            "relevant": i < relevant,
+            "reason": "",
+        }
+        verdict["reason"] = "x" * (399 - len(synthesis_.verdict_line(verdict)))
+        result.append(verdict)
+    assert estimate_tokens(synthesis_.verdict_line(result[0])) == 100
+    return result
+
+
+class Calls(list):
+    """Levels of the synthesis calls made, in order."""
+
+    def __init__(self):
+        super().__init__()
+        self.fail = set()
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Stands in for the model: every synthesis is 400 tokens, and the calls
+    in calls.fail, as (level, nth call of the level), return nothing."""
+    calls = Calls()
+
+    async def condense(prompt, level):
+        calls.append(level)
+        return None if (level, calls.count(level)) in calls.fail else "y" * 1599
+
+    monkeypatch.setattr(synthesis_, "condense", condense)
+    return calls
+
+
+def synthesize(items, max_input_tokens):
+    return asyncio.run(synthesize_verdicts("request", items, max_input_tokens))
+
+
+def test_levels_shrink_until_one_synthesis_is_left(calls):
+    # 40 lines of 100 tokens in prompts of 1000 tokens: 4 leaves of 10 lines,
+    # then 4 syntheses of 400 tokens merge in pairs, then the last 2
+    result = synthesize(verdicts(40, irrelevant=5), max_input_tokens=1250)
+    assert result["trials"] == 40
+    assert result["levels"] == [4, 2, 1]
+    assert calls == [0] * 4 + [1] * 2 + [2]
+    assert result["text"] == "y" * 1599
+    assert "from 40 relevant trials in 7 model calls over 3 levels" in (
+        format_synthesis(result)
+    )
+
+
+def test_everything_fits_one_call_under_a_large_cap(calls):
+    result = synthesize(verdicts(40), max_input_tokens=100000)
+    assert result["levels"] == [1]
+    assert "in 1 model call over 1 level." in format_synthesis(result)
+
+
+def test_failed_groups_are_left_out_and_counted(calls):
+    calls.fail.add((0, 1))
+    result = synthesize(verdicts(40), max_input_tokens=1250)
+    assert result["levels"] == [4, 2, 1]
+    assert result["missed_trials"] == 10
+    assert "10 trials are not covered because their synthesis calls failed" in (
+        format_synthesis(result)
+    )
+
+
+def test_no_synthesis_when_every_call_fails(calls):
+    calls.fail.update((0, n) for n in range(1, 5))
+    result = synthesize(verdicts(40), max_input_tokens=1250)
+    assert result["text"] is None and result["missed_trials"] == 40
+    assert "could not be generated" in format_synthesis(result)
+
+
+def test_synthesis_through_the_fake_messages_api(batches):
+    result = synthesize(verdicts(3), max_input_tokens=100000)
+    assert result["levels"] == [1] and result["missed_trials"] == 0
+    assert "NCT10000002" in result["text"]
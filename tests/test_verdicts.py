@@ -0,0 +1,113 @@
+from bulk_ import format_bulk_job
+from verdicts_ import (
+    VerdictStreamParser,
+    format_ranking_table,
+    linked_aliases,
+    merge_verdicts,
+    parse_verdicts,
+)
+
+EU_ID = "2024-500001-12-00"
+NCT_ID = "NCT10000001"
+
+
+def test_linked_aliases_map_linked_ids_to_the_analyzed_id():
+    linked_ids = {EU_ID: [NCT_ID], "2024-500002-12-00": ["NCT10000002"]}
+    assert linked_aliases(linked_ids) == {
+        NCT_ID: EU_ID,
+        "NCT10000002": "2024-500002-12-00",
+    }
+    assert linked_aliases(linked_ids, [EU_ID]) == {NCT_ID: EU_ID}
+
+
+def test_verdict_for_a_linked_id_is_kept_under_the_analyzed_id():
+    text = f"{NCT_ID} | 8 | Same trial, named by its ClinicalTrials.gov ID."
+    assert parse_verdicts(text, [EU_ID], "EU CTIS") == []
+    [verdict] = parse_verdicts(text, [EU_ID], "EU CTIS", {NCT_ID: EU_ID})
+    assert (verdict["trial_id"], verdict["score"], verdict["relevant"]) == (
+        EU_ID,
+        8.0,
+        True,
+    )
+
+
+def test_streamed_linked_verdict_completes_the_batch():
+    parser = VerdictStreamParser([EU_ID], "EU CTIS", {NCT_ID: EU_ID})
+    assert parser.feed(f"{NCT_ID} | 6 | Relevant") == []
+    assert not parser.complete
+    assert [v["trial_id"] for v in parser.feed("\n")] == [EU_ID]
+    assert parser.complete
+
+
+def test_bulk_results_apply_the_stored_aliases():
+    job = {
+        "job_id": "msgbatch_test",
+        "user_request": "request",
+        "query": "query",
+        "submitted_at": "2025-01-01T00:00:00+00:00",
+        "status": "ended",
+        "batches": {
+            "eu-0": {
+                "source": "eu",
+                "trial_ids": [EU_ID],
+                "aliases": {NCT_ID: EU_ID},
+            }
+        },
+        "results": {"eu-0": f"{NCT_ID} | 9 | Exact match."},
+    }
+    output = format_bulk_job(job)
+    assert "1 scored 5/10 or higher" in output
+    assert EU_ID in output
+
+
+def test_parse_verdict_lines_in_the_requested_format():
+    text = "\n".join(
+        [
+            "Here are the verdicts:",
+            f"**{EU_ID}** | 7.5 | Phase 3, completed | with results.",
+            "`NCT10000002` | score 3 | Different condition.",
+            "NCT10000003 | 14 | Exact match.",
+            "NCT10000004 | 9 | Not in this batch.",
+            "NCT10000005 | high | No numeric score.",
+        ]
+    )
+    trial_ids = [EU_ID, "NCT10000002", "NCT10000003", "NCT10000005"]
+    verdicts = {v["trial_id"]: v for v in parse_verdicts(text, trial_ids, "both")}
+    assert set(verdicts) == {EU_ID, "NCT10000002", "NCT10000003"}
+    assert verdicts[EU_ID]["score"] == 7.5
+    assert verdicts[EU_ID]["reason"] == "Phase 3, completed | with results."
+    assert verdicts[EU_ID]["source"] == "both"
+    assert not verdicts["NCT10000002"]["relevant"]
+    # scores are clamped to the 0-10 scale
+    assert verdicts["NCT10000003"]["score"] == 10.0
+
+
+def test_stream_parser_handles_split_lines_and_repeats():
+    parser = VerdictStreamParser(["NCT10000001", "NCT10000002"])
+    assert parser.feed("NCT1000") == []
+    assert [v["trial_id"] for v in parser.feed("0001 | 6 | Good\nNCT10000001 | 2")] == [
+        "NCT10000001"
+    ]
+    # a repeated verdict does not replace the first one
+    assert parser.feed(" | Changed mind\nNCT10000002 | 5 | Fine") == []
+    assert parser.verdicts["NCT10000001"]["score"] == 6.0
+    assert not parser.complete
+    assert [v["trial_id"] for v in parser.close()] == ["NCT10000002"]
+    assert parser.complete
+
+
+def test_merge_keeps_the_best_score_and_ranks():
+    verdicts = [
+        {"trial_id": "NCT10000002", "score": 4.0, "relevant": False, "reason": "a"},
+        {"trial_id": "NCT10000001", "score": 6.0, "relevant": True, "reason": "b"},
+        {"trial_id": "NCT10000002", "score": 8.0, "relevant": True, "reason": "c"},
+    ]
+    ranked = merge_verdicts(verdicts)
+    assert [(v["trial_id"], v["reason"]) for v in ranked] == [
+        ("NCT10000002", "c"),
+        ("NCT10000001", "b"),
+    ]
+    table = format_ranking_table(ranked, top_n=1)
+    assert "| 1 | NCT10000002 |" in table and "NCT10000001" not in table
+    irrelevant = [dict(v, relevant=False) for v in ranked]
+    assert format_ranking_table(irrelevant) == "No relevant trials were found.\n"
@@ -0,0 +1,51 @@
+import sqlite3
+
+import pytest
+
+import mirror_
+import synthetic_
+import watchlist_
+
+
+@pytest.fixture
+def stores(tmp_path, registries, monkeypatch):
+    mirror = str(tmp_path / "mirror.db")
+    monkeypatch.setattr(mirror_, "CTIS_MIRROR_FILE", mirror)
+    monkeypatch.setattr(watchlist_, "CTIS_MIRROR_FILE", mirror)
+    mirror_.sync_mirror(mirror)
+    assert mirror_.mirror_fresh()
+    return {"mirror": mirror, "watchlist": str(tmp_path / "watchlist.db")}
+
+
+def test_eu_changes_are_caught_while_the_mirror_lags(stores, registries):
+    ct_number = synthetic_.eu_trial_id(50)
+    watchlist_.add_trials([ct_number], stores["watchlist"])
+    assert watchlist_.check_watchlist(path=stores["watchlist"])["baselines"] == [
+        ct_number
+    ]
+    registries.update_ctis_trial(
+        50, ctStatus="Ongoing, recruiting", lastUpdated="2025-01-15"
+    )
+    # the mirror has not synced the change, but CTIS is asked for the date
+    result = watchlist_.check_watchlist(path=stores["watchlist"])
+    assert result["skipped"] == 0
+    assert [change["trial_id"] for change in result["changes"]] == [ct_number]
+    assert watchlist_.check_watchlist(path=stores["watchlist"])["skipped"] == 1
+
+
+def test_a_moved_mirror_date_short_circuits_the_ctis_lookup(stores, monkeypatch):
+    ct_number = synthetic_.eu_trial_id(50)
+    watchlist_.add_trials([ct_number], stores["watchlist"])
+    watchlist_.check_watchlist(path=stores["watchlist"])
+    connection = sqlite3.connect(stores["mirror"])
+    with connection:
+        connection.execute(
+            "UPDATE trials SET last_updated = '2025-01-15' WHERE ct_number = ?",
+            (ct_number,),
+        )
+    connection.close()
+    asked = []
+    monkeypatch.setattr(watchlist_, "ctis_marker", asked.append)
+    result = watchlist_.check_watchlist(path=stores["watchlist"])
+    assert asked == []
+    assert result["skipped"] == 0
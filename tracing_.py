@@ -0,0 +1,252 @@
+from contextlib import contextmanager
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+##############################################################################
+# per-stage spans (trace = one tool call; spans nest through asyncio tasks
+# and asyncio.to_thread because both copy the current context)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_lock = threading.Lock()
+EXPORTERS: List[Any] = []
+
+
+def add_exporter(exporter) -> None:
+    EXPORTERS.append(exporter)
+
+
+def current_span() -> Optional[Dict[str, Any]]:
+    return _current_span.get()
+
+
+def set_attributes(**attributes) -> None:
+    record = _current_span.get()
+    if record is not None:
+        record["attributes"].update(attributes)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    parent = _current_span.get()
+    record = {
+        "name": name,
+        "trace_id": parent["trace_id"] if parent else secrets.token_hex(16),
+        "span_id": secrets.token_hex(8),
+        "parent_id": parent["span_id"] if parent else None,
+        "start_ns": time.time_ns(),
+        "end_ns": None,
+        "duration_ms": None,
+        "attributes": dict(attributes),
+        "status": "ok",
+        "_trace": parent["_trace"] if parent else [],
+    }
+    token = _current_span.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["status"] = "error"
+        record["attributes"]["error"] = str(e) or type(e).__name__
+        raise
+    finally:
+        record["duration_ms"] = (time.perf_counter() - started) * 1000
+        record["end_ns"] = record["start_ns"] + int(record["duration_ms"] * 1e6)
+        _current_span.reset(token)
+        finished = {k: v for k, v in record.items() if k != "_trace"}
+        with _lock:
+            record["_trace"].append(finished)
+            trace = list(record["_trace"]) if parent is None else None
+        if trace is not None:
+            export(trace)
+
+
+def traced(name: str):
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+
+        else:
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with span(name):
+                    return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def export(trace: List[Dict[str, Any]]) -> None:
+    for exporter in EXPORTERS:
+        try:
+            exporter.export(trace)
+        except Exception as e:
+            logger.warning("trace exporter %s failed: %s", type(exporter).__name__, e)
+
+
+##############################################################################
+# exporters
+
+
+class RingBufferExporter:
+    def __init__(self, capacity: int = 50):
+        self.traces = deque(maxlen=capacity)
+
+    def export(self, trace: List[Dict[str, Any]]) -> None:
+        self.traces.append(trace)
+
+    def recent(self, n: int = 5, name: Optional[str] = None) -> List[List[Dict]]:
+        traces = [t for t in self.traces if not name or t[-1]["name"] == name]
+        return traces[-n:] if n > 0 else []
+
+
+class LogFileExporter:
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, trace: List[Dict[str, Any]]) -> None:
+        with _lock, open(self.path, "a", encoding="utf-8") as f:
+            for record in trace:
+                f.write(json.dumps(record, default=str) + "\n")
+
+
+def otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(trace: List[Dict[str, Any]], service_name: str) -> Dict[str, Any]:
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": otlp_value(service_name)}
+                    ]
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "clinical-trials-mcp"},
+                        "spans": [
+                            {
+                                "traceId": record["trace_id"],
+                                "spanId": record["span_id"],
+                                **(
+                                    {"parentSpanId": record["parent_id"]}
+                                    if record["parent_id"]
+                                    else {}
+                                ),
+                                "name": record["name"],
+                                "kind": 1,
+                                "startTimeUnixNano": str(record["start_ns"]),
+                                "endTimeUnixNano": str(record["end_ns"]),
+                                "attributes": [
+                                    {"key": k, "value": otlp_value(v)}
+                                    for k, v in record["attributes"].items()
+                                ],
+                                "status": {
+                                    "code": 2 if record["status"] == "error" else 1
+                                },
+                            }
+                            for record in trace
+                        ],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+class OTLPExporter:
+    """OTLP/JSON over HTTP, accepted by OpenTelemetry collectors at /v1/traces."""
+
+    def __init__(self, endpoint: str, service_name: str = "clinical-trials-mcp"):
+        endpoint = endpoint.rstrip("/")
+        if not endpoint.endswith("/v1/traces"):
+            endpoint += "/v1/traces"
+        self.endpoint = endpoint
+        self.service_name = service_name
+
+    def export(self, trace: List[Dict[str, Any]]) -> None:
+        threading.Thread(
+            target=self._post, args=(to_otlp(trace, self.service_name),), daemon=True
+        ).start()
+
+    def _post(self, body: Dict[str, Any]) -> None:
+        import requests
+
+        try:
+            requests.post(self.endpoint, json=body, timeout=5).raise_for_status()
+        except Exception as e:
+            logger.warning("OTLP export to %s failed: %s", self.endpoint, e)
+
+
+ring_buffer = RingBufferExporter(int(os.getenv("TRACE_BUFFER_SIZE", "50")))
+add_exporter(ring_buffer)
+if os.getenv("TRACE_LOG_FILE"):
+    add_exporter(LogFileExporter(os.environ["TRACE_LOG_FILE"]))
+if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+    add_exporter(OTLPExporter(os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"]))
+
+
+##############################################################################
+# latency breakdown
+
+
+def covered_ms(records: List[Dict[str, Any]]) -> float:
+    intervals = sorted((r["start_ns"], r["end_ns"]) for r in records)
+    total, current_start, current_end = 0, None, None
+    for start, end in intervals:
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total / 1e6
+
+
+def format_trace_breakdown(trace: List[Dict[str, Any]]) -> str:
+    root = trace[-1]
+    started = datetime.fromtimestamp(root["start_ns"] / 1e9, timezone.utc)
+    attributes = ", ".join(f"{k}={v}" for k, v in root["attributes"].items())
+    result = f"### {root['name']} at {started.strftime('%Y-%m-%d %H:%M:%S')} UTC: {root['duration_ms'] / 1000:.2f} s"
+    result += f" ({root['status']})\n\n" if root["status"] != "ok" else "\n\n"
+    if attributes:
+        result += f"{attributes}\n\n"
+    stages: Dict[str, List[Dict[str, Any]]] = {}
+    for record in trace[:-1]:
+        stages.setdefault(record["name"], []).append(record)
+    if not stages:
+        return result
+    result += "| Stage | Calls | Wall (ms) | Sum (ms) | Max (ms) | Errors |\n"
+    result += "|---|---|---|---|---|---|\n"
+    for name, records in sorted(stages.items(), key=lambda s: s[1][0]["start_ns"]):
+        durations = [r["duration_ms"] for r in records]
+        errors = sum(1 for r in records if r["status"] == "error")
+        result += f"| {name} | {len(records)} | {covered_ms(records):.1f} | {sum(durations):.1f} | {max(durations):.1f} | {errors} |\n"
+    return result + "\n"
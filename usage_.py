@@ -0,0 +1,232 @@
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+##############################################################################
+# token and cost accounting
+
+# USD per million tokens: (input, output, cache write, cache read)
+MODEL_PRICES = {
+    "claude-3-5-haiku-20241022": (0.80, 4.00, 1.00, 0.08),
+    "claude-3-haiku-20240307": (0.25, 1.25, 0.30, 0.03),
+    "claude-3-5-sonnet-20241022": (3.00, 15.00, 3.75, 0.30),
+    "claude-3-7-sonnet-20250219": (3.00, 15.00, 3.75, 0.30),
+    "claude-sonnet-4-20250514": (3.00, 15.00, 3.75, 0.30),
+}
+BATCH_DISCOUNT = 0.5
+
+USAGE_HISTORY_SIZE = int(os.getenv("USAGE_HISTORY_SIZE", "500"))
+USAGE_LOG_FILE = os.getenv("USAGE_LOG_FILE")
+
+_current_ledger = contextvars.ContextVar("current_ledger", default=None)
+history = deque(maxlen=USAGE_HISTORY_SIZE)
+
+
+def load_history() -> None:
+    if not USAGE_LOG_FILE or not os.path.exists(USAGE_LOG_FILE):
+        return
+    try:
+        with open(USAGE_LOG_FILE, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    history.append(json.loads(line))
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning("could not load usage history from %s: %s", USAGE_LOG_FILE, e)
+
+
+def estimate_cost(
+    model: str,
+    input_tokens: int,
+    output_tokens: int,
+    cache_creation_input_tokens: int = 0,
+    cache_read_input_tokens: int = 0,
+    batch: bool = False,
+) -> Optional[float]:
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    input_price, output_price, cache_write_price, cache_read_price = prices
+    cost = (
+        input_tokens * input_price
+        + output_tokens * output_price
+        + cache_creation_input_tokens * cache_write_price
+        + cache_read_input_tokens * cache_read_price
+    ) / 1e6
+    return cost * BATCH_DISCOUNT if batch else cost
+
+
+def record_usage(
+    model: str,
+    input_tokens: int,
+    output_tokens: int,
+    cache_creation_input_tokens: int = 0,
+    cache_read_input_tokens: int = 0,
+    source: Optional[str] = None,
+    batch: bool = False,
+    estimated: bool = False,
+) -> Dict[str, Any]:
+    call = {
+        "model": model,
+        "source": source,
+        "input_tokens": input_tokens or 0,
+        "output_tokens": output_tokens or 0,
+        "cache_creation_input_tokens": cache_creation_input_tokens or 0,
+        "cache_read_input_tokens": cache_read_input_tokens or 0,
+        "batch": batch,
+        "estimated": estimated,
+    }
+    call["cost"] = estimate_cost(
+        model,
+        call["input_tokens"],
+        call["output_tokens"],
+        call["cache_creation_input_tokens"],
+        call["cache_read_input_tokens"],
+        batch,
+    )
+    ledger = _current_ledger.get()
+    if ledger is not None:
+        ledger["calls"].append(call)
+    return call
+
+
+def current_ledger() -> Optional[Dict[str, Any]]:
+    return _current_ledger.get()
+
+
+def store_ledger(ledger: Dict[str, Any]) -> None:
+    history.append(ledger)
+    if USAGE_LOG_FILE:
+        try:
+            with open(USAGE_LOG_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(ledger) + "\n")
+        except OSError as e:
+            logger.warning("could not append to %s: %s", USAGE_LOG_FILE, e)
+
+
+def metered(tool: str):
+    def decorator(func):
+        def open_ledger():
+            ledger = {
+                "tool": tool,
+                "started_at": datetime.now(timezone.utc).isoformat(),
+                "calls": [],
+            }
+            return ledger, _current_ledger.set(ledger)
+
+        def close_ledger(ledger, token):
+            _current_ledger.reset(token)
+            if ledger["calls"]:
+                store_ledger(ledger)
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                ledger, token = open_ledger()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    close_ledger(ledger, token)
+
+        else:
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                ledger, token = open_ledger()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    close_ledger(ledger, token)
+
+        return wrapper
+
+    return decorator
+
+
+load_history()
+
+
+##############################################################################
+# aggregation and reporting
+
+TOKEN_FIELDS = [
+    "input_tokens",
+    "output_tokens",
+    "cache_creation_input_tokens",
+    "cache_read_input_tokens",
+]
+
+
+def summarize_calls(calls: List[Dict[str, Any]]) -> Dict[str, Any]:
+    summary = {field: sum(c[field] for c in calls) for field in TOKEN_FIELDS}
+    summary["calls"] = len(calls)
+    summary["cost"] = sum(c["cost"] or 0.0 for c in calls)
+    summary["unpriced_calls"] = sum(1 for c in calls if c["cost"] is None)
+    summary["estimated_calls"] = sum(1 for c in calls if c["estimated"])
+    return summary
+
+
+def aggregate_usage(
+    ledgers: List[Dict[str, Any]], key: str
+) -> Dict[str, Dict[str, Any]]:
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for ledger in ledgers:
+        for call in ledger["calls"]:
+            value = ledger["tool"] if key == "tool" else call.get(key)
+            groups.setdefault(value or "N/A", []).append(call)
+    return {value: summarize_calls(calls) for value, calls in groups.items()}
+
+
+def format_usage_row(label: str, summary: Dict[str, Any]) -> str:
+    return (
+        f"| {label} | {summary['calls']} | {summary['input_tokens']:,} | {summary['output_tokens']:,} "
+        f"| {summary['cache_read_input_tokens']:,} / {summary['cache_creation_input_tokens']:,} | ${summary['cost']:.4f} |\n"
+    )
+
+
+USAGE_TABLE_HEADER = (
+    "| | LLM calls | Input tokens | Output tokens | Cached read / write | Est. cost |\n"
+    "|---|---|---|---|---|---|\n"
+)
+
+
+def format_metrics_footer(ledger: Optional[Dict[str, Any]]) -> str:
+    if not ledger or not ledger["calls"]:
+        return "\n---\n**Metrics**: no LLM calls were made.\n"
+    result = "\n---\n**Metrics**\n\n" + USAGE_TABLE_HEADER.replace(
+        "| |", "| Source |", 1
+    )
+    for source, summary in aggregate_usage([ledger], "source").items():
+        result += format_usage_row(source, summary)
+    total = summarize_calls(ledger["calls"])
+    if len({c["source"] for c in ledger["calls"]}) > 1:
+        result += format_usage_row("**Total**", total)
+    if total["estimated_calls"]:
+        result += f"\n*Output tokens of {total['estimated_calls']} calls stopped early are estimated from the streamed text.*\n"
+    if total["unpriced_calls"]:
+        result += f"\n*{total['unpriced_calls']} calls used a model without a known price and are not included in the cost.*\n"
+    return result
+
+
+def format_usage_report(ledgers: List[Dict[str, Any]]) -> str:
+    if not ledgers:
+        return "No LLM usage has been recorded yet."
+    calls = [call for ledger in ledgers for call in ledger["calls"]]
+    total = summarize_calls(calls)
+    result = f"# LLM usage over the last {len(ledgers)} tool calls (since {ledgers[0]['started_at']})\n\n"
+    result += f"Total: {total['calls']} LLM calls, {total['input_tokens']:,} input and {total['output_tokens']:,} output tokens, estimated ${total['cost']:.4f} "
+    result += f"(${total['cost'] / len(ledgers):.4f} per tool call).\n"
+    for key, title in (("tool", "Tool"), ("source", "Source"), ("model", "Model")):
+        result += f"\n## By {title.lower()}\n\n"
+        result += USAGE_TABLE_HEADER.replace("| |", f"| {title} |", 1)
+        for value, summary in sorted(aggregate_usage(ledgers, key).items()):
+            result += format_usage_row(value, summary)
+    return result
@@ -0,0 +1,122 @@
+from typing import Dict, Any, List, Optional
+import re
+
+##############################################################################
+# per-trial relevance verdicts
+
+TRIAL_ID_PATTERN = re.compile(r"NCT\d{8}|\d{4}-\d{6}-\d{2}-\d{2}")
+SCORE_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+RELEVANCE_THRESHOLD = 5
+SOURCE_NAMES = {"eu": "EU CTIS", "ctgov": "ClinicalTrials.gov"}
+
+VERDICT_FORMAT_INSTRUCTIONS = """Answer with exactly one line per trial and nothing else, in this format:
+            <Trial ID> | <relevance score from 0 (unrelated) to 10 (exactly what the user needs)> | <one short sentence explaining why>"""
+
+
+def parse_verdict_line(
+    line: str,
+    trial_ids: Optional[List[str]] = None,
+    aliases: Optional[Dict[str, str]] = None,
+) -> Optional[Dict[str, Any]]:
+    parts = [part.strip() for part in line.split("|")]
+    if len(parts) < 3:
+        return None
+    match = TRIAL_ID_PATTERN.search(parts[0].replace("*", "").replace("`", ""))
+    if not match:
+        return None
+    trial_id = (aliases or {}).get(match.group(0), match.group(0))
+    if trial_ids and trial_id not in trial_ids:
+        return None
+    score_match = SCORE_PATTERN.search(parts[1])
+    if not score_match:
+        return None
+    score = min(max(float(score_match.group(0)), 0.0), 10.0)
+    return {
+        "trial_id": trial_id,
+        "score": score,
+        "relevant": score >= RELEVANCE_THRESHOLD,
+        "reason": " | ".join(parts[2:]).strip(),
+    }
+
+
+class VerdictStreamParser:
+    def __init__(
+        self,
+        trial_ids: List[str],
+        source: Optional[str] = None,
+        aliases: Optional[Dict[str, str]] = None,
+    ):
+        self.trial_ids = list(trial_ids)
+        self.source = source
+        self.aliases = aliases or {}
+        self.verdicts: Dict[str, Dict[str, Any]] = {}
+        self.buffer = ""
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.trial_ids) and all(
+            tid in self.verdicts for tid in self.trial_ids
+        )
+
+    def _parse(self, line: str) -> Optional[Dict[str, Any]]:
+        verdict = parse_verdict_line(line, self.trial_ids, self.aliases)
+        if verdict is None or verdict["trial_id"] in self.verdicts:
+            return None
+        verdict["source"] = self.source
+        self.verdicts[verdict["trial_id"]] = verdict
+        return verdict
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split("\n")
+        return [v for v in (self._parse(line) for line in lines) if v]
+
+    def close(self) -> List[Dict[str, Any]]:
+        line, self.buffer = self.buffer, ""
+        verdict = self._parse(line)
+        return [verdict] if verdict else []
+
+
+def parse_verdicts(
+    text: str,
+    trial_ids: List[str],
+    source: Optional[str] = None,
+    aliases: Optional[Dict[str, str]] = None,
+) -> List[Dict[str, Any]]:
+    parser = VerdictStreamParser(trial_ids, source, aliases)
+    return parser.feed(text) + parser.close()
+
+
+def linked_aliases(
+    linked_ids: Dict[str, List[str]], trial_ids: Optional[List[str]] = None
+) -> Dict[str, str]:
+    """Linked ID -> the ID its trial was analyzed under, so a verdict naming a
+    merged trial by its other registry's ID is kept."""
+    return {
+        linked: kept
+        for kept, ids in linked_ids.items()
+        if trial_ids is None or kept in trial_ids
+        for linked in ids
+    }
+
+
+def merge_verdicts(verdicts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    merged: Dict[str, Dict[str, Any]] = {}
+    for verdict in verdicts:
+        current = merged.get(verdict["trial_id"])
+        if current is None or verdict["score"] > current["score"]:
+            merged[verdict["trial_id"]] = verdict
+    return sorted(merged.values(), key=lambda v: (-v["score"], v["trial_id"]))
+
+
+def format_ranking_table(ranked: List[Dict[str, Any]], top_n: int = 10) -> str:
+    relevant = [v for v in ranked if v["relevant"]][:top_n]
+    if not relevant:
+        return "No relevant trials were found.\n"
+    result = "| Rank | Trial ID | Source | Score | Why it is relevant |\n"
+    result += "|---|---|---|---|---|\n"
+    for rank, verdict in enumerate(relevant, 1):
+        reason = verdict["reason"].replace("|", "/").replace("\n", " ")
+        trial_id = " / ".join([verdict["trial_id"], *verdict.get("linked_ids", [])])
+        result += f"| {rank} | {trial_id} | {verdict.get('source') or 'N/A'} | {verdict['score']:g} | {reason} |\n"
+    return result
@@ -0,0 +1,409 @@
+from parsers_ import (
+    CTGOV_DETAIL_SECTIONS,
+    CTGOV_SECTION_SOURCES,
+    extract_cro_data,
+    safe_extract,
+)
+from registries_ import (
+    ctgov_last_updates,
+    ctgov_study_if_changed,
+    ctis_last_updated,
+    ctis_retrieve_if_changed,
+)
+from mirror_ import CTIS_MIRROR_FILE, mirror_fresh, pack, unpack
+from linking_ import NCT_PATTERN, EU_ID_PATTERN
+from tracing_ import span, set_attributes
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+import argparse
+import difflib
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+##############################################################################
+# trial watchlist: one cheap request per 500 ClinicalTrials.gov trials (only
+# the lastUpdatePostDate field) and the CTIS lastUpdated date tell which
+# trials changed; only those are refetched with conditional requests, only
+# sections whose source modules changed are rebuilt, and the rendered
+# sections are diffed against the stored snapshot
+
+WATCHLIST_FILE = os.getenv("WATCHLIST_FILE", "watchlist.db")
+WATCHLIST_WORKERS = int(os.getenv("WATCHLIST_WORKERS", "8"))
+MAX_DIFF_LINES = 40
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS watched (
+    trial_id TEXT PRIMARY KEY,
+    source TEXT,
+    marker TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    hashes BLOB,
+    sections BLOB,
+    added_at TEXT,
+    checked_at TEXT,
+    changed_at TEXT
+);
+"""
+
+
+def connect(path: Optional[str] = None) -> sqlite3.Connection:
+    connection = sqlite3.connect(path or WATCHLIST_FILE, timeout=30)
+    connection.executescript(SCHEMA)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def trial_source(trial_id: str) -> Optional[str]:
+    if NCT_PATTERN.fullmatch(trial_id):
+        return "ctgov"
+    if EU_ID_PATTERN.fullmatch(trial_id):
+        return "eu"
+    return None
+
+
+##############################################################################
+# watchlist membership
+
+
+def add_trials(trial_ids: List[str], path: Optional[str] = None) -> Dict[str, List]:
+    added, invalid = [], []
+    connection = connect(path)
+    try:
+        with connection:
+            for trial_id in trial_ids:
+                source = trial_source(trial_id)
+                if source is None:
+                    invalid.append(trial_id)
+                    continue
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO watched (trial_id, source, added_at) VALUES (?, ?, ?)",
+                    (trial_id, source, now()),
+                )
+                if cursor.rowcount:
+                    added.append(trial_id)
+    finally:
+        connection.close()
+    return {"added": added, "invalid": invalid}
+
+
+def remove_trials(trial_ids: List[str], path: Optional[str] = None) -> List[str]:
+    connection = connect(path)
+    try:
+        with connection:
+            return [
+                trial_id
+                for trial_id in trial_ids
+                if connection.execute(
+                    "DELETE FROM watched WHERE trial_id = ?", (trial_id,)
+                ).rowcount
+            ]
+    finally:
+        connection.close()
+
+
+def list_trials(path: Optional[str] = None) -> List[Dict[str, Any]]:
+    connection = connect(path)
+    try:
+        return [
+            dict(row)
+            for row in connection.execute(
+                "SELECT trial_id, source, marker, added_at, checked_at, changed_at "
+                "FROM watched ORDER BY trial_id"
+            )
+        ]
+    finally:
+        connection.close()
+
+
+##############################################################################
+# sections
+
+
+def digest(value: Any) -> str:
+    text = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def section_name(builder) -> str:
+    return builder.__name__.replace("ctgov_", "").replace("_section", "")
+
+
+def ctgov_sections(
+    study: Dict[str, Any], hashes: Dict[str, str], sections: Dict[str, str]
+) -> Tuple[Dict[str, str], Dict[str, str]]:
+    new_hashes, new_sections, rebuilt = {}, {}, 0
+    for _, builder in CTGOV_DETAIL_SECTIONS:
+        name = section_name(builder)
+        new_hashes[name] = digest(
+            [safe_extract(study, *path) for path in CTGOV_SECTION_SOURCES[builder]]
+        )
+        if new_hashes[name] == hashes.get(name) and name in sections:
+            new_sections[name] = sections[name]
+            continue
+        section = builder(study)
+        new_sections[name] = (
+            section["header"] + "".join(section["blocks"]) if section else ""
+        )
+        rebuilt += 1
+    set_attributes(sections_rebuilt=rebuilt)
+    return new_hashes, new_sections
+
+
+def ctis_sections(data: Dict[str, Any]) -> Tuple[Dict[str, str], Dict[str, str]]:
+    extracted = extract_cro_data(data)
+    sections = {
+        name: json.dumps(value, indent=1, sort_keys=True, default=str)
+        for name, value in extracted.items()
+        if name != "summary"
+    }
+    return {name: digest(text) for name, text in sections.items()}, sections
+
+
+def section_diffs(
+    old: Dict[str, str], new: Dict[str, str], max_lines: int = MAX_DIFF_LINES
+) -> List[Dict[str, Any]]:
+    diffs = []
+    for name in new.keys() | old.keys():
+        before, after = old.get(name, ""), new.get(name, "")
+        if before == after:
+            continue
+        lines = list(
+            difflib.unified_diff(
+                before.splitlines(), after.splitlines(), lineterm="", n=1
+            )
+        )[2:]
+        diffs.append(
+            {
+                "section": name,
+                "kind": (
+                    "added" if not before else "removed" if not after else "changed"
+                ),
+                "lines": lines[:max_lines],
+                "more_lines": max(len(lines) - max_lines, 0),
+            }
+        )
+    return sorted(diffs, key=lambda d: d["section"])
+
+
+##############################################################################
+# polling
+
+
+def current_markers(rows: List[sqlite3.Row], pool: ThreadPoolExecutor) -> Dict:
+    """The registries' last-update date of each watched trial; missing when unknown."""
+    markers = {}
+    nct_ids = [row["trial_id"] for row in rows if row["source"] == "ctgov"]
+    if nct_ids:
+        with span("watchlist.ctgov_markers", trials=len(nct_ids)):
+            markers.update(ctgov_last_updates(nct_ids))
+    eu_rows = {row["trial_id"]: row for row in rows if row["source"] == "eu"}
+    if eu_rows and mirror_fresh():
+        # the mirror can only prove a change (its date moved past the one last
+        # seen); an unchanged date there may just mean the mirror lags CTIS
+        mirror = sqlite3.connect(CTIS_MIRROR_FILE, timeout=30)
+        try:
+            mirrored = mirror.execute(
+                f"SELECT ct_number, last_updated FROM trials WHERE ct_number IN ({','.join('?' * len(eu_rows))})",
+                list(eu_rows),
+            ).fetchall()
+        finally:
+            mirror.close()
+        markers.update(
+            (ct_number, marker)
+            for ct_number, marker in mirrored
+            if marker and marker > (eu_rows[ct_number]["marker"] or "")
+        )
+    eu_ids = [ct_number for ct_number in eu_rows if ct_number not in markers]
+    if eu_ids:
+        with span("watchlist.ctis_markers", trials=len(eu_ids)):
+            for ct_number, marker in zip(eu_ids, pool.map(ctis_marker, eu_ids)):
+                if marker:
+                    markers[ct_number] = marker
+    return markers
+
+
+def ctis_marker(ct_number: str) -> Optional[str]:
+    try:
+        return ctis_last_updated(ct_number)
+    except Exception as e:
+        logger.warning("could not check %s: %s", ct_number, e)
+        return None
+
+
+def refresh_trial(
+    row: sqlite3.Row, marker: Optional[str], max_diff_lines: int = MAX_DIFF_LINES
+) -> Dict[str, Any]:
+    trial_id = row["trial_id"]
+    fetch = (
+        ctgov_study_if_changed if row["source"] == "ctgov" else ctis_retrieve_if_changed
+    )
+    with span("watchlist.refresh", trial_id=trial_id):
+        body, validators = fetch(trial_id, row["etag"], row["last_modified"])
+        update = {
+            "trial_id": trial_id,
+            "marker": marker,
+            "etag": validators["etag"] or row["etag"],
+            "last_modified": validators["last_modified"] or row["last_modified"],
+        }
+        if body is None:
+            return dict(update, status="not_modified")
+        old_hashes = unpack(row["hashes"]) if row["hashes"] else {}
+        old_sections = unpack(row["sections"]) if row["sections"] else {}
+        if row["source"] == "ctgov":
+            hashes, sections = ctgov_sections(
+                json.loads(body), old_hashes, old_sections
+            )
+        else:
+            hashes, sections = ctis_sections(json.loads(body))
+        update.update(hashes=hashes, sections=sections)
+        if not row["sections"]:
+            return dict(update, status="baseline")
+        diffs = section_diffs(old_sections, sections, max_diff_lines)
+        return dict(update, status="changed" if diffs else "unchanged", diffs=diffs)
+
+
+def check_watchlist(
+    trial_ids: Optional[List[str]] = None,
+    max_diff_lines: int = MAX_DIFF_LINES,
+    path: Optional[str] = None,
+) -> Dict[str, Any]:
+    connection = connect(path)
+    try:
+        rows = connection.execute("SELECT * FROM watched ORDER BY trial_id").fetchall()
+        if trial_ids:
+            rows = [row for row in rows if row["trial_id"] in set(trial_ids)]
+        checked_at = now()
+        result = {"checked": len(rows), "skipped": 0, "not_modified": 0}
+        result.update(changes=[], baselines=[], errors={})
+        with ThreadPoolExecutor(WATCHLIST_WORKERS) as pool:
+            markers = current_markers(rows, pool)
+            # a trial is refetched when its date moved, is unknown, or it has no snapshot
+            stale = [
+                row
+                for row in rows
+                if not row["sections"]
+                or markers.get(row["trial_id"]) is None
+                or markers[row["trial_id"]] != row["marker"]
+            ]
+            result["skipped"] = len(rows) - len(stale)
+            futures = [
+                (
+                    row,
+                    pool.submit(
+                        refresh_trial, row, markers.get(row["trial_id"]), max_diff_lines
+                    ),
+                )
+                for row in stale
+            ]
+            updates = []
+            for row, future in futures:
+                try:
+                    updates.append(future.result())
+                except Exception as e:
+                    result["errors"][row["trial_id"]] = str(e)
+        with connection:
+            connection.execute(
+                f"UPDATE watched SET checked_at = ? WHERE trial_id IN ({','.join('?' * len(rows))})",
+                [checked_at] + [row["trial_id"] for row in rows],
+            )
+            for update in updates:
+                status = update["status"]
+                if status == "not_modified":
+                    result["not_modified"] += 1
+                elif status == "baseline":
+                    result["baselines"].append(update["trial_id"])
+                elif status == "changed":
+                    result["changes"].append(update)
+                if "sections" in update:
+                    connection.execute(
+                        "UPDATE watched SET hashes = ?, sections = ? WHERE trial_id = ?",
+                        (
+                            pack(update["hashes"]),
+                            pack(update["sections"]),
+                            update["trial_id"],
+                        ),
+                    )
+                connection.execute(
+                    "UPDATE watched SET marker = ?, etag = ?, last_modified = ?, "
+                    "changed_at = CASE WHEN ? THEN ? ELSE changed_at END WHERE trial_id = ?",
+                    (
+                        update["marker"],
+                        update["etag"],
+                        update["last_modified"],
+                        status == "changed",
+                        checked_at,
+                        update["trial_id"],
+                    ),
+                )
+    finally:
+        connection.close()
+    set_attributes(
+        checked=result["checked"],
+        skipped=result["skipped"],
+        changed=len(result["changes"]),
+    )
+    return result
+
+
+def format_check(result: Dict[str, Any]) -> str:
+    out = f"# Watchlist check: {len(result['changes'])} of {result['checked']} trials changed\n\n"
+    fetched = result["checked"] - result["skipped"]
+    out += (
+        f"{result['skipped']} skipped by last-update date, {fetched} refetched "
+        f"({result['not_modified']} not modified).\n\n"
+    )
+    for change in result["changes"]:
+        out += f"## {change['trial_id']}"
+        out += f" (updated {change['marker']})\n\n" if change["marker"] else "\n\n"
+        for diff in change["diffs"]:
+            out += (
+                f"### {diff['section'].replace('_', ' ').title()} ({diff['kind']})\n\n"
+            )
+            out += "```diff\n" + "\n".join(diff["lines"]) + "\n"
+            if diff["more_lines"]:
+                out += f"... {diff['more_lines']} more lines\n"
+            out += "```\n\n"
+    if result["baselines"]:
+        out += f"Recorded the first snapshot of {', '.join(result['baselines'])}; changes are reported from the next check.\n"
+    for trial_id, error in result["errors"].items():
+        out += f"*Could not check {trial_id}: {error}*\n"
+    return out
+
+
+def format_watchlist(trials: List[Dict[str, Any]]) -> str:
+    if not trials:
+        return "The watchlist is empty.\n"
+    out = f"# Watchlist ({len(trials)} trials)\n\n| Trial | Last update | Last checked | Last change |\n|---|---|---|---|\n"
+    for trial in trials:
+        out += (
+            f"| {trial['trial_id']} | {trial['marker'] or '-'} | {trial['checked_at'] or 'never'} "
+            f"| {trial['changed_at'] or '-'} |\n"
+        )
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trial watchlist.")
+    parser.add_argument("command", choices=["add", "remove", "list", "check"])
+    parser.add_argument("trial_ids", nargs="*")
+    parser.add_argument("--file", default=WATCHLIST_FILE)
+    args = parser.parse_args()
+    if args.command == "add":
+        print(json.dumps(add_trials(args.trial_ids, args.file)))
+    elif args.command == "remove":
+        print(json.dumps({"removed": remove_trials(args.trial_ids, args.file)}))
+    elif args.command == "list":
+        print(format_watchlist(list_trials(args.file)))
+    else:
+        print(format_check(check_watchlist(args.trial_ids or None, path=args.file)))